@@ -0,0 +1,199 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ICG_metrics import failure_category
+from ICG_pipeline import (Runtime, generate_chart, make_llm, make_metrics, make_render_cache, make_response_cache,
+                          make_worker_pool)
+
+# Génération des graphiques sans interface, pour une liste de fichiers et de demandes :
+#   python ICG_batch.py manifeste.jsonl --out rapports/ --jobs 8 --render-workers 4
+#
+# Manifeste JSONL, une tâche par ligne ("id", "sheet" et "modifications" sont facultatifs) :
+#   {"id": "capteur_01", "data": "mesures/capteur_01.csv", "prompt": "Trace la température en fonction du temps",
+#    "modifications": ["Mets le titre en gras"]}
+# ou CSV avec les colonnes data, prompt (et id, sheet facultatives).
+# Les chemins relatifs des fichiers de données sont résolus depuis le dossier du manifeste.
+
+DEFAULT_CONFIG = os.path.join(".streamlit", "secrets.toml")
+
+
+#################################### Lecture des entrées ####################################
+def load_settings(path):
+    """Réglages au format de .streamlit/secrets.toml ; OPENAI_API_KEY et OPENAI_BASE_URL peuvent venir de l'environnement"""
+    settings = {}
+    if path and os.path.exists(path):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            settings = tomllib.load(f)
+    for name in ("OPENAI_API_KEY", "OPENAI_BASE_URL"):
+        if os.environ.get(name):
+            settings[name] = os.environ[name]
+    return settings
+
+
+def load_manifest(path):
+    """Liste des tâches du manifeste (JSONL ou CSV), avec un identifiant unique chacune"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            jobs = [dict(row) for row in csv.DictReader(f)]
+        else:
+            jobs = [json.loads(line) for line in f if line.strip()]
+
+    base = os.path.dirname(os.path.abspath(path))
+    seen = set()
+    for i, job in enumerate(jobs, 1):
+        if not job.get("data") or not job.get("prompt"):
+            raise ValueError(f"Tâche {i} du manifeste : 'data' et 'prompt' sont obligatoires")
+        job["data"] = os.path.join(base, job["data"])
+        job["sheet"] = job.get("sheet") or None
+        job["modifications"] = job.get("modifications") or []
+        job_id = job.get("id") or f"{i:04d}_{os.path.splitext(os.path.basename(job['data']))[0]}"
+        if job_id in seen:
+            raise ValueError(f"Identifiant de tâche en double dans le manifeste : {job_id}")
+        seen.add(job_id)
+        job["id"] = job_id
+    return jobs
+
+
+#################################### Exécution d'une tâche ####################################
+def run_job(runtime, llm, job, out_dir, use_cache=True):
+    """
+    Génère le graphique d'une tâche (demande initiale puis modifications éventuelles) et écrit
+    <id>.png et <id>.json (rapport de chaque tour) dans out_dir.
+
+    Returns:
+        dict: Résumé de la tâche (id, success, duration_s, category, llm_calls)
+    """
+    workdir = tempfile.mkdtemp(prefix="gag_batch_")
+    start = time.monotonic()
+    reports = []
+    try:
+        success, chart, code = False, None, None
+        for turn, prompt in enumerate([job["prompt"], *job["modifications"]]):
+            success, turn_chart, report = generate_chart(
+                runtime, llm, prompt, job["data"], turn == 0, code,
+                use_cache=use_cache, workdir=workdir, sheet=job["sheet"]
+            )
+            reports.append({"prompt": prompt, "success": success, **report})
+            if not success:
+                break
+            chart, code = turn_chart, report.get("clean_code")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    duration = time.monotonic() - start
+
+    # Le graphique du dernier tour réussi est conservé, même si une modification a échoué
+    if chart is not None:
+        with open(os.path.join(out_dir, job["id"] + ".png"), "wb") as f:
+            f.write(chart)
+    summary = {
+        "id": job["id"],
+        "success": success,
+        "duration_s": round(duration, 3),
+        "category": None if success else failure_category(reports[-1]),
+        "llm_calls": sum(r.get("llm_calls", 0) for r in reports),
+    }
+    with open(os.path.join(out_dir, job["id"] + ".json"), "w", encoding="utf-8") as f:
+        json.dump({**job, **summary, "turns": reports}, f, ensure_ascii=False, indent=2, default=str)
+    return summary
+
+
+#################################### Statistiques ####################################
+def summarize(results, wall_time):
+    durations = sorted(r["duration_s"] for r in results)
+    failures = {}
+    for r in results:
+        if not r["success"]:
+            failures[r["category"]] = failures.get(r["category"], 0) + 1
+    succeeded = sum(r["success"] for r in results)
+    return {
+        "jobs": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "failures": failures,
+        "wall_time_s": round(wall_time, 3),
+        "charts_per_minute": round(succeeded / wall_time * 60, 2) if wall_time else 0.0,
+        "latency_p50_s": round(statistics.median(durations), 3) if durations else None,
+        "latency_p95_s": round(durations[int(0.95 * (len(durations) - 1))], 3) if durations else None,
+        "llm_calls": sum(r["llm_calls"] for r in results),
+    }
+
+
+def print_summary(stats):
+    print()
+    print(f"Tâches        : {stats['jobs']} ({stats['succeeded']} réussies, {stats['failed']} en échec)")
+    for category, count in sorted(stats["failures"].items(), key=lambda item: -item[1]):
+        print(f"  - {category} : {count}")
+    print(f"Durée totale  : {stats['wall_time_s']:.1f} s")
+    print(f"Débit         : {stats['charts_per_minute']} graphiques/min")
+    if stats["latency_p50_s"] is not None:
+        print(f"Latence       : médiane {stats['latency_p50_s']:.1f} s, p95 {stats['latency_p95_s']:.1f} s")
+    print(f"Appels LLM    : {stats['llm_calls']} (hors réponses en cache)")
+
+
+#################################### Point d'entrée ####################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération des graphiques d'un manifeste, sans interface")
+    parser.add_argument("manifest", help="Fichier JSONL ou CSV des tâches (data, prompt)")
+    parser.add_argument("--out", default="batch_output", help="Dossier des PNG et des rapports JSON")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Réglages au format secrets.toml")
+    parser.add_argument("--jobs", type=int, default=4, help="Tâches en parallèle (threads des appels LLM)")
+    parser.add_argument("--render-workers", type=int, default=None,
+                        help="Processus d'exécution des scripts (EXECUTOR_WORKERS par défaut, 0 = à froid)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignorer le cache des réponses LLM")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.config)
+    try:
+        llm = make_llm(settings)
+    except ValueError as e:
+        print(f"Configuration des modèles invalide : {e}", file=sys.stderr)
+        return 2
+    if llm is None:
+        print(f"OPENAI_API_KEY (ou OPENAI_BASE_URL) absente de {args.config} et de l'environnement", file=sys.stderr)
+        return 2
+    jobs = load_manifest(args.manifest)
+    os.makedirs(args.out, exist_ok=True)
+
+    # Les graphiques écrits sur disque sont le livrable du batch : rendus pleine qualité, pas d'aperçu
+    runtime = Runtime(settings, make_response_cache(settings), make_worker_pool(settings, args.render_workers),
+                      metrics=make_metrics(settings), render_cache=make_render_cache(settings), preview=False)
+    results = []
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+            futures = {executor.submit(run_job, runtime, llm, job, args.out, not args.no_cache): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"id": job["id"], "success": False, "duration_s": 0.0,
+                              "category": "batch", "llm_calls": 0, "error": str(e)}
+                results.append(result)
+                status = "✓" if result["success"] else f"✗ {result['category']}"
+                print(f"[{len(results)}/{len(jobs)}] {status} {result['id']} ({result['duration_s']:.1f} s)", flush=True)
+    finally:
+        if runtime.pool is not None:
+            runtime.pool.close()
+
+    stats = summarize(results, time.monotonic() - start)
+    with open(os.path.join(args.out, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({**stats, "results": sorted(results, key=lambda r: r["id"])}, f, ensure_ascii=False, indent=2)
+    print_summary(stats)
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import ICG_utils
+from ICG_executor import execute_code
+from ICG_pipeline import Runtime, generate_chart_initial, generate_chart_modification, make_worker_pool
+from ICG_utils import cache_dataframe, read_data
+
+# Mesures de performance hors ligne : le LLM est remplacé par un modèle scripté local.
+#   python ICG_bench.py --out bench_results/                       # enregistre une référence
+#   python ICG_bench.py --compare bench_results/<commit>.json      # compare à une référence
+# Le code de sortie vaut 1 si une mesure dépasse la référence de plus de --threshold.
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+SCRIPT_CODE = """import matplotlib.pyplot as plt
+import pandas as pd
+fig, ax = plt.subplots(figsize=(10, 6))
+ax.plot(pd.to_datetime(df['t']), df['x'], label='x')
+ax.set_xlabel('t')
+ax.set_ylabel('x')
+ax.legend()
+plt.savefig('graphique.png')
+plt.close()
+"""
+BROKEN_CODE = SCRIPT_CODE.replace("ax.legend()", "raise ValueError('erreur simulée')")
+TRIVIAL_CODE = "import matplotlib.pyplot as plt\nplt.figure()\nplt.savefig('graphique.png')\nplt.close()\n"
+
+
+#################################### LLM scripté ####################################
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class ScriptedLLM:
+    """
+    Remplaçant déterministe de ChatOpenAI (invoke, ainvoke, stream, astream).
+    La réponse dépend de l'agent, reconnu à son contexte ; chaque appel attend `latency`
+    secondes, réparties sur les morceaux en streaming. Les `failures` premières réponses
+    du codeur et du modificateur contiennent une erreur, pour mesurer le débogage.
+    """
+
+    model_name = "scripted"
+    temperature = 0.0
+
+    def __init__(self, latency=0.0, failures=0, chunk_size=16):
+        self.latency = latency
+        self.failures = failures
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def _answer(self, agent_input):
+        self.calls += 1
+        head = agent_input[:300]
+        if "interpréteur" in head:
+            return '{"type": "courbe", "x": "t", "y": ["x"]}'
+        if "vérificateur" in head:
+            return "CODE CONFORME"
+        if "blocs de remplacement" in agent_input[:600]:
+            # Modificateur en mode patch : seule la ligne du tracé est renvoyée
+            line = "ax.legend()"
+            replacement = "ax.legend(loc='upper left')"
+            if self.failures > 0:
+                self.failures -= 1
+                replacement = "raise ValueError('erreur simulée')"
+            return f"<<<<<<< AVANT\n{line}\n=======\n{replacement}\n>>>>>>> APRÈS\n"
+        code = SCRIPT_CODE
+        if "débogage" not in head and self.failures > 0:
+            self.failures -= 1
+            code = BROKEN_CODE
+        return f"```python\n{code}```\nCe code trace x en fonction de t."
+
+    def _chunks(self, text):
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def invoke(self, input, **kwargs):
+        time.sleep(self.latency)
+        return _Message(self._answer(input))
+
+    async def ainvoke(self, input, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _Message(self._answer(input))
+
+    def stream(self, input, **kwargs):
+        chunks = self._chunks(self._answer(input))
+        for chunk in chunks:
+            time.sleep(self.latency / len(chunks))
+            yield _Message(chunk)
+
+    async def astream(self, input, **kwargs):
+        chunks = self._chunks(self._answer(input))
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield _Message(chunk)
+
+
+#################################### Mesures ####################################
+class StageTimer:
+    """Fonction de progression pour Runtime : mesure la durée de chaque étape des pipelines"""
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextlib.contextmanager
+    def __call__(self, message):
+        # "📖 Lecture du fichier de données..." -> "Lecture du fichier de données"
+        name = " ".join(w for w in message.split() if any(c.isalpha() for c in w)).rstrip(".")
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+
+def _stats(samples):
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "runs": len(samples)}
+
+
+def _forget_metadata():
+    # Mesure à froid : vide les caches mémoire de read_data
+    with ICG_utils._cache_lock:
+        ICG_utils._metadata_cache.clear()
+        ICG_utils._digest_cache.clear()
+
+
+def make_dataset(directory, n_rows):
+    """Fichier CSV synthétique (t, x, y, categorie), réutilisé s'il existe déjà"""
+    path = os.path.join(directory, f"bench_{n_rows}.csv")
+    if not os.path.exists(path):
+        rng = np.random.default_rng(n_rows)
+        pd.DataFrame({
+            "t": pd.date_range("2020-01-01", periods=n_rows, freq="s"),
+            "x": np.cumsum(rng.normal(size=n_rows)),
+            "y": rng.normal(size=n_rows),
+            "categorie": rng.choice(["a", "b", "c"], size=n_rows),
+        }).to_csv(path, index=False)
+    return path
+
+
+def bench_read_data(path, repeat):
+    results = {}
+    samples = {"read_data_cold": [], "read_data_profile_cold": [], "read_data_warm": [], "cache_dataframe_cold": []}
+    cache_dir = tempfile.mkdtemp(prefix="gag_bench_data_")
+    for _ in range(repeat):
+        _forget_metadata()
+        start = time.perf_counter()
+        read_data(path)
+        samples["read_data_cold"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        read_data(path)
+        samples["read_data_warm"].append(time.perf_counter() - start)
+
+        _forget_metadata()
+        start = time.perf_counter()
+        read_data(path, profile=True)
+        samples["read_data_profile_cold"].append(time.perf_counter() - start)
+
+        for name in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, name))
+        start = time.perf_counter()
+        cache_dataframe(path, cache_dir)
+        samples["cache_dataframe_cold"].append(time.perf_counter() - start)
+    for name, values in samples.items():
+        results[name] = _stats(values)
+    return results
+
+
+def bench_execution(runtime, repeat):
+    """Coût fixe d'une exécution de script : pool de workers chaud et interpréteur à froid"""
+    workdir = tempfile.mkdtemp(prefix="gag_bench_exec_")
+    results = {}
+    for name, pool in (("execute_pool", runtime.pool), ("execute_cold", None)):
+        if name == "execute_pool" and pool is None:
+            continue
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = execute_code(TRIVIAL_CODE, workdir, pool, runtime.limits)
+            samples.append(time.perf_counter() - start)
+            if result["log"]:
+                raise RuntimeError(f"Échec du script de référence : {result['log']}")
+        results[name] = _stats(samples)
+    return results
+
+
+def bench_pipelines(runtime, path, latency, repeat):
+    """Durée de chaque étape des deux pipelines, avec et sans passage par le debugger"""
+    scenarios = {}
+    for scenario, failures in (("initial", 0), ("initial_debug", 1), ("modification", 0), ("modification_debug", 1),
+                               ("modification_locale", 0)):
+        stages = {}
+        for _ in range(repeat):
+            timer = StageTimer()
+            runtime.progress = timer
+            llm = ScriptedLLM(latency=latency, failures=failures)
+            workdir = tempfile.mkdtemp(prefix="gag_bench_run_")
+            start = time.perf_counter()
+            if scenario.startswith("initial"):
+                success, _, report = generate_chart_initial(runtime, llm, "Trace x en fonction de t", path,
+                                                            use_cache=False, workdir=workdir)
+            else:
+                # Une retouche de style est appliquée localement, les autres demandes passent par le modèle
+                prompt = "Change la couleur en rouge" if scenario == "modification_locale" else "Place la légende en haut à gauche"
+                success, _, report = generate_chart_modification(runtime, llm, prompt, SCRIPT_CODE, path,
+                                                                 use_cache=False, workdir=workdir)
+            if not success:
+                raise RuntimeError(f"Échec du scénario {scenario} : {report.get('error') or report.get('log')}")
+            timer.durations["total"] = time.perf_counter() - start
+            timer.durations["llm_calls"] = llm.calls
+            for name, value in timer.durations.items():
+                stages.setdefault(name, []).append(value)
+        for name, values in stages.items():
+            if name == "llm_calls":
+                scenarios[f"{scenario}/llm_calls"] = {"count": values[0]}
+            else:
+                scenarios[f"{scenario}/{name}"] = _stats(values)
+    return scenarios
+
+
+#################################### Références ####################################
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline, threshold):
+    """Lignes de comparaison et liste des mesures plus lentes que la référence au-delà du seuil"""
+    lines, regressions = [], []
+    for name, current in sorted(results.items()):
+        reference = baseline.get(name)
+        if not reference or "median_s" not in current or "median_s" not in reference:
+            continue
+        ratio = current["median_s"] / reference["median_s"] if reference["median_s"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  <-- régression"
+            regressions.append(name)
+        lines.append(f"{name:60s} {reference['median_s']:9.4f} s -> {current['median_s']:9.4f} s  x{ratio:5.2f}{flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne de GAG avec un LLM scripté")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Nombres de lignes des fichiers synthétiques (jusqu'à 10000000)")
+    parser.add_argument("--pipeline-rows", type=int, default=100_000, help="Taille du fichier utilisé par les pipelines")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latence simulée de chaque appel LLM (s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions de chaque mesure (médiane retenue)")
+    parser.add_argument("--workers", type=int, default=2, help="Workers du pool d'exécution (0 = à froid)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "gag_bench"),
+                        help="Dossier des fichiers synthétiques (réutilisés d'une exécution à l'autre)")
+    parser.add_argument("--out", default="bench_results", help="Dossier où écrire la référence JSON")
+    parser.add_argument("--compare", help="Référence JSON à laquelle comparer les mesures")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio au-delà duquel une mesure est une régression")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    settings = {"EXECUTOR_WORKERS": args.workers}
+    runtime = Runtime(settings, cache=None, pool=make_worker_pool(settings))
+    results = {}
+    try:
+        for n_rows in args.sizes:
+            print(f"read_data : {n_rows} lignes...", flush=True)
+            path = make_dataset(args.data_dir, n_rows)
+            for name, value in bench_read_data(path, args.repeat).items():
+                results[f"{name}/{n_rows}"] = value
+
+        print("Exécution des scripts...", flush=True)
+        results.update(bench_execution(runtime, args.repeat * 3))
+
+        print(f"Pipelines : {args.pipeline_rows} lignes, latence LLM {args.latency} s...", flush=True)
+        path = make_dataset(args.data_dir, args.pipeline_rows)
+        for name, value in bench_pipelines(runtime, path, args.latency, args.repeat).items():
+            results[f"pipeline/{args.pipeline_rows}/{name}"] = value
+    finally:
+        if runtime.pool is not None:
+            runtime.pool.close()
+
+    commit = _git_commit()
+    baseline = {
+        "meta": {
+            "commit": commit,
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "repeat": args.repeat,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"{commit}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    print(f"Mesures écrites dans {out_path}")
+
+    for name, value in sorted(results.items()):
+        if "median_s" in value:
+            print(f"{name:60s} {value['median_s']:9.4f} s")
+        else:
+            print(f"{name:60s} {value['count']:9d}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            reference = json.load(f)
+        print(f"\nComparaison avec {reference['meta']['commit']} (seuil x{args.threshold}) :")
+        lines, regressions = compare(results, reference["results"], args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} régression(s)")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
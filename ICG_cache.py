@@ -0,0 +1,139 @@
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+from importlib import metadata
+
+
+class DiskCache:
+    """
+    Cache clé/valeur persistant (SQLite) avec éviction par âge et par taille totale.
+    Les entrées les moins récemment lues sont supprimées en premier.
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, max_age=30 * 24 * 3600):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, "cache.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                   key TEXT PRIMARY KEY,
+                   value BLOB NOT NULL,
+                   size INTEGER NOT NULL,
+                   created REAL NOT NULL,
+                   accessed REAL NOT NULL
+               )"""
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+
+    def delete(self, keys):
+        with self._lock:
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def _evict(self, now):
+        if self.max_age:
+            self._db.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Parcours des plus anciennes lectures jusqu'à repasser sous le budget
+        to_delete = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            to_delete.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+
+def response_key(agent, model, temperature, context):
+    """Clé d'une réponse LLM : agent, modèle, température et contexte complet"""
+    payload = json.dumps([agent, model, temperature, context], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def library_versions():
+    """Versions des bibliothèques de rendu : une mise à jour invalide les rendus en cache"""
+    versions = {"python": "%d.%d" % sys.version_info[:2]}
+    for name in ("matplotlib", "pandas", "numpy", "seaborn"):
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def render_key(code, data, decimation, render=None):
+    """
+    Clé d'un rendu : script normalisé (arbre syntaxique, sans commentaires ni mise en forme),
+    contenu des données (le pickle de cache_dataframe est nommé par empreinte du fichier),
+    options de réduction et d'enregistrement (aperçu ou export) et versions des bibliothèques
+    """
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = code
+    data_id = os.path.basename(data) if data else None
+    payload = json.dumps([normalized, data_id, decimation, render, library_versions()], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def pack_render(result):
+    # En-tête JSON (log, erreur, bilan de réduction) sur une ligne, suivi du PNG brut
+    header = {k: result[k] for k in ("log", "error", "decimation")}
+    header["has_figure"] = result["figure"] is not None
+    return json.dumps(header).encode("utf-8") + b"\n" + (result["figure"] or b"")
+
+
+def unpack_render(value):
+    header, figure = value.split(b"\n", 1)
+    result = json.loads(header)
+    result["figure"] = figure if result.pop("has_figure") else None
+    return result
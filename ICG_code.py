@@ -0,0 +1,50 @@
+#################################### Extraction du code ####################################
+def extract_code(text):
+    """Nettoie une réponse du modèle des balises markdown"""
+    if "```python" in text:
+        # Extraire le code entre ```python et ```
+        return text.split("```python")[1].split("```")[0].strip()
+    elif "```" in text:
+        # Extraire le code entre ``` et ```
+        return text.split("```")[1].split("```")[0].strip()
+    return text
+
+
+class CodeStream:
+    """
+    Détection incrémentale du bloc de code dans une réponse reçue par morceaux.
+    feed() renvoie True dès que la balise ``` fermante est reçue : le reste de la
+    réponse (texte explicatif éventuel) peut être ignoré.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.closed = False
+        self._start = None  # Début du code, juste après la ligne ```python
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self._start is None:
+            fence = self.text.find("```")
+            if fence == -1:
+                return False
+            # On attend la fin de la ligne d'ouverture (```python)
+            newline = self.text.find("\n", fence)
+            if newline == -1:
+                return False
+            self._start = newline + 1
+        self.closed = self.text.find("```", self._start) != -1
+        return self.closed
+
+    @property
+    def code(self):
+        """Code reçu jusqu'ici (partiel tant que le bloc n'est pas fermé)"""
+        if self._start is None:
+            return "" if "```" in self.text else self.text
+        return self.text[self._start:].split("```")[0].rstrip("`")
+
+    def result(self):
+        if self.closed:
+            return self.code.strip()
+        # Pas de balises (ou bloc jamais fermé) : même traitement qu'une réponse complète
+        return extract_code(self.text)
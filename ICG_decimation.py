@@ -0,0 +1,189 @@
+import atexit
+import json
+
+import numpy as np
+
+# Méthodes de réduction disponibles
+METHODS = ("lttb", "minmax")
+
+
+#################################### Algorithmes ####################################
+def minmax_indices(y, n_out):
+    """
+    Indices conservés par la méthode min/max : pour chaque paquet de points,
+    on garde le minimum et le maximum (les pics restent visibles).
+    """
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return np.arange(n)
+
+    size = n // n_buckets
+    usable = size * n_buckets
+    blocks = np.asarray(y[:usable], dtype=float).reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    # Les NaN ne doivent être choisis ni comme minimum ni comme maximum
+    lows = np.where(np.isnan(blocks), np.inf, blocks).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(blocks), -np.inf, blocks).argmax(axis=1) + offsets
+    indices = np.concatenate([lows, highs, [0, n - 1]])
+    return np.unique(indices)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices conservés par Largest-Triangle-Three-Buckets : dans chaque paquet, le
+    point formant le plus grand triangle avec le point retenu précédemment et la
+    moyenne du paquet suivant. Une boucle sur les paquets, calculs vectorisés dedans.
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Moyennes de chaque paquet en une passe (sommes cumulées)
+    valid = ~np.isnan(y)
+    cx = np.concatenate([[0.0], np.cumsum(x)])
+    cy = np.concatenate([[0.0], np.cumsum(np.where(valid, y, 0.0))])
+    cn = np.concatenate([[0], np.cumsum(valid)])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        count = max(cn[next_stop] - cn[stop], 1)
+        mean_x = (cx[next_stop] - cx[stop]) / max(next_stop - stop, 1)
+        mean_y = (cy[next_stop] - cy[stop]) / count
+
+        bx, by = x[start:stop], y[start:stop]
+        areas = np.abs((x[a] - mean_x) * (by - y[a]) - (x[a] - bx) * (mean_y - y[a]))
+        areas = np.where(np.isnan(areas), -1.0, areas)
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def decimate_indices(x, y, n_out, method="lttb"):
+    if method == "minmax":
+        return minmax_indices(y, n_out)
+    return lttb_indices(x, y, n_out)
+
+
+#################################### Interception de matplotlib ####################################
+def _as_numeric(values):
+    # Dates converties en entiers pour les calculs ; None si la série n'est pas numérique
+    array = np.asarray(values)
+    if array.ndim != 1:
+        return None
+    if np.issubdtype(array.dtype, np.datetime64) or np.issubdtype(array.dtype, np.timedelta64):
+        return array.astype("int64").astype(float)
+    if not np.issubdtype(array.dtype, np.number) and array.dtype != bool:
+        return None
+    return array.astype(float)
+
+
+def _take(values, indices):
+    # Conserve le type d'origine (Series, Index...) pour que les convertisseurs de dates fonctionnent
+    if hasattr(values, "iloc"):
+        return values.iloc[indices]
+    if hasattr(values, "take"):
+        return values.take(indices)
+    return np.asarray(values)[indices]
+
+
+def _select(x, y, options, stats):
+    # Renvoie les indices à conserver pour la série (x, y), ou None si elle est laissée intacte
+    if len(y) <= options["threshold"] or (x is not None and len(x) != len(y)):
+        return None
+    ny = _as_numeric(y)
+    if ny is None:
+        return None
+    nx = None if x is None else _as_numeric(x)
+    # LTTB suppose des abscisses numériques croissantes ; sinon (texte, désordre)
+    # on travaille dans l'ordre des lignes
+    if nx is None or (len(nx) > 1 and not np.all(np.diff(nx) >= 0)):
+        nx = np.arange(len(ny), dtype=float)
+
+    indices = decimate_indices(nx, ny, options["n_out"], options["method"])
+    stats["points_in"] += len(y)
+    stats["points_out"] += len(indices)
+    stats["calls"] += 1
+    return indices
+
+
+def install(options):
+    """
+    Remplace Axes.plot et Axes.scatter par des versions qui réduisent les séries
+    de plus de options["threshold"] points à options["n_out"] points.
+
+    Args:
+        options: {"threshold": int, "n_out": int, "method": "lttb" | "minmax"}
+
+    Returns:
+        tuple: (stats: dict, uninstall: fonction qui restaure matplotlib)
+    """
+    from matplotlib.axes import Axes
+
+    stats = {"method": options["method"], "points_in": 0, "points_out": 0, "calls": 0}
+    original_plot, original_scatter = Axes.plot, Axes.scatter
+
+    def plot(self, *args, **kwargs):
+        # Formes gérées : plot(y), plot(y, fmt), plot(x, y), plot(x, y, fmt)
+        if "data" not in kwargs:
+            values = [a for a in args if not isinstance(a, str)]
+            fmt = [a for a in args if isinstance(a, str)]
+            if 1 <= len(values) <= 2 and len(fmt) <= 1 and (not fmt or isinstance(args[-1], str)):
+                x, y = (None, values[0]) if len(values) == 1 else values
+                if x is None and hasattr(y, "index"):
+                    # Series : matplotlib trace en fonction de l'index (dates, valeurs...)
+                    x = y.index
+                indices = _select(x, y, options, stats)
+                if indices is not None:
+                    y = _take(y, indices)
+                    if x is None:
+                        # Les abscisses implicites doivent rester les positions d'origine
+                        x = indices
+                    else:
+                        x = _take(x, indices)
+                    args = (x, y, *fmt)
+        return original_plot(self, *args, **kwargs)
+
+    def scatter(self, x, y, *args, **kwargs):
+        if not args and "data" not in kwargs:
+            indices = _select(x, y, options, stats)
+            if indices is not None:
+                # Tailles et couleurs données point par point suivent la même sélection
+                for key in ("s", "c"):
+                    value = kwargs.get(key)
+                    if value is not None and not isinstance(value, str) and np.ndim(value) == 1 and len(value) == len(y):
+                        kwargs[key] = _take(value, indices)
+                x, y = _take(x, indices), _take(y, indices)
+        return original_scatter(self, x, y, *args, **kwargs)
+
+    Axes.plot, Axes.scatter = plot, scatter
+
+    def uninstall():
+        Axes.plot, Axes.scatter = original_plot, original_scatter
+
+    return stats, uninstall
+
+
+def summarize(stats):
+    """Résumé pour le rapport de la pipeline (None si aucune série n'a été réduite)"""
+    if not stats or not stats["calls"]:
+        return None
+    return {**stats, "ratio": stats["points_out"] / stats["points_in"]}
+
+
+def install_for_script(options, stats_path):
+    """Variante pour l'exécution à froid : les statistiques sont écrites dans un fichier à la sortie"""
+    stats, _ = install(options)
+
+    def dump():
+        with open(stats_path, "w") as f:
+            json.dump(stats, f)
+
+    atexit.register(dump)
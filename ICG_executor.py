@@ -0,0 +1,613 @@
+import errno
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from ICG_cache import pack_render, render_key, unpack_render
+from ICG_preflight import SCRIPT_NAME, preflight
+
+try:
+    import resource
+except ImportError:  # Windows : pas de limites système, seul le timeout s'applique
+    resource = None
+
+# En-tête des scripts exécutés à froid pour forcer le backend non interactif
+# (les workers du pool le choisissent au démarrage)
+MATPLOTLIB_HEADER = """import matplotlib
+matplotlib.use('Agg')
+"""
+
+# Nom du fichier image produit par les scripts générés
+CHART_FILE = "graphique.png"
+
+# Chargement du DataFrame pré-converti pour l'exécution à froid
+DATA_PREAMBLE = """import pandas as pd
+df = pd.read_pickle({path!r})
+"""
+
+# Nombre de DataFrames gardés en mémoire par worker
+FRAME_MEMO_SIZE = 2
+
+# Réduction des séries (ICG_decimation) pour l'exécution à froid ; les statistiques
+# sont relues dans DECIMATION_STATS_FILE à la fin du script
+DECIMATION_PREAMBLE = """import sys
+sys.path.insert(0, {module_dir!r})
+from ICG_decimation import install_for_script
+install_for_script({options!r}, {stats_path!r})
+"""
+DECIMATION_STATS_FILE = ".decimation.json"
+
+# Options d'enregistrement du graphique (ICG_render : aperçu ou export) pour l'exécution à froid
+RENDER_PREAMBLE = """import sys
+sys.path.insert(0, {module_dir!r})
+from ICG_render import install
+install({options!r}, {chart_file!r})
+"""
+
+# Limites par exécution (None = pas de limite)
+#   timeout      : temps réel maximal, en secondes
+#   cpu_seconds  : temps CPU maximal, en secondes
+#   memory_mb    : espace d'adressage du processus (interpréteur et bibliothèques compris)
+#   file_size_mb : taille maximale d'un fichier écrit par le script
+DEFAULT_LIMITS = {"timeout": 120, "cpu_seconds": 120, "memory_mb": 4096, "file_size_mb": 100}
+
+# Catégories d'erreur renvoyées dans le résultat d'exécution
+ERROR_MESSAGES = {
+    "timeout": "LIMITE DÉPASSÉE (temps) : le script a été interrompu après {timeout} s.",
+    "cpu": "LIMITE DÉPASSÉE (CPU) : le script a consommé plus de {cpu_seconds} s de CPU.",
+    "memory": "LIMITE DÉPASSÉE (mémoire) : le script a dépassé {memory_mb} Mo.",
+    "file_size": "LIMITE DÉPASSÉE (fichier) : le script a tenté d'écrire un fichier de plus de {file_size_mb} Mo.",
+    "crash": "Le processus d'exécution s'est arrêté brutalement (code {exitcode}).",
+    "cancelled": "Exécution annulée à la demande de l'utilisateur.",
+}
+
+# Intervalle de vérification de l'annulation pendant une exécution
+CANCEL_POLL_S = 0.1
+
+# Script arrêté par le temps réel après avoir consommé au moins cette part de sa limite CPU :
+# classé "cpu" (calcul trop long), quel que soit le mode et la limite atteinte en premier
+CPU_BOUND_RATIO = 0.9
+
+
+class WorkerError(Exception):
+    """Le worker est mort ou injoignable : l'appelant doit passer en exécution à froid"""
+
+
+class CPULimitExceeded(Exception):
+    """Levée dans le worker à la réception de SIGXCPU"""
+
+
+def _limit_message(category, limits, **extra):
+    return ERROR_MESSAGES[category].format(**{**DEFAULT_LIMITS, **(limits or {}), **extra})
+
+
+def _set_limit(name, value):
+    # Abaisse la limite souple sans toucher à la limite dure, pour pouvoir la relever ensuite
+    limit = getattr(resource, name, None)
+    if limit is None:
+        return
+    soft, hard = resource.getrlimit(limit)
+    if value is None:
+        value = hard
+    elif hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    try:
+        resource.setrlimit(limit, (value, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def _apply_process_limits(limits):
+    # Limites valables pour toute la vie du processus (mémoire, taille de fichier)
+    if resource is None or not limits:
+        return
+    if limits.get("memory_mb"):
+        _set_limit("RLIMIT_AS", int(limits["memory_mb"] * 1024 * 1024))
+    if limits.get("file_size_mb"):
+        _set_limit("RLIMIT_FSIZE", int(limits["file_size_mb"] * 1024 * 1024))
+        # Sans ce signal, un dépassement lève OSError(EFBIG) au lieu de tuer le processus
+        signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+
+def _apply_cold_limits(limits):
+    # preexec_fn du processus à froid : toutes les limites s'appliquent dès le démarrage
+    _apply_process_limits(limits)
+    if resource is not None and limits.get("cpu_seconds"):
+        _set_limit("RLIMIT_CPU", int(limits["cpu_seconds"]))
+
+
+def _cpu_seconds(who):
+    # Temps CPU (utilisateur + système) consommé par le processus ou par ses enfants terminés
+    if resource is None:
+        return None
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _process_cpu_seconds(pid):
+    # Temps CPU d'un autre processus encore vivant (Linux : /proc) ; None si indisponible
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _timeout_category(limits, cpu_used):
+    # Dépassement du temps réel par un script qui calculait : même catégorie que la limite CPU
+    cpu_limit = limits.get("cpu_seconds")
+    timeout = limits.get("timeout")
+    if cpu_used is None or not cpu_limit or (timeout and cpu_limit > timeout):
+        return "timeout"
+    return "cpu" if cpu_used >= CPU_BOUND_RATIO * cpu_limit else "timeout"
+
+
+def _max_rss_mb():
+    # Pic de mémoire résidente du processus (depuis son démarrage pour un worker du pool) :
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _wait_for(ready, timeout, cancel):
+    # Attente par tranches de CANCEL_POLL_S pour réagir à l'annulation (threading.Event) ;
+    # ready(délai) renvoie True quand le résultat est disponible
+    if cancel is None:
+        return "ready" if ready(timeout) else "timeout"
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return "timeout"
+        if ready(CANCEL_POLL_S if remaining is None else min(CANCEL_POLL_S, remaining)):
+            return "ready"
+        if cancel.is_set():
+            return "cancelled"
+
+
+def _communicate(process, timeout, cancel):
+    # stderr du processus et "ready", ou None et "timeout" / "cancelled" (processus tué)
+    output = []
+
+    def ready(delay):
+        try:
+            output[:] = [process.communicate(timeout=delay)[1]]
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
+    status = _wait_for(ready, timeout, cancel)
+    if status != "ready":
+        process.kill()
+        process.communicate()
+        return None, status
+    return output[0], status
+
+
+def _renumber_traceback(log, code_file, offset, filename):
+    # Exécution à froid : lignes du script sans le préambule et même nom de fichier que dans
+    # le pool, pour que le debugger et error_signature voient les mêmes références
+    def shift(match):
+        line = int(match.group(1)) - offset
+        return f'File "{filename}", line {line}' if line > 0 else match.group(0)
+
+    return re.sub(rf'File "{re.escape(code_file)}", line (\d+)', shift, log)
+
+
+def _classify_exception(value):
+    if isinstance(value, MemoryError):
+        return "memory"
+    if isinstance(value, CPULimitExceeded):
+        return "cpu"
+    if isinstance(value, OSError) and value.errno == errno.EFBIG:
+        return "file_size"
+    return "exception"
+
+
+#################################### Worker (processus fils) ####################################
+_frames = OrderedDict()  # Chemin du pickle -> DataFrame, propre à chaque worker
+
+
+def _load_frame(path):
+    import pandas as pd
+
+    if path not in _frames:
+        _frames[path] = pd.read_pickle(path)
+        if len(_frames) > FRAME_MEMO_SIZE:
+            _frames.popitem(last=False)
+    _frames.move_to_end(path)
+    # Copie profonde : le script peut modifier df sans altérer la version en mémoire
+    return _frames[path].copy()
+
+def _file_state(path):
+    # Signature (mtime, taille) pour savoir si le script a réécrit le graphique
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_chart(chart_path, before):
+    after = _file_state(chart_path)
+    if after is None or after == before:
+        return None
+    with open(chart_path, "rb") as f:
+        return f.read()
+
+
+def _run_job(job):
+    import builtins
+    import contextlib
+    import io
+    import linecache
+    import sys
+    import traceback
+    import warnings
+
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    code = job["code"]
+    workdir = job["workdir"]
+    limits = job.get("limits") or {}
+    error = None
+    decimation_stats, uninstall, uninstall_render = None, None, None
+    chart_path = os.path.join(workdir, CHART_FILE)
+    before = _file_state(chart_path)
+
+    # Nom de fichier fictif enregistré dans linecache pour avoir des tracebacks lisibles
+    filename = os.path.join(workdir, SCRIPT_NAME)
+    linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+
+    stderr = io.StringIO()
+    namespace = {"__name__": "__main__", "__file__": filename, "__builtins__": builtins}
+    previous_cwd = os.getcwd()
+    cpu_before = _cpu_seconds(resource.RUSAGE_SELF) if resource is not None else None
+    if resource is not None and limits.get("cpu_seconds"):
+        # RLIMIT_CPU est cumulatif sur la vie du worker : on le fixe relativement au temps déjà consommé
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _set_limit("RLIMIT_CPU", math.ceil(usage.ru_utime + usage.ru_stime + limits["cpu_seconds"]))
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(stderr):
+            # catch_warnings réinitialise les registres : chaque script voit ses warnings comme à froid
+            with warnings.catch_warnings():
+                warnings.simplefilter("default")
+                try:
+                    if job.get("data"):
+                        namespace["df"] = _load_frame(job["data"])
+                    if job.get("decimation"):
+                        from ICG_decimation import install
+                        decimation_stats, uninstall = install(job["decimation"])
+                    if job.get("render"):
+                        from ICG_render import install as install_render
+                        uninstall_render = install_render(job["render"], CHART_FILE)
+                    exec(compile(code, filename, "exec"), namespace)
+                except SystemExit as e:
+                    if e.code not in (None, 0):
+                        print(f"SystemExit: {e.code}", file=sys.stderr)
+                        error = "exception"
+                except BaseException:
+                    etype, value, tb = sys.exc_info()
+                    error = _classify_exception(value)
+                    # On masque la frame du worker pour ne garder que celles du script
+                    traceback.print_exception(etype, value, tb.tb_next, file=sys.stderr)
+                    if error != "exception":
+                        print(_limit_message(error, limits), file=sys.stderr)
+    finally:
+        if resource is not None and limits.get("cpu_seconds"):
+            _set_limit("RLIMIT_CPU", None)
+        if uninstall is not None:
+            uninstall()
+        if uninstall_render is not None:
+            uninstall_render()
+        os.chdir(previous_cwd)
+        linecache.cache.pop(filename, None)
+        # Remise à zéro de l'état global partagé entre deux scripts
+        plt.close("all")
+        matplotlib.rcdefaults()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            pd.reset_option("all")
+
+    usage = {"max_rss_mb": _max_rss_mb()}
+    if cpu_before is not None:
+        usage["cpu_s"] = round(_cpu_seconds(resource.RUSAGE_SELF) - cpu_before, 4)
+    return {"log": stderr.getvalue(), "figure": _read_chart(chart_path, before), "error": error,
+            "decimation": _summarize_decimation(decimation_stats), "usage": usage}
+
+
+def _summarize_decimation(stats):
+    if not stats:
+        return None
+    from ICG_decimation import summarize
+    return summarize(stats)
+
+
+def _raise_cpu_limit(signum, frame):
+    raise CPULimitExceeded("temps CPU maximal atteint")
+
+
+def _worker_main(conn, limits=None):
+    _apply_process_limits(limits)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+
+    # Imports lourds payés une seule fois par worker
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    try:
+        import seaborn  # noqa: F401
+    except ImportError:
+        pass
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        conn.send(_run_job(job))
+
+
+#################################### Pool de workers ####################################
+class WorkerPool:
+    """
+    Pool de processus Python longue durée ayant déjà importé pandas, numpy,
+    matplotlib et seaborn. Chaque script est exécuté dans un namespace vierge.
+    Les limites mémoire et taille de fichier sont posées au démarrage du worker,
+    les limites de temps (réel et CPU) à chaque exécution.
+    """
+
+    def __init__(self, size=2, limits=None):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn, self.limits), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def run(self, code, workdir, data=None, decimation=None, render=None, cancel=None):
+        """
+        Exécute un script dans un worker libre (bloque si tous sont occupés).
+        Un worker qui dépasse le temps imparti ou meurt en cours d'exécution est remplacé.
+        Si data (chemin d'un pickle) est fourni, le script reçoit le DataFrame dans `df`.
+        Si decimation est fourni, les séries trop longues sont réduites (voir ICG_decimation).
+        Si render est fourni, l'enregistrement du graphique suit ces options (voir ICG_render).
+        Si cancel (threading.Event) est levé pendant l'exécution, le worker est tué et remplacé.
+
+        Returns:
+            dict: {"log": str, "figure": bytes | None, "error": str | None}
+        """
+        process, conn = self._idle.get()
+        try:
+            try:
+                conn.send({"code": code, "workdir": workdir, "limits": self.limits, "data": data,
+                           "decimation": decimation, "render": render})
+            except OSError as e:
+                # Worker déjà mort avant l'envoi : le script n'a pas tourné
+                process, conn = self._replace(process, conn)
+                raise WorkerError(str(e)) from e
+
+            cpu_start = _process_cpu_seconds(process.pid)
+            status = _wait_for(conn.poll, self.limits.get("timeout"), cancel)
+            if status == "timeout":
+                cpu_end = _process_cpu_seconds(process.pid)
+                if cpu_start is not None and cpu_end is not None:
+                    status = _timeout_category(self.limits, cpu_end - cpu_start)
+            if status != "ready":
+                process, conn = self._replace(process, conn)
+                return {"log": _limit_message(status, self.limits), "figure": None, "error": status, "decimation": None}
+
+            try:
+                return conn.recv()
+            except (EOFError, OSError):
+                # Mort pendant le script : SIGKILL (mémoire), SIGXCPU non intercepté, os._exit...
+                process.join(timeout=1)
+                exitcode = process.exitcode
+                process, conn = self._replace(process, conn)
+                error = "cpu" if exitcode == -getattr(signal, "SIGXCPU", 0) else "crash"
+                return {"log": _limit_message(error, self.limits, exitcode=exitcode), "figure": None, "error": error,
+                        "decimation": None}
+        finally:
+            self._idle.put((process, conn))
+
+    def _replace(self, process, conn):
+        process.kill()
+        process.join(timeout=1)
+        conn.close()
+        return self._spawn()
+
+    def close(self):
+        while not self._idle.empty():
+            process, conn = self._idle.get_nowait()
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+
+
+#################################### Exécution ####################################
+def run_cold(code, workdir, limits=None, data=None, decimation=None, render=None, cancel=None):
+    """Ancien comportement : un interpréteur python neuf par script"""
+    limits = {**DEFAULT_LIMITS, **(limits or {})}
+    chart_path = os.path.join(workdir, CHART_FILE)
+    before = _file_state(chart_path)
+    stats_path = os.path.join(workdir, DECIMATION_STATS_FILE)
+
+    preamble = MATPLOTLIB_HEADER
+    if data:
+        preamble += DATA_PREAMBLE.format(path=data)
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    if decimation:
+        preamble += DECIMATION_PREAMBLE.format(module_dir=module_dir, options=decimation, stats_path=stats_path)
+    if render:
+        preamble += RENDER_PREAMBLE.format(module_dir=module_dir, options=render, chart_file=CHART_FILE)
+
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, dir=workdir) as f:
+        f.write(preamble + code)
+        code_file = f.name
+
+    error = None
+    # Temps CPU des processus enfants terminés : approximatif si d'autres threads
+    # lancent des exécutions à froid en même temps
+    cpu_before = _cpu_seconds(resource.RUSAGE_CHILDREN) if resource is not None else None
+    try:
+        process = subprocess.Popen(
+            ["python", code_file],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=workdir,
+            preexec_fn=(lambda: _apply_cold_limits(limits)) if resource is not None else None,
+        )
+        log, status = _communicate(process, limits.get("timeout"), cancel)  # stderr contient l'erreur si crash
+        if status == "ready":
+            log = _renumber_traceback(log, code_file, preamble.count("\n"), os.path.join(workdir, SCRIPT_NAME))
+        if status == "timeout" and cpu_before is not None:
+            # Le processus tué a été attendu : son temps CPU est compté dans RUSAGE_CHILDREN
+            status = _timeout_category(limits, _cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_before)
+        if status != "ready":
+            # Processus tué (temps, CPU ou annulation) : le message de limite remplace le log
+            log, error = _limit_message(status, limits), status
+        else:
+            if process.returncode == -getattr(signal, "SIGXCPU", 0):
+                error = "cpu"
+            elif process.returncode == -getattr(signal, "SIGXFSZ", 0) or "File too large" in log:
+                error = "file_size"
+            elif "MemoryError" in log:
+                error = "memory"
+            elif process.returncode > 0 and not log.strip():
+                # sys.exit(n) sans message : même compte rendu que dans le pool
+                log, error = f"SystemExit: {process.returncode}\n", "exception"
+            elif process.returncode != 0:
+                error = "exception" if log else "crash"
+            # Sortie anormale : le message de limite complète le log du script
+            if error not in (None, "exception"):
+                log += _limit_message(error, limits, exitcode=process.returncode)
+    finally:
+        try:
+            os.remove(code_file)
+        except OSError:
+            pass
+
+    stats = None
+    if decimation and os.path.exists(stats_path):
+        with open(stats_path) as f:
+            stats = json.load(f)
+        os.remove(stats_path)
+
+    usage = {}
+    if cpu_before is not None:
+        usage["cpu_s"] = round(_cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_before, 4)
+    return {"log": log, "figure": _read_chart(chart_path, before), "error": error,
+            "decimation": _summarize_decimation(stats), "usage": usage}
+
+
+def execute_code(code, workdir=None, pool=None, limits=None, data=None, decimation=None, columns=None, check=True,
+                 cache=None, render=None, cancel=None):
+    """
+    Exécute un script généré, via le pool si disponible, sinon à froid.
+    Un contrôle statique (ICG_preflight) précède l'exécution : les erreurs certaines
+    (syntaxe, colonne inexistante...) sont renvoyées sans lancer d'interpréteur.
+
+    Args:
+        code: Le code Python à exécuter
+        workdir: Le dossier de travail du script (dossier courant par défaut)
+        pool: Un WorkerPool, ou None pour l'exécution à froid
+        limits: Les limites de l'exécution à froid (le pool utilise les siennes)
+        data: Chemin du DataFrame pré-converti (cache_dataframe), exposé au script sous le nom `df`
+        decimation: Options de réduction des séries longues (ICG_decimation.install), None pour désactiver
+        columns: Colonnes de df, pour contrôler les noms de colonnes utilisés par le script
+        check: False pour exécuter le code tel quel, sans contrôle préalable
+        cache: Un DiskCache des rendus (ICG_cache.render_key), ou None pour toujours exécuter
+        render: Options d'enregistrement du graphique (ICG_render.install : aperçu ou export), None pour
+            garder celles du script
+        cancel: threading.Event d'annulation : levé pendant l'exécution, le script est interrompu
+
+    Returns:
+        dict: {"log": stderr du script, "figure": bytes du PNG (ou du SVG/PDF exporté) ou None,
+               "error": None ou la catégorie d'erreur (preflight, exception, timeout, cpu, memory, file_size, crash,
+                   cancelled),
+               "decimation": None ou le bilan de la réduction (points_in, points_out, ratio...),
+               "code": le code exécuté (avec les corrections du contrôle), "fixes": corrections appliquées,
+               "usage": {"mode": pool, cold, cache ou preflight, "preflight_s", "wall_s", "cpu_s", "max_rss_mb"}}
+    """
+    workdir = workdir or os.getcwd()
+    fixes = []
+    t0 = time.perf_counter()
+    if check:
+        checked = preflight(code, columns, CHART_FILE)
+        code, fixes = checked["code"], checked["fixes"]
+        if checked["log"]:
+            usage = {"mode": "preflight", "preflight_s": round(time.perf_counter() - t0, 4), "wall_s": 0.0}
+            return {"log": checked["log"], "figure": None, "error": "preflight", "decimation": None,
+                    "code": code, "fixes": fixes, "usage": usage}
+    t1 = time.perf_counter()
+
+    key = render_key(code, data, decimation, render) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            usage = {"mode": "cache", "preflight_s": round(t1 - t0, 4), "wall_s": round(time.perf_counter() - t1, 4)}
+            return {**unpack_render(cached), "code": code, "fixes": fixes, "usage": usage}
+
+    result, mode = None, "pool"
+    if pool is not None:
+        try:
+            result = pool.run(code, workdir, data, decimation, render, cancel)
+        except WorkerError:
+            pass
+    if result is None:
+        result, mode = run_cold(code, workdir, limits, data, decimation, render, cancel), "cold"
+    # Seuls les résultats reproductibles sont gardés : pas les dépassements de limites ni les plantages,
+    # qui dépendent de la charge de la machine
+    if key is not None and result["error"] in (None, "exception"):
+        cache.set(key, pack_render(result))
+    # wall_s inclut l'envoi au worker (ou le démarrage de l'interpréteur) et la relecture du PNG
+    usage = {"mode": mode, "preflight_s": round(t1 - t0, 4), "wall_s": round(time.perf_counter() - t1, 4),
+             **(result.get("usage") or {})}
+    return {**result, "code": code, "fixes": fixes, "usage": usage}
+
+
+def error_signature(log):
+    """
+    Signature d'une erreur : (type d'exception, dernière ligne du script citée).
+    Deux tentatives de débogage de même signature butent sur le même problème.
+    """
+    if not log:
+        return None
+    # Seules les frames du script comptent, pas celles de pandas ou matplotlib
+    library = (sys.prefix, sys.base_prefix)
+    lines = [line for path, line in re.findall(r'File "([^"]*)", line (\d+)', log)
+             if not path.startswith(library) and "site-packages" not in path]
+    messages = [l for l in log.splitlines() if l.strip() and not l[0].isspace()]
+    kind = messages[-1].split(":")[0].strip() if messages else ""
+    return kind, int(lines[-1]) if lines else None
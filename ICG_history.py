@@ -0,0 +1,66 @@
+import hashlib
+
+
+class History:
+    """
+    Historique des états pour le retour arrière (code, graphique, bilan de réduction).
+
+    Chaque PNG n'est gardé qu'une fois, sous son empreinte SHA-256, quel que soit le
+    nombre d'états qui l'affichent. Les messages ne sont pas copiés : la conversation
+    est une liste à laquelle on ne fait qu'ajouter, et chaque état retient seulement
+    sa longueur au moment de la sauvegarde. Restaurer un état revient à la tronquer.
+
+    La taille est bornée par un budget en octets (graphiques uniques et codes) : les
+    états les plus anciens sont oubliés au-delà, le plus récent est toujours conservé.
+    """
+
+    def __init__(self, max_bytes=50 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._states = []
+        self._blobs = {}  # empreinte -> [PNG, nombre d'états qui l'utilisent]
+
+    def __len__(self):
+        return len(self._states)
+
+    def push(self, code, chart, decimation, message_count):
+        """Ajoute un état ; message_count est la longueur de la conversation à cet instant"""
+        digest = None
+        if chart is not None:
+            digest = hashlib.sha256(chart).hexdigest()
+            if digest in self._blobs:
+                self._blobs[digest][1] += 1
+            else:
+                self._blobs[digest] = [chart, 1]
+                self.bytes += len(chart)
+        self.bytes += len(code or "")
+        self._states.append({"code": code, "chart": digest, "decimation": decimation, "messages": message_count})
+
+        while self.bytes > self.max_bytes and len(self._states) > 1:
+            self._release(self._states.pop(0))
+
+    def pop(self):
+        """
+        Retire et renvoie le dernier état.
+
+        Returns:
+            dict: {"code", "chart": bytes ou None, "decimation", "messages": longueur de la conversation}
+        """
+        state = self._states.pop()
+        chart = self._blobs[state["chart"]][0] if state["chart"] else None
+        self._release(state)
+        return {**state, "chart": chart}
+
+    def clear(self):
+        self._states.clear()
+        self._blobs.clear()
+        self.bytes = 0
+
+    def _release(self, state):
+        self.bytes -= len(state["code"] or "")
+        digest = state["chart"]
+        if digest is None:
+            return
+        self._blobs[digest][1] -= 1
+        if self._blobs[digest][1] == 0:
+            self.bytes -= len(self._blobs.pop(digest)[0])
@@ -0,0 +1,209 @@
+import asyncio
+import contextlib
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+# Générations en arrière-plan : l'interface soumet la pipeline à la file du serveur,
+# puis interroge le job (étape en cours, code partiel) jusqu'à son résultat.
+# L'annulation est coopérative : elle est vérifiée au début de chaque étape, entre deux
+# morceaux de réponse du modèle et pendant l'exécution du script (worker ou processus tué).
+
+# Intervalle de vérification de l'annulation pendant une attente (appel au modèle, exécution)
+CANCEL_POLL_S = 0.1
+
+
+class JobCancelled(Exception):
+    """La génération a été annulée à la demande de l'utilisateur"""
+
+    def __init__(self, message="Génération annulée"):
+        super().__init__(message)
+
+
+#################################### Job ####################################
+class Job:
+    """
+    Une génération soumise à la file : état, étapes franchies, code partiel et résultat.
+    Les attributs sont écrits par le thread de la pipeline et lus par l'interface.
+    """
+
+    def __init__(self):
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.stage = None  # Message de l'étape en cours
+        self.stages = []  # [(message, début)]
+        self.code = None  # Dernier code partiel reçu en streaming
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @contextlib.contextmanager
+    def progress(self, message):
+        """Remplace st.spinner dans le Runtime du job (Runtime.for_job)"""
+        self.stage = message
+        self.stages.append((message, time.time()))
+        yield
+
+    def update_code(self, code):
+        self.code = code
+
+    def cancel(self):
+        """Demande l'annulation ; un job encore en attente ne démarrera pas"""
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def status(self):
+        """queued, running, done ou cancelled (annulé avant d'avoir démarré)"""
+        if self.future is not None and self.future.cancelled():
+            return "cancelled"
+        if self.finished is not None:
+            return "done"
+        return "running" if self.started is not None else "queued"
+
+    def done(self):
+        return self.status in ("done", "cancelled")
+
+    def result(self):
+        """Le résultat de la fonction soumise (relance son exception éventuelle)"""
+        return self.future.result()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - (self.started or self.created)
+
+
+class JobQueue:
+    """
+    File des générations du serveur : au plus max_workers pipelines tournent en même temps,
+    les suivantes attendent leur tour, quel que soit le nombre de sessions.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gag_job")
+        self._queued = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Soumet fn(job, *args, **kwargs) ; renvoie le Job aussitôt"""
+        job = Job()
+
+        def run():
+            with self._lock:
+                self._queued.remove(job)
+            if job.cancelled:
+                raise JobCancelled()
+            job.started = time.time()
+            try:
+                return fn(job, *args, **kwargs)
+            finally:
+                job.finished = time.time()
+
+        with self._lock:
+            self._queued.append(job)
+            job.future = self._executor.submit(run)
+        job.future.add_done_callback(lambda future: self._forget(job))
+        return job
+
+    def _forget(self, job):
+        # Annulé avant de démarrer : run n'a pas retiré le job de la file
+        with self._lock:
+            if job in self._queued:
+                self._queued.remove(job)
+
+    def position(self, job):
+        """Rang du job dans la file d'attente (1 = prochain à démarrer), 0 s'il a démarré"""
+        with self._lock:
+            return self._queued.index(job) + 1 if job in self._queued else 0
+
+
+#################################### Modèle interruptible ####################################
+class CancellableLLM:
+    """
+    Enveloppe du modèle pour un job : chaque appel s'interrompt dès l'annulation.
+    Les appels asynchrones sont abandonnés en cours de requête ; les appels synchrones
+    passent par le streaming, vérifié à chaque morceau (fermer le flux coupe la requête).
+    Les autres attributs (model_name, temperature...) sont ceux du modèle.
+    """
+
+    def __init__(self, llm, cancel_event, budget=None):
+        self._llm = llm
+        self._cancel = cancel_event
+        self._budget = budget  # Budget de latence du niveau (voir ICG_models), vérifié par invoke
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def _check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    async def _race(self, awaitable):
+        # Attend le résultat en surveillant l'annulation ; la tâche est annulée, pas abandonnée
+        task = asyncio.ensure_future(awaitable)
+        while not task.done():
+            try:
+                await asyncio.wait({task}, timeout=CANCEL_POLL_S)
+            except asyncio.CancelledError:
+                # Annulé de l'extérieur (budget de latence dépassé) : la requête suit
+                task.cancel()
+                raise
+            if self._cancel.is_set() and not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError, CancelledError):
+                    await task
+                raise JobCancelled()
+        return task.result()
+
+    def tiers(self, agent):
+        """Niveaux de l'agent (ICG_models.ModelTiers), chacun interruptible"""
+        tiers = getattr(self._llm, "tiers", None)
+        if tiers is None:
+            return [(self, None)]
+        return [(CancellableLLM(model, self._cancel, budget), budget) for model, budget in tiers(agent)]
+
+    def stream(self, input, **kwargs):
+        self._check()
+        stream = self._llm.stream(input, **kwargs)
+        try:
+            for chunk in stream:
+                self._check()
+                yield chunk
+        finally:
+            stream.close()
+
+    async def astream(self, input, **kwargs):
+        self._check()
+        stream = self._llm.astream(input, **kwargs)
+        try:
+            while True:
+                try:
+                    chunk = await self._race(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def invoke(self, input, **kwargs):
+        # Réponse reconstituée à partir du flux ; sans comptage dans le dernier morceau,
+        # les jetons sont estimés par record_llm_call. Le délai du client ne borne que l'attente
+        # d'un morceau : le budget de la requête entière est vérifié ici
+        from langchain_core.messages import AIMessage
+        from ICG_models import BudgetExceeded
+
+        start, parts, usage = time.time(), [], None
+        for chunk in self.stream(input, **kwargs):
+            parts.append(chunk.content)
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            if self._budget is not None and time.time() - start > self._budget:
+                raise BudgetExceeded(f"budget de {self._budget:g} s dépassé")
+        return AIMessage(content="".join(parts), usage_metadata=usage)
+
+    async def ainvoke(self, input, **kwargs):
+        self._check()
+        return await self._race(self._llm.ainvoke(input, **kwargs))
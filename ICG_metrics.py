@@ -0,0 +1,229 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Mesures d'un tour de pipeline, rangées dans report["metrics"] :
+#   stages     : étapes (lecture, interpreteur, codeur, execution, debug...) avec début/fin
+#   llm        : un enregistrement par appel d'agent (latence, jetons, cache)
+#   executions : un enregistrement par exécution de script (contrôle, temps réel, CPU, mémoire)
+# Le tour complet peut être ajouté à un fichier JSONL et agrégé au format texte Prometheus.
+
+# Estimation grossière quand le fournisseur ne renvoie pas le nombre de jetons
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Nombre de jetons approximatif d'un texte (sans tokenizer)"""
+    return len(text) // CHARS_PER_TOKEN
+
+
+#################################### Enregistrement ####################################
+def new_metrics():
+    return {"started": time.time(), "stages": [], "llm": [], "executions": []}
+
+
+def _metrics(report):
+    if report is None:
+        return None
+    return report.setdefault("metrics", new_metrics())
+
+
+@contextlib.contextmanager
+def stage(report, name):
+    """Horodatages de début et de fin d'une étape de la pipeline"""
+    record = {"stage": name, "start": round(time.time(), 3)}
+    metrics = _metrics(report)
+    if metrics is not None:
+        metrics["stages"].append(record)
+    t0 = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["end"] = round(time.time(), 3)
+        record["duration_s"] = round(time.perf_counter() - t0, 4)
+
+
+def token_usage(message):
+    """(jetons du prompt, jetons de la réponse) d'une réponse LangChain, (None, None) si absents"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+def record_llm_call(report, agent, start, agent_input=None, response_text=None, usage=(None, None),
+                    cached=False, first_chunk_s=None, early_stop=None, model=None, tier=0, timed_out=False):
+    """
+    Ajoute un appel d'agent aux mesures du rapport. Sans comptage fourni par le modèle
+    (réponse en cache, streaming interrompu), les jetons sont estimés d'après la longueur des textes.
+    tier est le rang du niveau utilisé (0 : modèle de l'agent, 1 : premier repli...) ;
+    timed_out marque un appel abandonné pour dépassement du budget de latence.
+    """
+    metrics = _metrics(report)
+    if metrics is None:
+        return
+    prompt_tokens, completion_tokens = usage
+    estimated = prompt_tokens is None or completion_tokens is None
+    if prompt_tokens is None and agent_input is not None:
+        prompt_tokens = estimate_tokens(str(agent_input))
+    if completion_tokens is None and response_text is not None:
+        completion_tokens = estimate_tokens(response_text)
+    metrics["llm"].append({
+        "agent": agent,
+        "model": model,
+        "tier": tier,
+        "start": round(start, 3),
+        "latency_s": round(time.time() - start, 4),
+        "first_chunk_s": None if first_chunk_s is None else round(first_chunk_s, 4),
+        "cached": cached,
+        "prompt_chars": None if agent_input is None else len(str(agent_input)),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "estimated": estimated,
+        "early_stop": early_stop,
+        "timed_out": timed_out,
+    })
+
+
+def record_execution(report, start, result):
+    """Ajoute une exécution de script (champ "usage" du résultat d'execute_code) aux mesures"""
+    metrics = _metrics(report)
+    if metrics is None:
+        return
+    metrics["executions"].append({
+        "start": round(start, 3),
+        **(result.get("usage") or {}),
+        "error": result["error"],
+    })
+
+
+#################################### Synthèse d'un tour ####################################
+def _total(records, key):
+    return round(sum(r.get(key) or 0 for r in records), 4)
+
+
+def failure_category(report):
+    """Catégorie d'échec d'un tour : celle de l'exécution, sinon erreur du pipeline ou graphique absent"""
+    if report.get("error_category"):
+        return report["error_category"]
+    return "pipeline" if report.get("error") else "no_figure"
+
+
+def summarize_turn(report, success):
+    """
+    Synthèse d'un tour de pipeline : totaux par source de latence (modèle, exécution,
+    contrôle) et détail des étapes, appels et exécutions. C'est la ligne écrite en JSONL.
+    """
+    metrics = report.get("metrics") or new_metrics()
+    llm, executions = metrics["llm"], metrics["executions"]
+    called = [r for r in llm if not r["cached"]]  # Les réponses en cache ne coûtent ni temps ni jetons
+    return {
+        "timestamp": round(metrics["started"], 3),
+        "pipeline": report.get("pipeline"),
+        "success": success,
+        "total_s": round(time.time() - metrics["started"], 4),
+        "error_category": None if success else failure_category(report),
+        "llm_calls": len(called),
+        "llm_s": _total(called, "latency_s"),
+        "llm_fallbacks": sum(1 for r in called if r.get("timed_out")),
+        "prompt_tokens": _total(called, "prompt_tokens"),
+        "completion_tokens": _total(called, "completion_tokens"),
+        "exec_s": _total(executions, "wall_s"),
+        "exec_cpu_s": _total(executions, "cpu_s"),
+        "preflight_s": _total(executions, "preflight_s"),
+        "debug_attempts": len(report.get("debug_attempts", [])),
+        "stages": metrics["stages"],
+        "llm": llm,
+        "executions": executions,
+    }
+
+
+#################################### Export ####################################
+PROMETHEUS_HELP = {
+    "gag_turns_total": ("counter", "Tours de pipeline terminés"),
+    "gag_turn_seconds": ("summary", "Durée totale des tours de pipeline"),
+    "gag_stage_seconds": ("summary", "Durée des étapes de la pipeline"),
+    "gag_llm_calls_total": ("counter", "Appels aux agents (cached=true : réponse servie par le cache)"),
+    "gag_llm_seconds": ("summary", "Latence des appels aux agents"),
+    "gag_llm_fallbacks_total": ("counter", "Appels abandonnés pour dépassement du budget de latence, refaits au niveau de repli"),
+    "gag_llm_tokens_total": ("counter", "Jetons envoyés (prompt) et reçus (completion) par agent"),
+    "gag_exec_seconds": ("summary", "Temps réel des exécutions de scripts"),
+    "gag_exec_cpu_seconds_total": ("counter", "Temps CPU des exécutions de scripts"),
+    "gag_debug_attempts_total": ("counter", "Appels au debugger"),
+}
+
+
+class MetricsExporter:
+    """
+    Export des tours de pipeline : une ligne JSON par tour (jsonl_path) et des compteurs
+    cumulés réécrits au format texte Prometheus (prometheus_path), à faire lire par le
+    collecteur textfile de node_exporter. Les compteurs repartent de zéro au redémarrage.
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._values = {}  # (nom, étiquettes) -> valeur
+        self._lock = threading.Lock()
+        for path in (jsonl_path, prometheus_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, turn):
+        with self._lock:
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(turn, ensure_ascii=False, default=str) + "\n")
+            if self.prometheus_path:
+                self._aggregate(turn)
+                self._write_prometheus()
+
+    def _add(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._values[key] = self._values.get(key, 0) + (value or 0)
+
+    def _observe(self, name, value, **labels):
+        self._add(name + "_sum", value, **labels)
+        self._add(name + "_count", 1, **labels)
+
+    def _aggregate(self, turn):
+        pipeline = turn["pipeline"] or "inconnue"
+        self._add("gag_turns_total", 1, pipeline=pipeline, success=str(turn["success"]).lower())
+        self._observe("gag_turn_seconds", turn["total_s"], pipeline=pipeline)
+        for s in turn["stages"]:
+            self._observe("gag_stage_seconds", s.get("duration_s"), stage=s["stage"])
+        for call in turn["llm"]:
+            self._add("gag_llm_calls_total", 1, agent=call["agent"], cached=str(call["cached"]).lower())
+            if call.get("timed_out"):
+                self._add("gag_llm_fallbacks_total", 1, agent=call["agent"], model=call.get("model") or "inconnu")
+            if not call["cached"]:
+                self._observe("gag_llm_seconds", call["latency_s"], agent=call["agent"], model=call.get("model") or "inconnu")
+                self._add("gag_llm_tokens_total", call["prompt_tokens"], agent=call["agent"], kind="prompt")
+                self._add("gag_llm_tokens_total", call["completion_tokens"], agent=call["agent"], kind="completion")
+        for execution in turn["executions"]:
+            mode = execution.get("mode", "inconnu")
+            self._observe("gag_exec_seconds", execution.get("wall_s"), mode=mode)
+            self._add("gag_exec_cpu_seconds_total", execution.get("cpu_s"), mode=mode)
+        self._add("gag_debug_attempts_total", turn["debug_attempts"])
+
+    def _write_prometheus(self):
+        lines = []
+        for name, (kind, help_text) in PROMETHEUS_HELP.items():
+            samples = sorted((k, v) for k, v in self._values.items()
+                             if k[0] == name or (kind == "summary" and k[0] in (name + "_sum", name + "_count")))
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (sample, labels), value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{sample}{{{label_text}}} {round(value, 6)}" if label_text
+                             else f"{sample} {round(value, 6)}")
+        # Écriture atomique : le collecteur ne lit jamais un fichier à moitié écrit
+        tmp_path = self.prometheus_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
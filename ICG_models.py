@@ -0,0 +1,89 @@
+import asyncio
+
+# Modèles par agent. Chaque agent peut avoir son propre modèle (section LLM_AGENTS.<agent> :
+# model, temperature, max_tokens, base_url) et un budget de latence par appel (budget_s).
+# Un appel qui dépasse son budget est abandonné et refait avec le niveau de repli
+# (fallback : nom d'une section LLM_TIERS, qui peut avoir à son tour un budget et un repli).
+# Les valeurs absentes sont celles du modèle par défaut (LLM_MODEL, LLM_TEMPERATURE...).
+
+AGENTS = ("interpreteur", "codeur", "verificateur", "debugger", "modificateur", "modificateur_patch")
+# Clés reconnues dans une section d'agent ou de niveau
+MODEL_KEYS = ("model", "temperature", "max_tokens", "base_url", "budget_s", "fallback")
+
+
+class BudgetExceeded(TimeoutError):
+    """Un appel au modèle a dépassé le budget de latence de son niveau"""
+
+
+def is_timeout(error):
+    """Dépassement de budget : délai du client HTTP, de asyncio.wait_for ou vérifié pendant le streaming"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    try:
+        from openai import APITimeoutError
+    except ImportError:
+        return False
+    return isinstance(error, APITimeoutError)
+
+
+def build_model(config):
+    """ChatOpenAI décrit par une configuration complète (voir ModelTiers)"""
+    from langchain_openai import ChatOpenAI
+
+    kwargs = {"api_key": config["api_key"], "model": config["model"], "temperature": float(config["temperature"])}
+    if config.get("max_tokens"):
+        kwargs["max_tokens"] = int(config["max_tokens"])
+    if config.get("base_url"):
+        # Endpoint compatible OpenAI (vLLM, Ollama, llama.cpp...) pour comparer les niveaux hors ligne
+        kwargs["base_url"] = config["base_url"]
+    if config.get("budget_s"):
+        # Le délai du client borne l'attente de la réponse ; pas de nouvel essai au même niveau
+        kwargs["timeout"] = float(config["budget_s"])
+        kwargs["max_retries"] = 0
+    return ChatOpenAI(**kwargs)
+
+
+class ModelTiers:
+    """
+    Modèles des agents, construits à la première utilisation et partagés entre agents de
+    même configuration. tiers(agent) donne la suite (modèle, budget) à essayer dans l'ordre.
+    """
+
+    def __init__(self, default, agents=None, tiers=None, build=build_model):
+        self.default = default
+        self.agents = {name: dict(section) for name, section in (agents or {}).items()}
+        self.tier_sections = {name: dict(section) for name, section in (tiers or {}).items()}
+        self._build = build
+        self._models = {}  # configuration -> modèle
+        # Erreurs de configuration signalées au démarrage plutôt qu'au premier appel
+        for name in self.agents:
+            if name not in AGENTS:
+                raise ValueError(f"Agent inconnu dans LLM_AGENTS : {name} (agents : {', '.join(AGENTS)})")
+        for name, section in {**self.agents, **self.tier_sections}.items():
+            unknown = set(section) - set(MODEL_KEYS)
+            if unknown:
+                raise ValueError(f"Clés inconnues pour {name} : {', '.join(sorted(unknown))}")
+            if section.get("fallback") and section["fallback"] not in self.tier_sections:
+                raise ValueError(f"Niveau de repli inconnu pour {name} : {section['fallback']} (absent de LLM_TIERS)")
+
+    def _model(self, config):
+        key = tuple(sorted((k, v) for k, v in config.items() if k != "fallback"))
+        if key not in self._models:
+            self._models[key] = self._build(config)
+        return self._models[key]
+
+    def tiers(self, agent):
+        """
+        Returns:
+            list: [(modèle, budget en secondes ou None)], l'agent puis ses replis successifs
+        """
+        section, seen, chain = self.agents.get(agent, {}), set(), []
+        while True:
+            config = {**self.default, **section}
+            chain.append((self._model(config), float(config["budget_s"]) if config.get("budget_s") else None))
+            fallback = section.get("fallback")
+            if not fallback or fallback in seen:
+                return chain
+            seen.add(fallback)
+            section = self.tier_sections[fallback]
+
@@ -0,0 +1,116 @@
+import ast
+import re
+
+# Modifications ciblées renvoyées par le modificateur en mode "patch", au lieu du script complet.
+# Deux formats sont acceptés :
+#   - blocs de remplacement :
+#         <<<<<<< AVANT
+#         lignes du code actuel
+#         =======
+#         nouvelles lignes
+#         >>>>>>> APRÈS
+#   - diff unifié (lignes " ", "-" et "+" des sections @@)
+
+BLOCK = re.compile(r"^<{5,}[^\n]*\n(.*?)^={5,}[^\n]*\n(.*?)^>{5,}[^\n]*$", re.M | re.S)
+
+
+class PatchError(ValueError):
+    """Le correctif ne s'applique pas proprement : le script complet doit être régénéré"""
+
+
+#################################### Lecture du correctif ####################################
+def _trim(lines):
+    # Lignes vides en bordure de bloc : sans effet sur le code, souvent ajoutées par le modèle
+    while lines and not lines[0].strip():
+        lines = lines[1:]
+    while lines and not lines[-1].strip():
+        lines = lines[:-1]
+    return lines
+
+
+def _diff_edits(text):
+    edits, old, new, in_hunk = [], [], [], False
+
+    def flush():
+        if old or new:
+            edits.append((old[:], new[:]))
+        old.clear()
+        new.clear()
+
+    for line in text.splitlines():
+        if line.startswith("@@"):
+            flush()
+            in_hunk = True
+        elif not in_hunk:
+            continue
+        elif line.startswith("+"):
+            new.append(line[1:])
+        elif line.startswith("-"):
+            old.append(line[1:])
+        elif line.startswith(" ") or not line:
+            old.append(line[1:])
+            new.append(line[1:])
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        else:
+            # Fin de la section (balise ```, texte...)
+            flush()
+            in_hunk = False
+    flush()
+    return edits
+
+
+def parse_patch(text):
+    """
+    Liste des modifications (lignes à remplacer, nouvelles lignes) contenues dans la réponse.
+
+    Raises:
+        PatchError: Aucune modification reconnue
+    """
+    edits = [(old.splitlines(), new.splitlines()) for old, new in BLOCK.findall(text)]
+    if not edits:
+        edits = _diff_edits(text)
+    edits = [(_trim(old), _trim(new)) for old, new in edits]
+    if not edits:
+        raise PatchError("aucune modification reconnue dans la réponse")
+    return edits
+
+
+#################################### Application ####################################
+def _locate(lines, old):
+    # Correspondance ligne à ligne, aux espaces de fin de ligne près
+    target = [line.rstrip() for line in old]
+    stripped = [line.rstrip() for line in lines]
+    return [i for i in range(len(lines) - len(old) + 1) if stripped[i:i + len(old)] == target]
+
+
+def apply_patch(code, text):
+    """
+    Applique les modifications de la réponse au code, dans l'ordre. Chaque bloc à remplacer
+    doit apparaître exactement une fois ; le résultat doit compiler et différer du code initial.
+
+    Returns:
+        str: Le code modifié
+
+    Raises:
+        PatchError: Correctif illisible, ambigu ou introuvable, ou code résultant invalide
+    """
+    lines = code.splitlines()
+    for n, (old, new) in enumerate(parse_patch(text), 1):
+        if not old:
+            raise PatchError(f"modification {n} : aucune ligne du code actuel pour la situer")
+        matches = _locate(lines, old)
+        if len(matches) != 1:
+            where = "introuvables" if not matches else f"présentes {len(matches)} fois"
+            raise PatchError(f"modification {n} : lignes à remplacer {where} dans le code actuel")
+        start = matches[0]
+        lines[start:start + len(old)] = new
+
+    patched = "\n".join(lines) + "\n"
+    if patched.strip() == code.strip():
+        raise PatchError("le correctif ne change pas le code")
+    try:
+        ast.parse(patched)
+    except SyntaxError as e:
+        raise PatchError(f"code modifié invalide : {e.msg} (ligne {e.lineno})") from e
+    return patched
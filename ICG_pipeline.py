@@ -0,0 +1,971 @@
+import asyncio
+import contextlib
+import copy
+import tempfile
+import time
+
+from ICG_cache import DiskCache, response_key
+from ICG_code import CodeStream, extract_code
+from ICG_decimation import METHODS as DECIMATION_METHODS
+from ICG_executor import DEFAULT_LIMITS, WorkerPool, error_signature, execute_code
+from ICG_jobs import JobCancelled
+from ICG_models import BudgetExceeded, ModelTiers, is_timeout
+from ICG_metrics import MetricsExporter, new_metrics, record_execution, record_llm_call, stage, summarize_turn, token_usage
+from ICG_patch import PatchError, apply_patch
+from ICG_quickedit import quick_edit
+from ICG_utils import read_data, cache_dataframe, describe_data, section_budget, verificateur_context, interpreteur_context, codeur_context, debugger_context
+
+#################################### Ressources partagées ####################################
+def make_llm(settings):
+    """
+    Modèles des agents décrits par les réglages : modèle par défaut (OPENAI_API_KEY, OPENAI_BASE_URL,
+    LLM_MODEL, LLM_TEMPERATURE, LLM_MAX_TOKENS), sections LLM_AGENTS et LLM_TIERS (voir ICG_models).
+    None sans clé d'API ni endpoint local.
+    """
+    api_key = settings.get("OPENAI_API_KEY", "")
+    base_url = settings.get("OPENAI_BASE_URL", "")
+    if not api_key and not base_url:
+        return None
+    default = {
+        # Les serveurs locaux compatibles OpenAI acceptent en général n'importe quelle clé
+        "api_key": api_key or "local",
+        "base_url": base_url or None,
+        "model": settings.get("LLM_MODEL", "gpt-4o-mini"),
+        "temperature": float(settings.get("LLM_TEMPERATURE", 0.7)),
+        "max_tokens": settings.get("LLM_MAX_TOKENS"),
+    }
+    return ModelTiers(default, settings.get("LLM_AGENTS", {}), settings.get("LLM_TIERS", {}))
+
+def execution_limits(settings):
+    """Limites de temps, CPU, mémoire et taille de fichier de chaque exécution (réglages EXEC_*)"""
+    return {
+        "timeout": float(settings.get("EXEC_TIMEOUT_S", DEFAULT_LIMITS["timeout"])),
+        "cpu_seconds": int(settings.get("EXEC_CPU_S", DEFAULT_LIMITS["cpu_seconds"])),
+        "memory_mb": int(settings.get("EXEC_MEMORY_MB", DEFAULT_LIMITS["memory_mb"])),
+        "file_size_mb": int(settings.get("EXEC_FILE_SIZE_MB", DEFAULT_LIMITS["file_size_mb"])),
+    }
+
+def make_worker_pool(settings, size=None):
+    """
+    Pool de workers d'exécution des scripts (EXECUTOR_WORKERS workers si size est None).
+    Une taille de 0 désactive le pool : exécution à froid, un python par script.
+    """
+    size = int(settings.get("EXECUTOR_WORKERS", 2)) if size is None else size
+    if size <= 0:
+        return None
+    try:
+        return WorkerPool(size, execution_limits(settings))
+    except Exception as e:
+        print(f"Pool de workers indisponible, exécution à froid: {e}")
+        return None
+
+def make_response_cache(settings):
+    """
+    Cache disque des réponses des agents.
+    RESPONSE_CACHE_MAX_MB = 0 désactive le cache.
+    """
+    max_mb = float(settings.get("RESPONSE_CACHE_MAX_MB", 100))
+    if max_mb <= 0:
+        return None
+    return DiskCache(
+        settings.get("RESPONSE_CACHE_DIR", ".gag_cache/responses"),
+        max_bytes=int(max_mb * 1024 * 1024),
+        max_age=float(settings.get("RESPONSE_CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600,
+    )
+
+def make_render_cache(settings):
+    """
+    Cache disque des rendus (PNG et log) par script normalisé, données et versions des bibliothèques.
+    RENDER_CACHE_MAX_MB = 0 désactive le cache.
+    """
+    max_mb = float(settings.get("RENDER_CACHE_MAX_MB", 200))
+    if max_mb <= 0:
+        return None
+    return DiskCache(
+        settings.get("RENDER_CACHE_DIR", ".gag_cache/renders"),
+        max_bytes=int(max_mb * 1024 * 1024),
+        max_age=float(settings.get("RENDER_CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600,
+    )
+
+def make_metrics(settings):
+    """
+    Export des mesures de chaque tour : METRICS_JSONL (une ligne JSON par tour) et/ou
+    METRICS_PROMETHEUS (fichier texte pour le collecteur textfile). None si aucun n'est configuré.
+    """
+    jsonl_path = settings.get("METRICS_JSONL", "")
+    prometheus_path = settings.get("METRICS_PROMETHEUS", "")
+    if not jsonl_path and not prometheus_path:
+        return None
+    return MetricsExporter(jsonl_path or None, prometheus_path or None)
+
+
+class Runtime:
+    """
+    Ressources partagées par les pipelines, indépendantes de l'interface : réglages
+    (secrets Streamlit ou fichier TOML), caches des réponses et des rendus, pool de workers,
+    affichage de la progression (st.spinner dans l'application, rien en batch)
+    et export des mesures. Avec preview, les rendus de la pipeline sont des aperçus
+    légers et la pleine qualité passe par export().
+    """
+
+    def __init__(self, settings=None, cache=None, pool=None, progress=None, metrics=None, render_cache=None,
+                 preview=True):
+        self.settings = settings if settings is not None else {}
+        self.cache = cache
+        self.render_cache = render_cache
+        self.preview = preview
+        self.cancel = None  # threading.Event d'annulation du job en cours (voir for_job)
+        self.pool = pool
+        self.metrics = metrics
+        self.limits = execution_limits(self.settings)
+        self.progress = progress or (lambda message: contextlib.nullcontext())
+
+    def for_job(self, job):
+        """
+        Copie liée à un job d'arrière-plan (ICG_jobs.Job) : la progression est rapportée au job
+        et son annulation est vérifiée à chaque étape et pendant chaque exécution
+        """
+        bound = copy.copy(self)
+        bound.progress = job.progress
+        bound.cancel = job.cancel_event
+        return bound
+
+    def check_cancelled(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise JobCancelled()
+
+    @contextlib.contextmanager
+    def step(self, report, name, message):
+        """Étape de la pipeline : message de progression et horodatages dans le rapport"""
+        self.check_cancelled()
+        with self.progress(message), stage(report, name):
+            yield
+
+    def get(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def decimation_options(self, lecteur_output):
+        """
+        Réduction automatique des séries longues (plot/scatter) quand le fichier dépasse
+        DECIMATION_ROWS lignes. DECIMATION_METHOD : "lttb", "minmax" ou "none".
+        """
+        threshold = int(self.get("DECIMATION_ROWS", 200_000))
+        method = self.get("DECIMATION_METHOD", "lttb")
+        if method not in DECIMATION_METHODS or lecteur_output["shape"][0] <= threshold:
+            return None
+        return {"threshold": threshold, "n_out": int(self.get("DECIMATION_POINTS", 4000)), "method": method}
+
+    def preview_options(self):
+        """
+        Aperçu des rendus de la pipeline : résolution plafonnée à PREVIEW_DPI et PNG à palette
+        au-delà de PREVIEW_MAX_KB (0 = réglage du script). None sans aperçu.
+        """
+        if not self.preview:
+            return None
+        options = {"max_dpi": int(self.get("PREVIEW_DPI", 100)), "max_kb": int(self.get("PREVIEW_MAX_KB", 300))}
+        options = {k: v for k, v in options.items() if v > 0}
+        return options or None
+
+    def export(self, code, data, decimation, fmt):
+        """
+        Rendu pleine qualité du script final au format fmt (ICG_render.EXPORT_FORMATS), à au moins
+        EXPORT_DPI pour le PNG, dans un dossier temporaire : un rendu en cours dans le dossier
+        de la session n'est pas perturbé.
+
+        Returns:
+            dict: Le résultat d'execute_code, "figure" contenant le fichier exporté
+        """
+        render = {"format": fmt, "min_dpi": int(self.get("EXPORT_DPI", 300))}
+        with tempfile.TemporaryDirectory(prefix="gag_export_") as workdir:
+            return execute_code(code, workdir, self.pool, self.limits, data, decimation, cache=self.render_cache,
+                                render=render)
+
+    def context_budget(self):
+        """
+        Taille maximale de chaque prompt, en jetons estimés (CONTEXT_MAX_TOKENS, 0 = illimitée) :
+        les métadonnées des fichiers larges et les logs d'erreur sont résumés pour y tenir
+        """
+        budget = int(self.get("CONTEXT_MAX_TOKENS", 8000))
+        return budget if budget > 0 else None
+
+    def debug_settings(self):
+        """Nombre maximal de tentatives du debugger et budget de temps total de la boucle (DEBUG_*)"""
+        return int(self.get("DEBUG_MAX_ATTEMPTS", 3)), float(self.get("DEBUG_BUDGET_S", 180))
+
+    def rerender_policy(self, verificateur_output, log):
+        """
+        Décide si un rapport de non-conformité doit déclencher un nouveau rendu.
+        Par défaut le rapport est seulement informatif ; RERENDER_ON_NONCONFORMITY = true
+        fait corriger le code par le debugger puis le réexécute.
+        Un rendu en erreur n'est pas concerné (le debugger est déjà passé).
+        """
+        return bool(self.get("RERENDER_ON_NONCONFORMITY", False)) and not log
+
+    def runner(self, workdir, data, decimation, columns, report=None):
+        """
+        Coroutine code -> résultat d'execute_code, avec les paramètres de la pipeline.
+        Chaque exécution est ajoutée aux mesures du rapport.
+        """
+        async def run(code):
+            start = time.time()
+            result = await asyncio.to_thread(execute_code, code, workdir, self.pool, self.limits, data, decimation,
+                                           columns, cache=self.render_cache, render=self.preview_options(),
+                                           cancel=self.cancel)
+            record_execution(report, start, result)
+            # Un script interrompu par l'annulation ne doit pas partir au debugger
+            self.check_cancelled()
+            return result
+        return run
+
+    def record_turn(self, report, success):
+        """Synthèse des mesures du tour (report["metrics"]["summary"]) et export éventuel"""
+        turn = summarize_turn(report, success)
+        report.setdefault("metrics", new_metrics())["summary"] = {
+            k: v for k, v in turn.items() if k not in ("stages", "llm", "executions")
+        }
+        if self.metrics is not None:
+            try:
+                self.metrics.record(turn)
+            except OSError as e:
+                print(f"Export des mesures impossible: {e}")
+
+
+def forget_cached_responses(runtime, report):
+    """Retire du cache les réponses ayant mené à un échec, pour qu'un nouvel essai rappelle le LLM"""
+    if runtime.cache is not None and report.get("cache_keys"):
+        runtime.cache.delete(report["cache_keys"])
+
+#################################### Contextes des agents ####################################
+INTERPRETER_CONTEXT = """
+Tu es un interpréteur scientifique spécialisé en physique.
+
+Ton rôle est d'analyser la demande utilisateur concernant l'affichage
+de graphique et de produire une structure JSON.
+
+Ne génère pas de code, ne fais aucune explication textuelle, écris seulement le JSON.
+"""
+
+CODEUR_CONTEXT = """
+Tu es un générateur de code scientifique Python.
+
+À partir d'une description structurée en JSON, tu dois produire
+un code clair, commenté et autonome utilisant numpy, matplotlib et seaborn.
+Le code doit produire un graphique physique cohérent.
+Attention à bien afficher toutes les grandeurs demandées et les légendes.
+
+Bibliothèques disponibles :
+- matplotlib.pyplot (plt) : pour les graphiques standards
+- seaborn (sns) : pour les graphiques statistiques élégants (distribution, heatmap, pairplot, etc.)
+- pandas (pd) : pour la manipulation des données
+- numpy (np) : pour les calculs numériques
+
+Ne fais aucune explication textuelle : écris seulement le code Python.
+Ta réponse doit pouvoir être directement exécutée donc ne renvoie que
+du code python pur !
+
+Les données sont DÉJÀ chargées dans un DataFrame pandas nommé df.
+Ne relis pas le fichier (pas de pd.read_csv ni de pd.read_excel) : utilise directement df.
+
+Tu peux utiliser seaborn pour créer des graphiques plus esthétiques quand c'est approprié.
+N'oublie pas d'importer seaborn si tu l'utilises : import seaborn as sns
+
+Sauvegarde le graphique dans le dossier de travail sous le nom graphique.png
+
+IMPORTANT : N'utilise PAS plt.show() car le code s'exécute en mode non-interactif.
+Utilise seulement plt.savefig('graphique.png') puis plt.close()
+"""
+
+VERIFICATEUR_CONTEXT = """
+Tu es un vérificateur de code python.
+
+Tu compares la demande initiale, la structure JSON et le code généré.
+
+Tu évalues la cohérence physique, conceptuelle et graphique.
+
+Tu vérifies que le code affiche toutes les grandeurs demandées.
+
+Tu fais attention à ce que le code ne contienne pas de texte qui n'est pas du code.
+
+Tu rends un rapport JSON ayant la même structure que celui ci-dessous mais avec tes corrections
+
+Ne réécris pas le code, ne fais aucune explication textuelle,
+
+rend uniquement un JSON si le code n'est pas conforme sinon ne renvoie qu'un message disant 'CODE CONFORME'
+"""
+
+DEBUGGER_CONTEXT = """
+Tu es un agent spécialisé dans le débogage de code Python scientifique.
+
+Ton rôle intervient après l'exécution du code :
+- Si le code a échoué à l'exécution, tu reçois le code source et le message d'erreur.
+- Tu dois identifier précisément la cause de l'erreur et corriger le code en conséquence.
+
+Règles impératives :
+1. Ta sortie doit contenir uniquement le code Python corrigé (aucun texte explicatif).
+2. Ne modifie pas le contenu au-delà de ce qui est nécessaire pour corriger l'erreur.
+3. Si plusieurs corrections sont possibles, choisis la plus simple et robuste.
+4. Si une information est manquante pour corriger l'erreur, laisse "???" et ajoute un commentaire dans le code à cet endroit.
+5. Ne reformate pas entièrement le fichier : conserve le style existant.
+6. N'ajoute ni préambule, ni conclusion, ni phrase du type "Voici le code corrigé".
+7. Le DataFrame df est fourni par l'environnement d'exécution : ne le redéfinis pas
+   en relisant le fichier de données.
+8. Si le log indique "LIMITE DÉPASSÉE" (temps, CPU ou mémoire), ne relance pas le même calcul :
+   allège-le (sous-échantillonnage des données, agrégation, moins de points ou de sous-graphiques).
+9. Si le log commence par "Contrôle avant exécution", le script n'a pas été lancé : corrige
+   chaque ligne signalée (par exemple en utilisant une des colonnes disponibles listées).
+
+Tu renvoies uniquement le code corrigé, sans aucun texte autour.
+"""
+
+MODIFICATEUR_CONTEXT = """
+Tu es un agent spécialisé dans la modification de code Python scientifique pour matplotlib et seaborn.
+
+Ton rôle est de MODIFIER le code existant selon la nouvelle demande de l'utilisateur.
+
+IMPORTANT : Tu travailles sur un code DÉJÀ FONCTIONNEL. Tu dois :
+1. Conserver toute la structure existante du code (imports, chargement des données, etc.)
+2. MODIFIER uniquement les parties nécessaires pour répondre à la nouvelle demande
+3. AJOUTER les éléments demandés sans supprimer ce qui fonctionne déjà
+4. Maintenir la cohérence du style de code
+5. Tu peux utiliser seaborn (sns) si cela améliore le graphique
+
+Exemples de modifications possibles avec matplotlib :
+- Changer les couleurs : modifier les paramètres color= dans plt.plot()
+- Ajouter des lignes : ajouter plt.axvline() ou plt.axhline()
+- Modifier les titres/labels : changer plt.title(), plt.xlabel(), plt.ylabel()
+- Ajouter des courbes : ajouter de nouveaux plt.plot()
+- Changer le style : modifier linestyle=, marker=, linewidth=
+- Modifier les échelles : ajouter plt.xlim(), plt.ylim()
+- Ajouter des annotations : ajouter plt.text(), plt.annotate()
+
+Exemples de modifications possibles avec seaborn :
+- Passer de matplotlib à seaborn : remplacer plt.plot() par sns.lineplot()
+- Ajouter un style seaborn : sns.set_style(), sns.set_palette()
+- Créer des graphiques statistiques : sns.boxplot(), sns.violinplot(), sns.heatmap()
+- Améliorer l'esthétique : utiliser seaborn pour des graphiques plus élégants
+
+Règles impératives :
+1. Ta sortie doit contenir UNIQUEMENT le code Python complet modifié
+2. NE génère AUCUN texte explicatif, AUCUN commentaire sur les modifications
+3. Le code doit être directement exécutable
+4. CONSERVE plt.savefig('graphique.png') et plt.close() à la fin
+5. N'utilise PAS plt.show()
+6. Si tu ajoutes seaborn, n'oublie pas d'ajouter l'import : import seaborn as sns
+7. Si la demande n'est pas claire, fais une modification raisonnable
+8. Les données sont déjà chargées dans le DataFrame df : si le code relit le fichier
+   (pd.read_csv, pd.read_excel), remplace cette lecture par df
+
+Tu renvoies UNIQUEMENT le code Python modifié complet, sans aucun texte autour.
+"""
+
+MODIFICATEUR_PATCH_CONTEXT = """
+Tu es un agent spécialisé dans la modification de code Python scientifique pour matplotlib et seaborn.
+
+Ton rôle est de MODIFIER le code existant selon la nouvelle demande de l'utilisateur,
+en renvoyant UNIQUEMENT les passages modifiés, sous forme de blocs de remplacement :
+
+<<<<<<< AVANT
+lignes du code actuel à remplacer
+=======
+nouvelles lignes
+>>>>>>> APRÈS
+
+Règles impératives :
+1. Le bloc AVANT recopie à l'identique (indentation comprise) des lignes consécutives du code
+   actuel, assez nombreuses pour n'apparaître qu'une seule fois dans le code.
+2. Pour ajouter des lignes, recopie dans AVANT la ligne qui les précède, puis répète-la
+   dans le remplacement suivie des lignes ajoutées.
+3. Pour supprimer des lignes, laisse le remplacement vide.
+4. Autant de blocs que nécessaire, dans l'ordre du code. Ne renvoie PAS le script complet
+   et n'écris aucun texte explicatif.
+5. CONSERVE plt.savefig('graphique.png') et plt.close() ; n'utilise PAS plt.show().
+6. Si tu ajoutes seaborn, ajoute aussi l'import : import seaborn as sns
+7. Les données sont déjà chargées dans le DataFrame df : ne relis pas le fichier.
+"""
+
+#################################### Fonctions des agents ####################################
+def agent_tiers(llm, agent):
+    """(modèle, budget de latence en secondes ou None) à essayer dans l'ordre pour un agent"""
+    tiers = getattr(llm, "tiers", None)
+    return tiers(agent) if tiers is not None else [(llm, None)]
+
+def _model_name(model):
+    return getattr(model, "model_name", None)
+
+def _lookup_response(llm, agent, agent_input, report, cache):
+    # Renvoie (cache, clé, réponse en cache ou None) ; cache vaut None si désactivé
+    key = cached = None
+    if cache is not None:
+        key = response_key(agent, _model_name(llm), getattr(llm, "temperature", None), agent_input)
+        cached = cache.get(key)
+        if report is not None:
+            report.setdefault("cache_keys", []).append(key)
+            report.setdefault("cache", {})[agent] = "hit" if cached is not None else "miss"
+    if report is not None and cached is None:
+        # Appels effectifs au modèle (hors réponses servies par le cache)
+        report["llm_calls"] = report.get("llm_calls", 0) + 1
+    if cached is not None:
+        record_llm_call(report, agent, time.time(), agent_input, cached.decode("utf-8"), cached=True, model=_model_name(llm))
+    return cache, key, None if cached is None else cached.decode("utf-8")
+
+def _record_fallback(report, agent, model, tier, start, agent_input):
+    # Appel abandonné pour dépassement du budget : sa latence compte, l'agent repart au niveau suivant
+    record_llm_call(report, agent, start, agent_input, model=_model_name(model), tier=tier, timed_out=True)
+    if report is not None:
+        report["llm_calls"] = report.get("llm_calls", 0) + 1
+        report.setdefault("fallbacks", {})[agent] = tier + 1
+
+def _with_fallback(llm, agent, agent_input, report, call):
+    """
+    call(modèle, budget, niveau) pour l'agent, puis pour ses niveaux de repli tant que
+    l'appel dépasse son budget de latence. Le dernier niveau n'a pas de repli : son
+    dépassement est une erreur.
+
+    Returns:
+        tuple: (résultat de call, niveau qui a répondu)
+    """
+    tiers = agent_tiers(llm, agent)
+    for tier, (model, budget) in enumerate(tiers):
+        start = time.time()
+        try:
+            return call(model, budget, tier), tier
+        except Exception as e:
+            if tier == len(tiers) - 1 or not is_timeout(e):
+                raise
+            _record_fallback(report, agent, model, tier, start, agent_input)
+
+async def _awith_fallback(llm, agent, agent_input, report, call):
+    """Version asynchrone de _with_fallback (call est une coroutine)"""
+    tiers = agent_tiers(llm, agent)
+    for tier, (model, budget) in enumerate(tiers):
+        start = time.time()
+        try:
+            return await call(model, budget, tier), tier
+        except Exception as e:
+            if tier == len(tiers) - 1 or not is_timeout(e):
+                raise
+            _record_fallback(report, agent, model, tier, start, agent_input)
+
+def _cacheable(cache, tier):
+    # La clé est celle du modèle de l'agent : la réponse d'un niveau de repli, obtenue
+    # faute de temps, n'est pas gardée (elle serait resservie comme celle du modèle)
+    return cache is not None and tier == 0
+
+def _check_budget(start, budget):
+    # Budget vérifié entre deux morceaux du flux ; le délai du client couvre l'attente d'un morceau
+    if budget is not None and time.time() - start > budget:
+        raise BudgetExceeded(f"budget de {budget:g} s dépassé")
+
+def invoke_agent(llm, agent, agent_input, report=None, cache=None):
+    """
+    Appelle le LLM pour un agent, en passant par le cache des réponses
+
+    Args:
+        llm: Le modèle de langage, ou les modèles par agent (ICG_models.ModelTiers)
+        agent: Le nom de l'agent (fait partie de la clé de cache)
+        agent_input: Le contexte complet envoyé au modèle
+        report: Le rapport de la pipeline, où sont notés les hits/miss et les clés utilisées
+        cache: Le cache des réponses (DiskCache), None pour forcer un appel au modèle
+
+    Returns:
+        str: Le contenu de la réponse
+    """
+    cache, key, cached = _lookup_response(agent_tiers(llm, agent)[0][0], agent, agent_input, report, cache)
+    if cached is not None:
+        return cached
+
+    def call(model, budget, tier):
+        start = time.time()
+        response = model.invoke(input=agent_input)
+        record_llm_call(report, agent, start, agent_input, response.content, token_usage(response),
+                        model=_model_name(model), tier=tier)
+        return response.content
+
+    content, tier = _with_fallback(llm, agent, agent_input, report, call)
+    if _cacheable(cache, tier):
+        cache.set(key, content.encode("utf-8"))
+    return content
+
+async def ainvoke_agent(llm, agent, agent_input, report=None, cache=None):
+    """Version asynchrone de invoke_agent (utilise llm.ainvoke)"""
+    cache, key, cached = _lookup_response(agent_tiers(llm, agent)[0][0], agent, agent_input, report, cache)
+    if cached is not None:
+        return cached
+
+    async def call(model, budget, tier):
+        start = time.time()
+        response = await asyncio.wait_for(model.ainvoke(input=agent_input), budget)
+        record_llm_call(report, agent, start, agent_input, response.content, token_usage(response),
+                        model=_model_name(model), tier=tier)
+        return response.content
+
+    content, tier = await _awith_fallback(llm, agent, agent_input, report, call)
+    if _cacheable(cache, tier):
+        cache.set(key, content.encode("utf-8"))
+    return content
+
+def stream_agent(llm, agent, agent_input, report=None, cache=None, on_code=None):
+    """
+    Appelle un agent générant du code en streaming.
+    Le code partiel est transmis à on_code ligne par ligne, et la réception s'arrête
+    dès la fermeture du bloc de code : le texte qui suit n'est pas attendu.
+    
+    Returns:
+        str: Le code nettoyé des balises markdown
+    """
+    cache, key, cached = _lookup_response(agent_tiers(llm, agent)[0][0], agent, agent_input, report, cache)
+    if cached is not None:
+        return extract_code(cached)
+
+    def call(model, budget, tier):
+        parser = CodeStream()
+        start, first_chunk, usage = time.time(), None, (None, None)
+        stream = model.stream(input=agent_input)
+        try:
+            for chunk in stream:
+                if first_chunk is None:
+                    first_chunk = time.time() - start
+                # Le comptage des jetons arrive dans le dernier morceau, perdu si le flux est interrompu
+                usage = token_usage(chunk) if getattr(chunk, "usage_metadata", None) else usage
+                if parser.feed(chunk.content):
+                    break
+                if "\n" in chunk.content:
+                    on_code(parser.code)
+                _check_budget(start, budget)
+        finally:
+            # Fermer le générateur interrompt la requête HTTP en cours
+            stream.close()
+        
+        record_llm_call(report, agent, start, agent_input, parser.text, usage,
+                        first_chunk_s=first_chunk, early_stop=parser.closed, model=_model_name(model), tier=tier)
+        return parser
+
+    parser, tier = _with_fallback(llm, agent, agent_input, report, call)
+    if report is not None:
+        report.setdefault("early_stop", {})[agent] = parser.closed
+    if _cacheable(cache, tier):
+        cache.set(key, parser.text.encode("utf-8"))
+    return parser.result()
+
+async def astream_agent(llm, agent, agent_input, report=None, cache=None, on_code=None):
+    """Version asynchrone de stream_agent (utilise llm.astream)"""
+    cache, key, cached = _lookup_response(agent_tiers(llm, agent)[0][0], agent, agent_input, report, cache)
+    if cached is not None:
+        return extract_code(cached)
+
+    async def call(model, budget, tier):
+        parser = CodeStream()
+        start, first_chunk, usage = time.time(), None, (None, None)
+        stream = model.astream(input=agent_input)
+        try:
+            async for chunk in stream:
+                if first_chunk is None:
+                    first_chunk = time.time() - start
+                usage = token_usage(chunk) if getattr(chunk, "usage_metadata", None) else usage
+                if parser.feed(chunk.content):
+                    break
+                if "\n" in chunk.content:
+                    on_code(parser.code)
+                _check_budget(start, budget)
+        finally:
+            await stream.aclose()
+        
+        record_llm_call(report, agent, start, agent_input, parser.text, usage,
+                        first_chunk_s=first_chunk, early_stop=parser.closed, model=_model_name(model), tier=tier)
+        return parser
+
+    parser, tier = await _awith_fallback(llm, agent, agent_input, report, call)
+    if report is not None:
+        report.setdefault("early_stop", {})[agent] = parser.closed
+    if _cacheable(cache, tier):
+        cache.set(key, parser.text.encode("utf-8"))
+    return parser.result()
+
+def interpreteur(llm, interpreteur_input, report=None, cache=None):
+    return invoke_agent(llm, "interpreteur", interpreteur_input, report, cache)
+
+def codeur(llm, codeur_input, report=None, cache=None, on_code=None):
+    if on_code is not None:
+        return stream_agent(llm, "codeur", codeur_input, report, cache, on_code)
+    return extract_code(invoke_agent(llm, "codeur", codeur_input, report, cache))
+
+def verificateur(llm, verificateur_input, report=None, cache=None):
+    return invoke_agent(llm, "verificateur", verificateur_input, report, cache)
+
+async def averificateur(llm, verificateur_input, report=None, cache=None):
+    return await ainvoke_agent(llm, "verificateur", verificateur_input, report, cache)
+
+def is_conforme(verificateur_output):
+    """Le vérificateur renvoie 'CODE CONFORME' si le code est valide, un JSON de corrections sinon"""
+    return "CODE CONFORME" in verificateur_output.upper()
+
+def debugger(llm, debugger_input, report=None, cache=None, on_code=None):
+    if on_code is not None:
+        return stream_agent(llm, "debugger", debugger_input, report, cache, on_code)
+    return extract_code(invoke_agent(llm, "debugger", debugger_input, report, cache))
+
+async def adebugger(llm, debugger_input, report=None, cache=None, on_code=None):
+    if on_code is not None:
+        return await astream_agent(llm, "debugger", debugger_input, report, cache, on_code)
+    return extract_code(await ainvoke_agent(llm, "debugger", debugger_input, report, cache))
+
+def modificateur_patch(llm, modificateur_input, report=None, cache=None):
+    """Agent qui renvoie seulement les modifications à appliquer au code existant"""
+    return invoke_agent(llm, "modificateur_patch", modificateur_input, report, cache)
+
+def modification_data(runtime, lecteur_output, user_prompt, previous_code, context):
+    """Métadonnées du fichier pour le modificateur : les colonnes citées par le code ou la demande restent détaillées"""
+    budget = section_budget(runtime.context_budget(), context, previous_code, user_prompt)
+    return describe_data(lecteur_output, user_prompt + "\n" + previous_code, budget)
+
+def modify_by_patch(llm, user_prompt, previous_code, data_description, report, cache=None):
+    """
+    Demande au modèle seulement les passages à modifier et les applique au code actuel.
+
+    Returns:
+        str: Le code modifié, ou None si le correctif ne s'applique pas proprement
+             (la raison est notée dans report["patch_error"])
+    """
+    patch_input = f"""{MODIFICATEUR_PATCH_CONTEXT}
+
+Voici le CODE ACTUEL :
+```python
+{previous_code}
+```
+
+Voici les MÉTADONNÉES du fichier de données :
+{data_description}
+
+Voici la NOUVELLE DEMANDE de l'utilisateur :
+{user_prompt}
+
+Ta tâche : Renvoie uniquement les blocs de remplacement qui intègrent cette demande.
+"""
+    patch_output = modificateur_patch(llm, patch_input, report, cache)
+    report["patch_output"] = patch_output
+    try:
+        return apply_patch(previous_code, patch_output)
+    except PatchError as e:
+        report["patch_error"] = str(e)
+        # Un correctif qui ne s'applique pas ne doit pas être resservi par le cache
+        if cache is not None:
+            cache.delete(report["cache_keys"][-1:])
+        return None
+
+def modificateur(llm, modificateur_input, report=None, cache=None, on_code=None):
+    """Agent qui modifie le code existant selon une nouvelle demande"""
+    if on_code is not None:
+        return stream_agent(llm, "modificateur", modificateur_input, report, cache, on_code)
+    return extract_code(invoke_agent(llm, "modificateur", modificateur_input, report, cache))
+
+#################################### Boucle de débogage ####################################
+async def adebug_loop(runtime, llm, result, run, report, cache=None, on_code=None):
+    """
+    Fait corriger le code par le debugger tant que son exécution échoue.
+    La boucle s'arrête après DEBUG_MAX_ATTEMPTS tentatives, quand le budget de temps
+    DEBUG_BUDGET_S est épuisé, ou quand une tentative reproduit une erreur déjà vue
+    (même type d'exception à la même ligne) : insister ne ferait que coûter des appels.
+    
+    Args:
+        result: Résultat d'execute_code de la première exécution (en échec)
+        run: Coroutine code -> résultat d'execute_code
+    
+    Returns:
+        dict: Résultat de la dernière exécution ; result["code"] est le dernier code exécuté
+    """
+    max_attempts, budget = runtime.debug_settings()
+    start = time.monotonic()
+    seen = {error_signature(result["log"])}
+    attempts = report.setdefault("debug_attempts", [])
+    
+    while result["log"] and len(attempts) < max_attempts:
+        if time.monotonic() - start >= budget:
+            report["debug_stop"] = "budget"
+            break
+        
+        t0 = time.monotonic()
+        debugger_input = debugger_context(DEBUGGER_CONTEXT, result["code"], result["log"], runtime.context_budget())
+        debugger_output = await adebugger(llm, debugger_input, report, cache, on_code)
+        t1 = time.monotonic()
+        result = await run(debugger_output)
+        signature = error_signature(result["log"])
+        attempts.append({
+            "llm_s": round(t1 - t0, 3),
+            "exec_s": round(time.monotonic() - t1, 3),
+            "error": result["error"],
+            "signature": signature,
+        })
+        report["debugger_output"] = debugger_output
+        report["log_debug"] = result["log"]
+        report["error_category"] = result["error"]
+        report["preflight_fixes"] += result["fixes"]
+        
+        if signature in seen:
+            report["debug_stop"] = "repeat"
+            break
+        seen.add(signature)
+    else:
+        if result["log"]:
+            report["debug_stop"] = "max_attempts"
+    return result
+
+#################################### Pipeline de génération ####################################
+def generate_chart_initial(runtime, llm, user_prompt, data_file_path, use_cache=True, policy=None, on_code=None, workdir=None, sheet=None):
+    """
+    Pipeline COMPLÈTE pour la première génération de graphique
+    
+    Returns:
+        tuple: (success: bool, chart: bytes, report: dict)
+    """
+    return asyncio.run(agenerate_chart_initial(runtime, llm, user_prompt, data_file_path, use_cache, policy, on_code, workdir, sheet))
+
+async def agenerate_chart_initial(runtime, llm, user_prompt, data_file_path, use_cache=True, policy=None, on_code=None, workdir=None, sheet=None):
+    """
+    Version asynchrone de la pipeline complète : la vérification (appel LLM)
+    tourne en parallèle de l'exécution du script, qu'elle ne conditionne pas.
+    
+    Args:
+        runtime: Les ressources partagées (Runtime) : réglages, cache, pool, progression
+        policy: Fonction (verificateur_output, log) -> bool appelée si le code est
+                jugé non conforme, qui décide s'il faut corriger et refaire le rendu
+                (Runtime.rerender_policy si None)
+        on_code: Si fourni, le code est reçu en streaming et transmis au fur et à mesure
+        workdir: Dossier de travail de la session, où les scripts sont exécutés
+        sheet: Feuille du classeur Excel à utiliser (la première si None)
+    
+    Returns:
+        tuple: (success: bool, chart: bytes, report: dict)
+    """
+    report = {"pipeline": "initial", "metrics": new_metrics()}
+    cache = runtime.cache if use_cache else None
+    policy = policy or runtime.rerender_policy
+    
+    try:
+        # Lecture du fichier de données
+        with runtime.step(report, "lecture", "📖 Lecture du fichier de données..."):
+            # Profil des colonnes (NaN, min/max, dates...) transmis à l'interpréteur et au codeur
+            lecteur_output = read_data(data_file_path, profile=runtime.get("COLUMN_PROFILE", True), sheet=sheet)
+            report["lecteur_output"] = lecteur_output
+            data = cache_dataframe(data_file_path, sheet=sheet)
+            decimation = runtime.decimation_options(lecteur_output)
+        
+        # Interprétation
+        with runtime.step(report, "interpreteur", "🧠 Interprétation de votre demande..."):
+            interpreteur_input = interpreteur_context(INTERPRETER_CONTEXT, user_prompt, lecteur_output, runtime.context_budget())
+            interpreteur_output = interpreteur(llm, interpreteur_input, report, cache)
+            report["interpreteur_output"] = interpreteur_output
+        
+        # Codage
+        with runtime.step(report, "codeur", "💻 Génération du code Python..."):
+            codeur_input = codeur_context(CODEUR_CONTEXT, interpreteur_output, lecteur_output, runtime.context_budget())
+            codeur_output = codeur(llm, codeur_input, report, cache, on_code)
+            report["codeur_output"] = codeur_output
+            report["clean_code"] = codeur_output  # Code nettoyé sans les balises markdown
+        
+        # Vérification et exécution du code en parallèle
+        with runtime.step(report, "verification_execution", "✅ Vérification du code et 🚀 génération du graphique..."):
+            verificateur_input = verificateur_context(VERIFICATEUR_CONTEXT, user_prompt, interpreteur_output, codeur_output,
+                                                     runtime.context_budget())
+            verification = asyncio.create_task(averificateur(llm, verificateur_input, report, cache))
+            
+            # Contrôle statique d'abord : une erreur certaine part au debugger sans lancer le script
+            run = runtime.runner(workdir, data, decimation, lecteur_output["columns"], report)
+            try:
+                result = await run(codeur_output)
+                log = result["log"]
+                report["log"] = log
+                report["error_category"] = result["error"]
+                report["preflight_fixes"] = result["fixes"]
+                
+                # Si erreur, boucle de débogage
+                if log:
+                    with runtime.step(report, "debug", "🔧 Débogage en cours..."):
+                        result = await adebug_loop(runtime, llm, result, run, report, cache, on_code)
+                        if result["log"]:
+                            return False, None, report
+                
+                # Le code conservé est celui qui a produit le graphique
+                codeur_output = report["clean_code"] = result["code"]
+                report["decimation"] = result["decimation"]
+                figure = result["figure"]
+                
+                verificateur_output = await verification
+                report["verificateur_output"] = verificateur_output
+            finally:
+                verification.cancel()
+            
+            # Code jugé non conforme : la politique décide s'il faut corriger et refaire le rendu
+            if not is_conforme(verificateur_output) and policy(verificateur_output, log):
+                with runtime.step(report, "rerender", "🔁 Correction selon le rapport du vérificateur..."):
+                    rerender_input = debugger_context(DEBUGGER_CONTEXT, codeur_output, verificateur_output, runtime.context_budget())
+                    rerender_output = await adebugger(llm, rerender_input, report, cache, on_code)
+                    result = await run(rerender_output)
+                    rerender_output = result["code"]
+                    report["rerender_output"] = rerender_output
+                    report["log_rerender"] = result["log"]
+                    
+                    # Un nouveau rendu en échec n'annule pas le premier, qui reste valide
+                    if not result["log"] and result["figure"] is not None:
+                        report["clean_code"] = rerender_output
+                        report["decimation"] = result["decimation"]
+                        figure = result["figure"]
+            
+            # Vérifier si le graphique a été créé
+            if figure is not None:
+                return True, figure, report
+            else:
+                return False, None, report
+                
+    except Exception as e:
+        report["error"] = str(e)
+        return False, None, report
+
+def generate_chart_modification(runtime, llm, user_prompt, previous_code, data_file_path, use_cache=True, on_code=None, workdir=None, sheet=None):
+    """
+    Pipeline SIMPLIFIÉE pour la modification d'un graphique existant
+    
+    Args:
+        runtime: Les ressources partagées (Runtime) : réglages, cache, pool, progression
+        llm: Le modèle de langage
+        user_prompt: La nouvelle demande de l'utilisateur
+        previous_code: Le code précédemment généré
+        data_file_path: Le chemin vers le fichier de données
+        use_cache: False pour ignorer le cache des réponses LLM
+        on_code: Si fourni, le code est reçu en streaming et transmis au fur et à mesure
+        workdir: Dossier de travail de la session, où les scripts sont exécutés
+        sheet: Feuille du classeur Excel à utiliser (la première si None)
+    
+    Returns:
+        tuple: (success: bool, chart: bytes, report: dict)
+    """
+    report = {"pipeline": "modification", "metrics": new_metrics()}
+    cache = runtime.cache if use_cache else None
+    
+    try:
+        # Lecture du fichier de données (pour avoir les métadonnées)
+        with stage(report, "lecture"):
+            lecteur_output = read_data(data_file_path, sheet=sheet)
+            report["lecteur_output"] = lecteur_output
+            data = cache_dataframe(data_file_path, sheet=sheet)
+            decimation = runtime.decimation_options(lecteur_output)
+        run = runtime.runner(workdir, data, decimation, lecteur_output["columns"], report)
+        
+        # Retouche de style reconnue (couleur, titre, axes...) : appliquée sans appel au modèle.
+        # Si le rendu échoue, la demande repart vers le modificateur comme les autres.
+        if runtime.get("LOCAL_EDITS", True):
+            with runtime.step(report, "retouche_locale", "⚡ Retouche du graphique..."):
+                local = quick_edit(previous_code, user_prompt)
+                if local is not None:
+                    if on_code is not None:
+                        on_code(local["code"])
+                    result = asyncio.run(run(local["code"]))
+                    if not result["log"] and result["figure"] is not None:
+                        report["modification_mode"] = "local"
+                        report["local_edit"] = local["description"]
+                        report["clean_code"] = result["code"]
+                        report["decimation"] = result["decimation"]
+                        return True, result["figure"], report
+                    report["local_edit_error"] = result["log"] or "aucun graphique produit"
+        
+        with runtime.step(report, "modificateur", "✏️ Modification du code existant..."):
+            # Mode "patch" : seuls les passages modifiés sont demandés au modèle, puis appliqués
+            # localement ; si le correctif ne s'applique pas, le script complet est régénéré
+            modificateur_output = None
+            if runtime.get("MODIFICATION_MODE", "patch") == "patch":
+                data_description = modification_data(runtime, lecteur_output, user_prompt, previous_code, MODIFICATEUR_PATCH_CONTEXT)
+                modificateur_output = modify_by_patch(llm, user_prompt, previous_code, data_description, report, cache)
+                if modificateur_output is not None:
+                    report["modification_mode"] = "patch"
+                    if on_code is not None:
+                        on_code(modificateur_output)
+            
+            if modificateur_output is None:
+                # Construction du contexte pour le modificateur
+                data_description = modification_data(runtime, lecteur_output, user_prompt, previous_code, MODIFICATEUR_CONTEXT)
+                modificateur_input = f"""{MODIFICATEUR_CONTEXT}
+
+Voici le CODE ACTUEL qui fonctionne :
+```python
+{previous_code}
+```
+
+Voici les MÉTADONNÉES du fichier de données :
+{data_description}
+
+Voici la NOUVELLE DEMANDE de l'utilisateur :
+{user_prompt}
+
+Ta tâche : Modifie le code ci-dessus pour intégrer cette nouvelle demande.
+Renvoie le code Python complet modifié, sans aucun texte explicatif.
+"""
+                
+                modificateur_output = modificateur(llm, modificateur_input, report, cache, on_code)
+                report["modification_mode"] = "full"
+            report["modificateur_output"] = modificateur_output
+            report["clean_code"] = modificateur_output
+        
+        # Exécution du code modifié
+        with runtime.step(report, "execution", "🚀 Exécution du code modifié..."):
+            result = asyncio.run(run(modificateur_output))
+            log = result["log"]
+            report["log"] = log
+            report["error_category"] = result["error"]
+            report["preflight_fixes"] = result["fixes"]
+            
+            # Si erreur, boucle de débogage
+            if log:
+                with runtime.step(report, "debug", "🔧 Débogage en cours..."):
+                    result = asyncio.run(adebug_loop(runtime, llm, result, run, report, cache, on_code))
+                    if result["log"]:
+                        return False, None, report
+            
+            # Code exécuté avec succès (débogué et corrigé par le contrôle le cas échéant)
+            report["clean_code"] = result["code"]
+            report["decimation"] = result["decimation"]
+            figure = result["figure"]
+            
+            # Vérifier si le graphique a été créé
+            if figure is not None:
+                return True, figure, report
+            else:
+                return False, None, report
+                
+    except Exception as e:
+        report["error"] = str(e)
+        return False, None, report
+
+def generate_chart(runtime, llm, user_prompt, data_file_path, is_first_request, previous_code=None, use_cache=True, on_code=None, workdir=None, sheet=None):
+    """
+    Point d'entrée principal pour la génération de graphiques
+    
+    Args:
+        runtime: Les ressources partagées (Runtime) : réglages, cache, pool, progression
+        llm: Le modèle de langage
+        user_prompt: La demande de l'utilisateur
+        data_file_path: Le chemin vers le fichier de données
+        is_first_request: True si c'est la première demande, False sinon
+        previous_code: Le code précédemment généré (None si première demande)
+        use_cache: False pour ignorer le cache des réponses LLM
+        on_code: Fonction recevant le code partiel pendant le streaming (None = sans streaming)
+        workdir: Dossier de travail propre à la session (dossier courant si None)
+        sheet: Feuille du classeur Excel à utiliser (la première si None)
+    
+    Returns:
+        tuple: (success: bool, chart: bytes, report: dict)
+    """
+    if is_first_request or previous_code is None:
+        # Pipeline complète pour la première demande
+        success, chart, report = generate_chart_initial(runtime, llm, user_prompt, data_file_path, use_cache, on_code=on_code, workdir=workdir, sheet=sheet)
+    else:
+        # Pipeline de modification pour les demandes suivantes
+        success, chart, report = generate_chart_modification(runtime, llm, user_prompt, previous_code, data_file_path, use_cache, on_code, workdir, sheet)
+    
+    if not success and runtime.cancel is not None and runtime.cancel.is_set():
+        # Annulation : les réponses déjà reçues restent valables
+        report["error_category"] = "cancelled"
+    elif not success:
+        # Ne pas resservir depuis le cache des réponses qui ont échoué
+        forget_cached_responses(runtime, report)
+    runtime.record_turn(report, success)
+    return success, chart, report
+
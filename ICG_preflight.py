@@ -0,0 +1,278 @@
+import ast
+import traceback
+
+SCRIPT_NAME = "<script>.py"
+
+# Méthodes qui renvoient un DataFrame aux mêmes colonnes : "df = df.dropna()" ne rend pas
+# le contrôle des colonnes caduc, contrairement à "df = df.rename(...)" ou "df = autre"
+PRESERVING_METHODS = {
+    "astype", "copy", "drop_duplicates", "dropna", "fillna", "head", "interpolate",
+    "query", "sample", "sort_index", "sort_values", "tail",
+}
+# Méthodes dont le premier argument (ou by=) désigne des colonnes
+COLUMN_METHODS = {"groupby", "set_index", "sort_values"}
+# Arguments nommés désignant des colonnes dans seaborn (data=df)
+COLUMN_KEYWORDS = {"x", "y", "hue", "size", "style", "col", "row"}
+# ... et dans DataFrame.plot, où style est un style de ligne matplotlib ("-o")
+PLOT_KEYWORDS = {"x", "y"}
+
+
+#################################### Utilitaires ####################################
+# Positions dans le source et application des modifications, partagées avec ICG_quickedit
+def source_offset(lines, lineno, col):
+    # Les col_offset de l'AST sont en octets UTF-8 : conversion en indice de caractère
+    start = sum(len(line) for line in lines[:lineno - 1])
+    return start + len(lines[lineno - 1].encode("utf-8")[:col].decode("utf-8", "ignore"))
+
+
+def node_span(lines, node):
+    return (source_offset(lines, node.lineno, node.col_offset),
+            source_offset(lines, node.end_lineno, node.end_col_offset))
+
+
+def apply_edits(code, edits):
+    # edits : (début, fin, texte) ; appliquées de la fin vers le début pour garder les positions valides
+    for start, end, text in sorted(edits, reverse=True):
+        code = code[:start] + text + code[end:]
+    return code
+
+
+def _is_df(node):
+    return isinstance(node, ast.Name) and node.id == "df"
+
+
+def _str_constants(node):
+    # "a" -> ["a"], ["a", "b"] -> ["a", "b"], sinon aucune colonne identifiable
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [e for e in node.elts if isinstance(e, ast.Constant) and isinstance(e.value, str)]
+    return []
+
+
+def _walk_script(tree):
+    # Parcours dans l'ordre du source, sans entrer dans les fonctions, lambdas et classes
+    # où df peut désigner autre chose (paramètre, variable locale)
+    nodes = []
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        nodes.append(node)
+        stack.extend(ast.iter_child_nodes(node))
+    return sorted(nodes, key=lambda n: (getattr(n, "lineno", 0), getattr(n, "col_offset", 0)))
+
+
+def _calls(tree, attr):
+    return [n for n in ast.walk(tree)
+            if isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute) and n.func.attr == attr]
+
+
+def _statements(tree):
+    # (bloc parent, instruction) pour toutes les instructions du script
+    for node in ast.walk(tree):
+        for field in ("body", "orelse", "finalbody"):
+            body = getattr(node, field, None)
+            if isinstance(body, list):
+                for statement in body:
+                    if isinstance(statement, ast.stmt):
+                        yield body, statement
+
+
+def pyplot_alias(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == "matplotlib.pyplot":
+                    return alias.asname or alias.name
+        elif isinstance(node, ast.ImportFrom) and node.module == "matplotlib":
+            for alias in node.names:
+                if alias.name == "pyplot":
+                    return alias.asname or alias.name
+    return None
+
+
+#################################### Contrôles ####################################
+def _column_references(tree):
+    """
+    Littéraux de colonnes lus sur df : (noeud Constant, ligne). Le contrôle s'arrête à la
+    première instruction qui peut changer les colonnes (réaffectation, inplace=True...).
+    Les colonnes créées par df["nouvelle"] = ... sont ajoutées au fur et à mesure.
+    """
+    references, created = [], set()
+    for node in _walk_script(tree):
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Attribute) and _is_df(target.value):
+                    return references, created  # df.columns = ..., df.index = ...
+                if any(_is_df(t) for t in ast.walk(target)) and not isinstance(target, ast.Subscript):
+                    value = node.value
+                    preserving = (
+                        isinstance(node, ast.Assign)
+                        and (
+                            (isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute)
+                             and _is_df(value.func.value) and value.func.attr in PRESERVING_METHODS)
+                            or (isinstance(value, ast.Subscript) and _is_df(value.value)
+                                and not _str_constants(value.slice))
+                        )
+                    )
+                    if not preserving:
+                        return references, created
+        elif isinstance(node, ast.Subscript) and _is_df(node.value):
+            constants = _str_constants(node.slice)
+            if isinstance(node.ctx, ast.Store):
+                created.update(c.value for c in constants)
+            else:
+                references.extend(constants)
+        elif isinstance(node, ast.Call):
+            keywords = {k.arg: k.value for k in node.keywords if k.arg}
+            inplace = keywords.get("inplace")
+            func = node.func
+            on_df = isinstance(func, ast.Attribute) and _is_df(func.value)
+            if on_df and isinstance(inplace, ast.Constant) and inplace.value is True \
+                    and func.attr not in PRESERVING_METHODS:
+                return references, created
+            if on_df and func.attr == "insert" and len(node.args) >= 2:
+                created.update(c.value for c in _str_constants(node.args[1]))
+            if on_df and func.attr in COLUMN_METHODS:
+                if node.args:
+                    references.extend(_str_constants(node.args[0]))
+                if "by" in keywords:
+                    references.extend(_str_constants(keywords["by"]))
+            if _is_df(keywords.get("data")):
+                names = COLUMN_KEYWORDS
+            elif on_df and func.attr == "plot":
+                names = PLOT_KEYWORDS
+            else:
+                names = set()
+            for name in names & keywords.keys():
+                references.extend(_str_constants(keywords[name]))
+    return references, created
+
+
+def _normalize(name):
+    return "".join(str(name).split()).lower()
+
+
+def _check_columns(tree, lines, columns, edits, fixes, errors):
+    known = {str(c) for c in columns}
+    by_normalized = {}
+    for c in known:
+        by_normalized.setdefault(_normalize(c), []).append(c)
+
+    references, created = _column_references(tree)
+    for node in references:
+        name = node.value
+        if name in known or name in created:
+            continue
+        candidates = by_normalized.get(_normalize(name), [])
+        if len(candidates) == 1:
+            # Seule la casse ou les espaces diffèrent : correction sans ambiguïté
+            start, end = node_span(lines, node)
+            edits.append((start, end, repr(candidates[0])))
+            fixes.append(f"ligne {node.lineno} : colonne '{name}' remplacée par '{candidates[0]}'")
+        else:
+            errors.append(
+                f'  File "{SCRIPT_NAME}", line {node.lineno}\n'
+                f"KeyError: '{name}' n'est pas une colonne de df. "
+                f"Colonnes disponibles : {sorted(known)}"
+            )
+
+
+def _check_output(tree, lines, code, chart_file, edits, fixes, errors):
+    plt = pyplot_alias(tree) or "plt"
+
+    # plt.show() ne fait rien en mode non interactif : l'instruction est supprimée
+    for body, statement in _statements(tree):
+        call = statement.value if isinstance(statement, ast.Expr) else None
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == "show"
+                and isinstance(call.func.value, ast.Name) and call.func.value.id == plt):
+            continue
+        if len(body) > 1:
+            start = source_offset(lines, statement.lineno, 0)
+            end = source_offset(lines, statement.end_lineno + 1, 0) if statement.end_lineno < len(lines) else len(code)
+            edits.append((start, end, ""))
+        else:
+            # Seule instruction du bloc : remplacée par pass pour garder un code valide
+            edits.append((*node_span(lines, statement), "pass"))
+        fixes.append(f"ligne {statement.lineno} : {plt}.show() supprimé")
+
+    savefigs = sorted(_calls(tree, "savefig"), key=lambda c: (c.lineno, c.col_offset))
+    targets = [call.args[0] if call.args else next((k.value for k in call.keywords if k.arg == "fname"), None)
+               for call in savefigs]
+    constants = [isinstance(t, ast.Constant) and isinstance(t.value, str) for t in targets]
+    # Redirection seulement si aucun appel n'enregistre déjà (ou peut-être, via une variable)
+    # le graphique attendu ; les autres enregistrements du script sont laissés tels quels.
+    # C'est le dernier enregistrement qui devient le graphique : la figure y est complète.
+    if savefigs and all(constants) and all(t.value != chart_file for t in targets):
+        call, target = savefigs[-1], targets[-1]
+        start, end = node_span(lines, target)
+        edits.append((start, end, repr(chart_file)))
+        fixes.append(f"ligne {call.lineno} : fichier '{target.value}' remplacé par '{chart_file}'")
+
+    closes = _calls(tree, "close")
+    tail = []  # Instructions ajoutées en fin de script
+    if not savefigs:
+        if pyplot_alias(tree) is None:
+            errors.append(
+                f'  File "{SCRIPT_NAME}", line {len(lines)}\n'
+                f"Erreur : aucun appel à plt.savefig('{chart_file}') ; le graphique ne serait pas enregistré"
+            )
+            return
+        # Sauvegarde insérée avant le premier plt.close() de premier niveau, sinon en fin de script.
+        # Si la figure n'est fermée que dans un bloc (fonction, condition, boucle), une sauvegarde
+        # en fin de script enregistrerait une figure vide : l'erreur part au debugger.
+        first_close = next((s for s in tree.body if isinstance(s, ast.Expr) and s.value in closes), None)
+        save = f"{plt}.savefig('{chart_file}')"
+        if first_close is None and closes:
+            close = min(closes, key=lambda c: (c.lineno, c.col_offset))
+            errors.append(
+                f'  File "{SCRIPT_NAME}", line {close.lineno}\n'
+                f"Erreur : la figure est fermée sans appel à {plt}.savefig('{chart_file}') ; "
+                f"le graphique ne serait pas enregistré"
+            )
+            return
+        if first_close is not None:
+            start = source_offset(lines, first_close.lineno, 0)
+            indent = lines[first_close.lineno - 1][:first_close.col_offset]
+            edits.append((start, start, f"{indent}{save}\n"))
+        else:
+            tail.append(save)
+        fixes.append(f"{save} ajouté")
+    if not closes:
+        tail.append(f"{plt}.close()")
+        fixes.append(f"{plt}.close() ajouté")
+    if tail:
+        edits.append((len(code), len(code), ("" if code.endswith("\n") else "\n") + "\n".join(tail) + "\n"))
+
+
+def preflight(code, columns=None, chart_file="graphique.png"):
+    """
+    Contrôle statique du script avant tout lancement d'interpréteur : compilation,
+    colonnes lues sur df (si columns est fourni), sauvegarde et fermeture de la figure.
+
+    Les problèmes sans ambiguïté sont corrigés localement (plt.show() supprimé, savefig
+    ajouté ou redirigé vers graphique.png, casse d'une colonne) ; les autres sont
+    renvoyés sous forme de log pour le debugger.
+
+    Returns:
+        dict: {"code": code corrigé, "fixes": [str], "log": str ou None}
+    """
+    try:
+        tree = ast.parse(code, SCRIPT_NAME)
+    except SyntaxError as e:
+        return {"code": code, "fixes": [], "log": "".join(traceback.format_exception_only(type(e), e))}
+
+    lines = code.splitlines(True)
+    edits, fixes, errors = [], [], []
+    _check_output(tree, lines, code, chart_file, edits, fixes, errors)
+    if columns is not None:
+        _check_columns(tree, lines, columns, edits, fixes, errors)
+
+    fixed = apply_edits(code, edits)
+    log = None
+    if errors:
+        log = "Contrôle avant exécution (le script n'a pas été lancé) :\n" + "\n".join(errors)
+    return {"code": fixed, "fixes": fixes, "log": log}
@@ -0,0 +1,280 @@
+import ast
+import re
+
+from ICG_preflight import apply_edits, node_span, pyplot_alias, source_offset
+
+# Retouches de style appliquées localement, sans appel au modèle : couleur de l'unique tracé,
+# titre, libellés et limites des axes, échelle logarithmique, ligne de référence, grille.
+# La demande doit correspondre entièrement à un des motifs ci-dessous, et le code doit permettre
+# une modification sans ambiguïté ; sinon quick_edit renvoie None et la demande part au modèle.
+
+COLORS = {
+    "rouge": "red", "bleu": "blue", "bleue": "blue", "vert": "green", "verte": "green",
+    "noir": "black", "noire": "black", "orange": "orange", "violet": "purple", "violette": "purple",
+    "jaune": "gold", "gris": "gray", "grise": "gray", "rose": "pink", "marron": "brown",
+    "cyan": "cyan", "magenta": "magenta",
+}
+
+# Formules de politesse ignorées en début et en fin de demande
+POLITE_PREFIX = re.compile(r"^(?:(?:peux-tu|pourrais-tu|tu peux|merci de|stp|svp|s'il te plaît|s'il te plait)\s*,?\s*)+")
+POLITE_SUFFIX = re.compile(r"\s*,?\s*(?:stp|svp|s'il te plaît|s'il te plait|merci)?\s*[.!?]*$")
+
+VERB = r"(?:change|changer|mets|mettre|modifie|modifier|remplace|remplacer|passe|passer|ajoute|ajouter|fixe|fixer|utilise|utiliser)"
+AXIS = r"(?:(?:l')?axe\s*(?:des\s+)?(?P<axis>x|y)|(?:l'|les\s+)?(?P<axis_word>abscisses?|ordonnées?))"
+NUMBER = r"-?\d+(?:[.,]\d+)?"
+INTENTS = [
+    ("color", re.compile(
+        rf"^{VERB}\s+(?:la\s+|le\s+|les\s+)?(?:couleur|courbe|tracé|ligne|points|barres|série|histogramme)"
+        r"(?:\s+(?:de\s+la|du|des|de)\s+(?:courbe|tracé|ligne|points|barres|série|graphique|histogramme))?"
+        r"\s+(?:en|à|a|:)?\s*(?P<color>[a-z]+)$")),
+    ("label", re.compile(
+        rf"^{VERB}\s+(?:le\s+|la\s+)?(?:label|libellé|nom|titre|légende)\s+(?:de\s+|du\s+|des\s+)?{AXIS}"
+        r"\s*(?P<sep>en|par|à|:)?\s*(?P<text>.+)$")),
+    # Après les libellés : "titre de l'axe x" est un libellé
+    ("title", re.compile(rf"^{VERB}\s+(?:le\s+|un\s+)?titre(?:\s+du\s+graphique)?\s*(?P<sep>en|par|à|:)?\s*(?P<text>.+)$")),
+    ("limits", re.compile(
+        rf"^(?:limite|limiter|restreins|restreindre|{VERB})\s+(?:les\s+limites\s+de\s+|la\s+plage\s+de\s+)?{AXIS}"
+        rf"\s+(?:entre|de)\s+(?P<low>{NUMBER})\s+(?:et|à|a)\s+(?P<high>{NUMBER})$")),
+    ("line", re.compile(
+        r"^(?:ajoute|ajouter|trace|tracer|mets|mettre)\s+(?:une\s+)?(?:barre|ligne|droite|trait)\s+"
+        r"(?P<direction>verticale|horizontale)\s+(?:à|a|en|pour|au\s+niveau\s+de)\s+"
+        rf"(?:[a-z_]\w*\s*=\s*)?(?P<value>{NUMBER})\s*[a-zµ]{{0,3}}$")),
+    ("log", re.compile(rf"^{VERB}\s+{AXIS}\s+en\s+(?:échelle\s+)?log(?:arithmique)?$")),
+    ("log", re.compile(
+        rf"^(?:{VERB}\s+)?(?:une\s+|en\s+)?échelle\s+log(?:arithmique)?\s+(?:sur|pour|à|a|en)\s+{AXIS}$")),
+    ("grid", re.compile(r"^(?P<action>ajoute|ajouter|affiche|afficher|mets|mettre|enlève|enlever|retire|retirer|supprime|supprimer)"
+                        r"\s+(?:une\s+|la\s+)?grille$")),
+]
+
+# Fonctions de tracé dont on peut changer la couleur (une seule dans le script)
+PLOT_FUNCTIONS = {
+    "plot", "scatter", "bar", "barh", "hist", "step", "fill_between", "errorbar", "stem",
+    "lineplot", "scatterplot", "histplot", "barplot", "kdeplot",
+}
+# Arguments qui colorent les données autrement qu'avec une couleur unique
+COLOR_CONFLICTS = {"c", "hue", "palette", "cmap"}
+# Appels créant plusieurs axes (ou une figure seaborn à part) : la cible d'un ajout serait incertaine
+MULTI_AXES = {"subplot", "add_subplot", "subplot_mosaic", "add_axes", "twinx", "twiny",
+              "relplot", "catplot", "displot", "pairplot", "jointplot", "FacetGrid", "lmplot"}
+# Réglages : fonction pyplot -> méthodes d'Axes (ou de Figure) équivalentes
+SETTERS = {
+    "title": ("set_title", "suptitle"),
+    "xlabel": ("set_xlabel",), "ylabel": ("set_ylabel",),
+    "xlim": ("set_xlim",), "ylim": ("set_ylim",),
+    "xscale": ("set_xscale",), "yscale": ("set_yscale",),
+    "grid": ("grid",),
+}
+# Réglages de texte dont les arguments nommés (police, taille...) sont conservés au remplacement
+TEXT_SETTERS = {"title", "xlabel", "ylabel"}
+# Axe des x en dates : une valeur numérique (ligne, limites) n'y aurait pas le sens attendu
+DATE_MARKERS = ("to_datetime", "DatetimeIndex", "matplotlib.dates", "date_range")
+
+
+#################################### Reconnaissance de la demande ####################################
+def _unquote(text, sep):
+    text = text.strip()
+    for open_quote, close_quote in (('"', '"'), ("'", "'"), ("«", "»"), ("“", "”")):
+        if len(text) >= 2 and text.startswith(open_quote) and text.endswith(close_quote):
+            return text[1:-1].strip()
+    # Sans guillemets, seul "titre : texte" est sans ambiguïté
+    return text if sep == ":" else None
+
+
+def _axis(match):
+    if match.group("axis"):
+        return match.group("axis")
+    return "x" if match.group("axis_word").startswith("abscisse") else "y"
+
+
+def _number(text):
+    text = text.replace(",", ".")
+    return int(text) if re.fullmatch(r"-?\d+", text) else float(text)
+
+
+def recognize(prompt):
+    """
+    Retouche demandée, si la demande est entièrement une retouche connue.
+
+    Returns:
+        dict: {"kind": color, title, label, limits, line, log ou grid, ...} ou None
+    """
+    original = prompt.strip().replace("’", "'")
+    lowered = original.lower()
+    if len(lowered) != len(original):
+        original = lowered  # Casse non conservable caractère par caractère (rare)
+    polite = POLITE_PREFIX.match(lowered)
+    start = polite.end() if polite else 0
+    text = POLITE_SUFFIX.sub("", lowered[start:])
+    # Même passage avec la casse d'origine, pour les titres et libellés
+    cased = original[start:start + len(text)]
+
+    for kind, pattern in INTENTS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        if kind == "color":
+            color = COLORS.get(match.group("color"))
+            return {"kind": kind, "color": color} if color else None
+        if kind in ("title", "label"):
+            label = _unquote(cased[match.start("text"):match.end("text")], match.group("sep"))
+            if not label:
+                return None
+            if kind == "title":
+                return {"kind": kind, "text": label}
+            return {"kind": kind, "axis": _axis(match), "text": label}
+        if kind == "limits":
+            return {"kind": kind, "axis": _axis(match), "low": _number(match.group("low")), "high": _number(match.group("high"))}
+        if kind == "line":
+            return {"kind": kind, "axis": "x" if match.group("direction") == "verticale" else "y",
+                    "value": _number(match.group("value"))}
+        if kind == "log":
+            return {"kind": kind, "axis": _axis(match)}
+        if kind == "grid":
+            return {"kind": kind, "visible": not match.group("action").startswith(("enl", "ret", "sup"))}
+    return None
+
+
+#################################### Réécriture du code ####################################
+def _calls(tree, attrs):
+    return [n for n in ast.walk(tree)
+            if isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute) and n.func.attr in attrs
+            and isinstance(n.func.value, ast.Name)]
+
+
+def _single_axes(tree):
+    if _calls(tree, MULTI_AXES):
+        return False
+    for call in _calls(tree, {"subplots"}):
+        sizes = list(call.args[:2]) + [k.value for k in call.keywords if k.arg in ("nrows", "ncols")]
+        if any(not (isinstance(s, ast.Constant) and s.value == 1) for s in sizes):
+            return False
+    return True
+
+
+def _is_savefig(statement):
+    return (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call)
+            and isinstance(statement.value.func, ast.Attribute) and statement.value.func.attr == "savefig")
+
+
+def _insertion_point(tree, lines):
+    """
+    Juste avant l'appel à savefig, s'il est une instruction du module ou du corps d'une
+    fonction du module (def main(): ...). Ailleurs (if __name__ == "__main__", boucle...),
+    l'ajout ne s'exécuterait pas forcément avec la figure : None.
+
+    Returns:
+        tuple: (position dans le code, indentation de la ligne à insérer) ou None
+    """
+    bodies = [tree.body] + [s.body for s in tree.body if isinstance(s, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    for body in bodies:
+        for statement in body:
+            # L'instruction doit commencer sa ligne (pas "def main(): ...; plt.savefig(...)")
+            indent = lines[statement.lineno - 1][:statement.col_offset]
+            if _is_savefig(statement) and not indent.strip():
+                return source_offset(lines, statement.lineno, 0), indent
+    return None
+
+
+def _setter(tree, lines, code, plt, name, args, edits):
+    """Remplace les arguments de l'unique appel au réglage, ou l'ajoute avant savefig"""
+    existing = [c for c in _calls(tree, {name}) if c.func.value.id == plt]
+    existing += [c for c in _calls(tree, set(SETTERS[name])) if c.func.value.id != plt]
+    if len(existing) > 1:
+        return False
+    if existing:
+        call = existing[0]
+        keywords = []
+        if name in TEXT_SETTERS:
+            keywords = [ast.get_source_segment(code, k) for k in call.keywords
+                        if k.arg not in (None, "label", "xlabel", "ylabel", "t", "s")]
+        func = ast.get_source_segment(code, call.func)
+        edits.append((*node_span(lines, call), f"{func}({', '.join([args, *keywords])})"))
+        return True
+    if not _single_axes(tree):
+        return False
+    insertion = _insertion_point(tree, lines)
+    if insertion is None:
+        return False
+    position, indent = insertion
+    edits.append((position, position, f"{indent}{plt}.{name}({args})\n"))
+    return True
+
+
+def _recolor(tree, lines, code, color, edits):
+    calls = _calls(tree, PLOT_FUNCTIONS)
+    if len(calls) != 1:
+        return False
+    call = calls[0]
+    keywords = {k.arg: k for k in call.keywords if k.arg}
+    if COLOR_CONFLICTS & keywords.keys() or any(isinstance(a, ast.Constant) and isinstance(a.value, str) for a in call.args):
+        return False  # Couleur par groupe ou chaîne de format ("r--") : réécriture incertaine
+    if "color" in keywords:
+        edits.append((*node_span(lines, keywords["color"].value), repr(color)))
+    else:
+        end = node_span(lines, call)[1] - 1  # Juste avant la parenthèse fermante
+        separator = ", " if call.args or call.keywords else ""
+        edits.append((end, end, f"{separator}color={color!r}"))
+    return True
+
+
+def quick_edit(code, prompt):
+    """
+    Applique localement une retouche de style reconnue dans la demande.
+
+    Returns:
+        dict: {"code": code modifié, "description": str} ou None si la demande ou le code
+              ne permettent pas une modification sûre (la demande part alors au modèle)
+    """
+    intent = recognize(prompt)
+    if intent is None:
+        return None
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    plt = pyplot_alias(tree)
+    if plt is None:
+        return None
+
+    kind = intent["kind"]
+    if kind in ("line", "limits") and intent["axis"] == "x" and any(m in code for m in DATE_MARKERS):
+        return None
+
+    lines = code.splitlines(True)
+    edits = []
+    if kind == "color":
+        done = _recolor(tree, lines, code, intent["color"], edits)
+        description = f"couleur du tracé : {intent['color']}"
+    elif kind == "title":
+        done = _setter(tree, lines, code, plt, "title", repr(intent["text"]), edits)
+        description = f"titre : {intent['text']}"
+    elif kind == "label":
+        done = _setter(tree, lines, code, plt, intent["axis"] + "label", repr(intent["text"]), edits)
+        description = f"libellé de l'axe {intent['axis']} : {intent['text']}"
+    elif kind == "limits":
+        done = _setter(tree, lines, code, plt, intent["axis"] + "lim", f"{intent['low']!r}, {intent['high']!r}", edits)
+        description = f"limites de l'axe {intent['axis']} : {intent['low']} à {intent['high']}"
+    elif kind == "log":
+        done = _setter(tree, lines, code, plt, intent["axis"] + "scale", "'log'", edits)
+        description = f"échelle logarithmique sur l'axe {intent['axis']}"
+    elif kind == "grid":
+        done = _setter(tree, lines, code, plt, "grid", repr(intent["visible"]), edits)
+        description = "grille affichée" if intent["visible"] else "grille retirée"
+    else:  # line
+        insertion = _insertion_point(tree, lines)
+        done = insertion is not None and _single_axes(tree)
+        if done:
+            position, indent = insertion
+            function = "axvline" if intent["axis"] == "x" else "axhline"
+            edits.append((position, position,
+                          f"{indent}{plt}.{function}({intent['value']!r}, color='gray', linestyle='--')\n"))
+        description = f"ligne {'verticale' if intent['axis'] == 'x' else 'horizontale'} en {intent['value']}"
+
+    if not done:
+        return None
+    edited = apply_edits(code, edits)
+    try:
+        ast.parse(edited)
+    except SyntaxError:
+        return None
+    return {"code": edited, "description": description}
@@ -0,0 +1,89 @@
+import io
+import os
+
+# Rendu en deux temps : les exécutions de la pipeline produisent un aperçu léger (résolution
+# plafonnée, PNG à palette au-delà d'une certaine taille) ; les exports pleine qualité
+# (PNG haute résolution, SVG, PDF) réexécutent le script final, seulement à la demande.
+# Seul l'enregistrement du graphique est concerné, le script lui-même n'est pas modifié.
+
+# Format -> (libellé, type MIME)
+EXPORT_FORMATS = {
+    "png": ("PNG haute résolution", "image/png"),
+    "svg": ("SVG (vectoriel)", "image/svg+xml"),
+    "pdf": ("PDF (vectoriel)", "application/pdf"),
+}
+
+
+def _numeric_dpi(figure, dpi):
+    # dpi absent : valeur de rcParams ; "figure" : résolution de la figure
+    import matplotlib
+
+    if dpi is None:
+        dpi = matplotlib.rcParams["savefig.dpi"]
+    if dpi == "figure":
+        dpi = figure.dpi
+    return float(dpi)
+
+
+def compress_png(path, max_bytes):
+    """
+    Réencode en PNG à palette (256 couleurs) une image plus lourde que max_bytes.
+    Sans perte visible pour la plupart des graphiques (aplats, traits) ; l'original est
+    gardé si la conversion ne le réduit pas.
+    """
+    if os.path.getsize(path) <= max_bytes:
+        return
+    from PIL import Image
+
+    with Image.open(path) as image:
+        if image.mode not in ("RGB", "RGBA"):
+            return
+        # FASTOCTREE est la seule méthode qui accepte la transparence
+        palette = image.quantize(256, method=getattr(Image, "Quantize", Image).FASTOCTREE)
+    buffer = io.BytesIO()
+    palette.save(buffer, "PNG", optimize=True)
+    if buffer.tell() < os.path.getsize(path):
+        with open(path, "wb") as f:
+            f.write(buffer.getvalue())
+
+
+def install(options, chart_file):
+    """
+    Remplace Figure.savefig (plt.savefig y délègue) : l'enregistrement de chart_file suit
+    les options, les autres fichiers écrits par le script ne changent pas.
+
+    Args:
+        options: Aperçu {"max_dpi": résolution maximale, "max_kb": taille au-delà de laquelle
+                 le PNG passe en palette}, ou export {"format": "png" | "svg" | "pdf",
+                 "min_dpi": résolution minimale}
+        chart_file: Nom du fichier du graphique (CHART_FILE)
+
+    Returns:
+        function: uninstall, qui restaure matplotlib
+    """
+    from matplotlib.figure import Figure
+
+    original_savefig = Figure.savefig
+
+    def savefig(self, fname, **kwargs):
+        if not isinstance(fname, (str, os.PathLike)) or os.path.basename(os.fspath(fname)) != chart_file:
+            return original_savefig(self, fname, **kwargs)
+        dpi = _numeric_dpi(self, kwargs.get("dpi"))
+        if options.get("max_dpi"):
+            dpi = min(dpi, options["max_dpi"])
+        if options.get("min_dpi"):
+            dpi = max(dpi, options["min_dpi"])
+        kwargs["dpi"] = dpi
+        if options.get("format"):
+            kwargs["format"] = options["format"]
+        result = original_savefig(self, fname, **kwargs)
+        if options.get("max_kb"):
+            compress_png(fname, options["max_kb"] * 1024)
+        return result
+
+    Figure.savefig = savefig
+
+    def uninstall():
+        Figure.savefig = original_savefig
+
+    return uninstall
@@ -1,85 +1,445 @@
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import warnings
+from collections import OrderedDict
+
 import pandas as pd
-import subprocess
+
+from ICG_metrics import CHARS_PER_TOKEN, estimate_tokens
  
+# Nombre de lignes lues pour inférer colonnes et types
+SAMPLE_ROWS = 1000
+# Taille des blocs lus lors du parcours du fichier (hash + comptage des lignes)
+SCAN_CHUNK_SIZE = 1 << 20
+# Nombre de fichiers dont les métadonnées restent en mémoire
+METADATA_CACHE_SIZE = 64
+# Profil des colonnes : nombre maximal de colonnes décrites, d'exemples et de caractères par valeur
+PROFILE_MAX_COLUMNS = 50
+PROFILE_EXAMPLES = 3
+PROFILE_VALUE_CHARS = 30
+# Dossier des DataFrames convertis en pickle, nommés par empreinte du fichier source
+DATA_CACHE_DIR = os.path.join(tempfile.gettempdir(), "gag_data")
+# Dossier des fichiers téléversés, rangés par empreinte du contenu : <empreinte>/<nom d'origine>
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "gag_uploads")
+
+_metadata_cache = OrderedDict()  # (digest, feuille) -> infos (sans file_name) ; ("sheets", digest) -> feuilles
+_digest_cache = OrderedDict()  # (chemin, taille, mtime) -> (digest, nombre de lignes)
+_cache_lock = threading.Lock()  # Les sessions Streamlit tournent dans des threads distincts
+
 #################################### Useful functions ####################################
-# Read csv or excel file (just the first sheet)
-def read_data(data_file):
+# Empreinte du contenu et nombre de lignes en une seule passe sur les blocs
+def _digest_chunks(chunks):
+    digest = hashlib.sha256()
+    n_lines = 0
+    last = b""
+    for chunk in chunks:
+        digest.update(chunk)
+        n_lines += chunk.count(b"\n")
+        last = chunk
+    # Les lignes vides en fin de fichier sont ignorées par pandas ; la dernière
+    # ligne de données n'a pas forcément de retour à la ligne final
+    content = last.rstrip(b"\r\n")
+    if content:
+        n_lines = n_lines - last[len(content):].count(b"\n") + 1
+    return digest.hexdigest(), n_lines
+
+def _remember_scan(data_file, result):
+    st = os.stat(data_file)
+    stamp = (os.path.abspath(data_file), st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        _digest_cache[stamp] = result
+        if len(_digest_cache) > METADATA_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+
+# Parcours en flux du fichier : empreinte du contenu et nombre de lignes
+def _scan_file(data_file):
+    st = os.stat(data_file)
+    stamp = (os.path.abspath(data_file), st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        if stamp in _digest_cache:
+            _digest_cache.move_to_end(stamp)
+            return _digest_cache[stamp]
+
+    with open(data_file, "rb") as f:
+        result = _digest_chunks(iter(lambda: f.read(SCAN_CHUNK_SIZE), b""))
+    _remember_scan(data_file, result)
+    return result
+
+def file_digest(data_file):
+    return _scan_file(data_file)[0]
+
+# Enregistrement d'un fichier téléversé à un emplacement dérivé de son contenu :
+# un contenu déjà reçu (par cette session ou une autre) n'est pas réécrit, deux fichiers
+# de même nom mais de contenus différents ne s'écrasent pas. L'empreinte calculée ici
+# est gardée en cache, read_data et cache_dataframe ne relisent pas le fichier pour l'obtenir.
+def store_upload(name, content, upload_dir=UPLOAD_DIR):
+    result = _digest_chunks(content[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(content), SCAN_CHUNK_SIZE))
+    folder = os.path.join(upload_dir, result[0])
+    path = os.path.join(folder, os.path.basename(name))
+    if not os.path.exists(path):
+        # Écriture atomique : une autre session peut téléverser le même fichier en parallèle
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    _remember_scan(path, result)
+    return path
+
+# Feuilles d'un classeur Excel avec leurs dimensions (hors en-tête), sans en charger aucune :
+# le classeur est ouvert en lecture seule et les dimensions viennent de ses métadonnées
+def list_sheets(data_file):
+    key = ("sheets", file_digest(data_file))
+    with _cache_lock:
+        if key in _metadata_cache:
+            _metadata_cache.move_to_end(key)
+            return list(_metadata_cache[key])
+
+    from openpyxl import load_workbook
+    wb = load_workbook(data_file, read_only=True)
+    try:
+        sheets = []
+        for ws in wb.worksheets:
+            n_rows, n_cols = ws.max_row, ws.max_column
+            if n_rows is None or n_cols is None:
+                # Dimensions absentes du fichier : comptage en flux, ligne par ligne
+                n_rows = n_cols = 0
+                for row in ws.iter_rows(values_only=True):
+                    n_rows += 1
+                    n_cols = max(n_cols, len(row))
+            sheets.append({"name": ws.title, "rows": max(n_rows - 1, 0), "columns": n_cols})
+    finally:
+        wb.close()
+
+    with _cache_lock:
+        _metadata_cache[key] = sheets
+        if len(_metadata_cache) > METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return list(sheets)
+
+# Feuille effectivement lue : celle demandée, ou la première du classeur (None pour un CSV)
+def _resolve_sheet(data_file, sheet):
+    if data_file.split('.')[-1] != "xlsx":
+        return None
+    sheets = list_sheets(data_file)
+    if sheet is None:
+        return sheets[0]["name"]
+    if sheet not in [s["name"] for s in sheets]:
+        raise ValueError(f"Feuille introuvable dans {os.path.basename(data_file)} : {sheet}")
+    return sheet
+
+def _short(value):
+    text = str(value)
+    return text if len(text) <= PROFILE_VALUE_CHARS else text[:PROFILE_VALUE_CHARS - 1] + "…"
+
+def _parses_as_datetime(column):
+    values = column.dropna().head(20)
+    if values.empty:
+        return False
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(values.astype(str), errors="coerce", format="mixed")
+    return bool(parsed.notna().mean() >= 0.9)
+
+# Profil de chaque colonne (valeurs manquantes, cardinalité, min/max, monotonie, dates...)
+# Les agrégats sont calculés sur tout le DataFrame d'un coup ; la taille est bornée.
+def profile_columns(data):
+    data = data.iloc[:, :PROFILE_MAX_COLUMNS]
+    nulls = data.isna().sum()
+    uniques = data.nunique(dropna=True)
+    ordered = data.select_dtypes(include=["number", "datetime"])
+    mins, maxs = ordered.min(), ordered.max()
+
+    profile = {}
+    for i, name in enumerate(data.columns):
+        column = data.iloc[:, i]
+        entry = {"nulls": int(nulls.iloc[i]), "unique": int(uniques.iloc[i])}
+        if name in ordered.columns:
+            entry["min"], entry["max"] = _short(mins[name]), _short(maxs[name])
+            if entry["unique"] <= 1:
+                pass
+            elif column.is_monotonic_increasing:
+                entry["monotonic"] = "croissant"
+            elif column.is_monotonic_decreasing:
+                entry["monotonic"] = "décroissant"
+        elif column.dtype == object or pd.api.types.is_string_dtype(column):
+            entry["datetime"] = _parses_as_datetime(column)
+        entry["examples"] = [_short(v) for v in column.dropna().unique()[:PROFILE_EXAMPLES]]
+        profile[str(name)] = entry
+    return profile
+
+# Read csv or excel file (one sheet, the first one by default)
+# Seul un échantillon est parsé pour les colonnes et les types, le nombre de lignes
+# est obtenu par un parcours en flux. Le résultat est mis en cache par empreinte du contenu
+# et par feuille. profile=True ajoute le profil des colonnes, calculé sur toutes les lignes
+# à partir du pickle de cache_dataframe (converti ici au besoin, puis réutilisé par le pipeline).
+def read_data(data_file, profile=False, sheet=None):
     ext = data_file.split('.')[-1]
+    digest, n_lines = _scan_file(data_file)
+    sheet = _resolve_sheet(data_file, sheet)
+    key = (digest, sheet)
+
+    with _cache_lock:
+        infos = _metadata_cache.get(key)
+        if infos is not None and (not profile or "profile" in infos):
+            _metadata_cache.move_to_end(key)
+            return _with_file_name(infos, data_file, profile)
    
     if ext == "xlsx":
-        data = pd.read_excel(data_file)
+        # Lecture seule en flux : seules les SAMPLE_ROWS premières lignes de la feuille sont parcourues
+        sample = pd.read_excel(data_file, sheet_name=sheet, nrows=SAMPLE_ROWS, engine="openpyxl")
+        n_rows = next(s["rows"] for s in list_sheets(data_file) if s["name"] == sheet)
     elif ext == "csv":
-        data = pd.read_csv(data_file)
+        sample = pd.read_csv(data_file, nrows=SAMPLE_ROWS)
+        n_rows = max(n_lines - 1, 0)  # Sans la ligne d'en-tête
    
     # Recuperation des infos utiles
     infos = {
-        "file_name": data_file,
-        "shape": data.shape,
-        "columns": data.columns.tolist(),
-        "dtypes": data.dtypes.astype(str).to_dict()
+        "shape": (n_rows, sample.shape[1]),
+        "columns": sample.columns.tolist(),
+        "dtypes": sample.dtypes.astype(str).to_dict()
             }
+    if sheet is not None:
+        infos["sheet"] = sheet
+    if profile:
+        data = pd.read_pickle(cache_dataframe(data_file, sheet=sheet))
+        infos["profile"] = profile_columns(data)
+        infos["profile_rows"] = len(data)
+
+    with _cache_lock:
+        _metadata_cache[key] = infos
+        if len(_metadata_cache) > METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
    
-    return infos
- 
-def run_script(path):
-    process = subprocess.run(
-        ["python", path],
-        capture_output=True,
-        text=True
-    )
-    return process.stderr  # Contient l’erreur si crash
- 
+    return _with_file_name(infos, data_file, profile)
+
+def _with_file_name(infos, data_file, profile):
+    result = {"file_name": data_file, **infos}
+    if not profile:
+        result.pop("profile", None)
+        result.pop("profile_rows", None)
+    return result
+
+# Conversion unique du fichier (ou de la feuille choisie) en pickle, chargement bien plus
+# rapide que le parsing CSV/XLSX. Les scripts générés reçoivent ce DataFrame déjà chargé.
+def cache_dataframe(data_file, cache_dir=DATA_CACHE_DIR, sheet=None):
+    sheet = _resolve_sheet(data_file, sheet)
+    name = file_digest(data_file)
+    if sheet is not None:
+        name += "-" + hashlib.sha256(sheet.encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, name + ".pkl")
+    if os.path.exists(cache_path):
+        return cache_path
+
+    ext = data_file.split('.')[-1]
+    if ext == "xlsx":
+        data = pd.read_excel(data_file, sheet_name=sheet, engine="openpyxl")
+    elif ext == "csv":
+        data = pd.read_csv(data_file)
+
+    # Écriture atomique : une autre session peut convertir le même fichier en parallèle
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    os.close(fd)
+    try:
+        data.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return cache_path
  
 #################################### Context builder ####################################
-def interpreteur_context(INTERPRETER_CONTEXT, initial_prompt, lecteur_output):
-    interp_context = f"""
-                            {INTERPRETER_CONTEXT}
-                           
-                            Voici la demande utilisateur :
-                            {initial_prompt}
- 
-                            Voici le JSON récapitulant le contenu du fichier contenant les données à afficher :
-                            {lecteur_output}
- 
-                            """
-    return interp_context
- 
-def codeur_context(CODEUR_CONTEXT, interpreteur_output, lecteur_output):
-    code_context = f"""
-                            {CODEUR_CONTEXT}
-                           
-                            Voici le JSON structuré de la demande utilisateur :
-                            {interpreteur_output}
- 
-                            Voici les metadonnees du dataframe contenant les données :
-                            {lecteur_output}
- 
-                            """
-    return code_context
- 
-def verificateur_context(VERIFICATEUR_CONTEXT, initial_prompt, interpreteur_output, codeur_output):
-    verif_context = f"""
-                            {VERIFICATEUR_CONTEXT}
-                           
-                            Voici la demande utilisateur :
-                            {initial_prompt}
- 
-                            Voici le json structuré de la demande utilisateur :
-                            {interpreteur_output}
- 
-                            Voici le code python :
-                            {codeur_output}
-                            """
-    return verif_context
- 
-def debugger_context(DEBUGGER_CONTEXT, codeur_output, log):
-    debug_context = f"""
-                            {DEBUGGER_CONTEXT}
-                            
-                            Voici la code python contenant une ou plusieurs erreurs :
-                            {codeur_output}
- 
-                            Voici le log d'erreur après l'avoir lancé :
-                            {log}
-                            """
-    return debug_context
\ No newline at end of file
+# Au-delà de WIDE_COLUMNS colonnes, la liste est résumée par préfixe et type ; les colonnes
+# citées (demande, JSON, code) et les KEPT_COLUMNS premières restent détaillées
+WIDE_COLUMNS = 60
+KEPT_COLUMNS = 5
+# Part minimale du budget laissée aux données ou au log, même si le reste du prompt le dépasse
+MIN_SECTION_TOKENS = 200
+
+def _profile_lines(lecteur_output, names=None):
+    lines = []
+    for name, entry in lecteur_output["profile"].items():
+        if names is not None and name not in names:
+            continue
+        details = [f"{entry['nulls']} NaN", f"{entry['unique']} valeurs distinctes"]
+        if "min" in entry:
+            details.append(f"min={entry['min']}, max={entry['max']}")
+        if entry.get("monotonic"):
+            details.append(entry["monotonic"])
+        if entry.get("datetime"):
+            details.append("texte convertible en dates (pd.to_datetime)")
+        details.append("ex: " + ", ".join(entry["examples"]))
+        lines.append(f"- {name} : " + " ; ".join(details))
+    return lines
+
+def _column_prefix(name):
+    # "ch_0012" -> "ch", "Temp3" -> "Temp", "voltage_A_12" -> "voltage", "temps" -> "temps"
+    base = re.sub(r"[\d_\-. :/]+$", "", str(name))
+    return re.split(r"[_\-. :/]", base)[0] if base else str(name)
+
+def _mentioned_columns(columns, mentions):
+    if not mentions:
+        return []
+    text = mentions.lower()
+    return [c for c in columns
+            if str(c).lower() in text and re.search(rf"(?<!\w){re.escape(str(c).lower())}(?!\w)", text)]
+
+def _summarize_columns(lecteur_output, mentions, with_profile):
+    columns, dtypes = lecteur_output["columns"], lecteur_output["dtypes"]
+    groups = {}
+    for c in columns:
+        groups.setdefault((_column_prefix(c), dtypes[c]), []).append(c)
+    kept = list(dict.fromkeys(columns[:KEPT_COLUMNS] + _mentioned_columns(columns, mentions)))
+
+    metadata = {k: v for k, v in lecteur_output.items() if k not in ("columns", "dtypes", "profile", "profile_rows")}
+    lines = [str(metadata), f"Colonnes ({len(columns)}, regroupées par préfixe et type) :"]
+    for (prefix, dtype), names in groups.items():
+        if len(names) == 1:
+            lines.append(f"- {names[0]} ({dtype})")
+        else:
+            lines.append(f"- {prefix}* ({dtype}) : {len(names)} colonnes, de {names[0]} à {names[-1]}")
+    lines.append("Colonnes détaillées (citées dans la demande ou en tête du fichier) : "
+                 + str({c: dtypes[c] for c in kept}))
+    if with_profile and lecteur_output.get("profile"):
+        profiled = _profile_lines(lecteur_output, {str(c) for c in kept})
+        if profiled:
+            lines.append(f"Profil de ces colonnes (sur les {lecteur_output['profile_rows']} lignes) :")
+            lines.extend(profiled)
+    return "\n".join(lines)
+
+def _truncate(text, max_tokens, marker):
+    # Début et fin conservés : l'en-tête et la fin d'un log sont les parties utiles
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    return text[:head] + f"\n[... {marker} ...]\n" + text[len(text) - (max_chars - head):]
+
+def section_budget(budget, *texts):
+    """Jetons restant pour une section du prompt une fois les autres parties comptées (None = illimité)"""
+    if budget is None:
+        return None
+    return max(budget - sum(estimate_tokens(t) for t in texts), MIN_SECTION_TOKENS)
+
+# Métadonnées du fichier, suivies du profil des colonnes en texte compact s'il est présent.
+# Avec un budget (en jetons estimés), la description est de moins en moins détaillée jusqu'à
+# tenir : liste complète, résumé par préfixe avec profil, résumé sans profil, puis troncature.
+# mentions : texte (demande, JSON, code) dont les colonnes citées restent toujours détaillées.
+def describe_data(lecteur_output, mentions="", budget=None):
+    candidates = []
+    if len(lecteur_output["columns"]) <= WIDE_COLUMNS:
+        metadata = {k: v for k, v in lecteur_output.items() if k not in ("profile", "profile_rows")}
+        full = [str(metadata)]
+        if lecteur_output.get("profile"):
+            full.append(f"Profil des colonnes (sur les {lecteur_output['profile_rows']} lignes) :")
+            full.extend(_profile_lines(lecteur_output))
+            hidden = lecteur_output["shape"][1] - len(lecteur_output["profile"])
+            if hidden > 0:
+                full.append(f"- ... {hidden} autres colonnes non profilées")
+        candidates.append("\n".join(full))
+    candidates.append(_summarize_columns(lecteur_output, mentions, with_profile=True))
+    candidates.append(_summarize_columns(lecteur_output, mentions, with_profile=False))
+
+    for text in candidates:
+        if budget is None or estimate_tokens(text) <= budget:
+            return text
+    return _truncate(candidates[-1], budget, "description des colonnes tronquée")
+
+# Traceback réduit aux frames utiles : celles du script, et la dernière de chaque traceback
+# (là où l'exception est levée) ; les frames intermédiaires de pandas/matplotlib sont omises.
+# Pour une exception chaînée, seul le dernier traceback est gardé, précédé des messages d'erreur
+# des exceptions d'origine.
+CHAINED_EXCEPTION = re.compile(r"^(The above exception was the direct cause of the following exception:"
+                               r"|During handling of the above exception, another exception occurred:)$", re.M)
+
+def _is_library_frame(path):
+    library = (sys.prefix, sys.base_prefix)
+    return path.startswith(library) or "site-packages" in path or path.endswith((".pyx", ".pxi"))
+
+def trim_traceback(log):
+    if not log:
+        return log
+    sections = CHAINED_EXCEPTION.split(log)
+    causes = [s.strip().splitlines()[-1] for s in sections[:-1:2] if s.strip()]
+    blocks = []  # [frame de bibliothèque (None hors frame), lignes]
+    for line in sections[-1].strip("\n").splitlines():
+        frame = re.match(r'\s*File "([^"]*)", line \d+', line)
+        if frame:
+            blocks.append([_is_library_frame(frame.group(1)), [line]])
+        elif line.startswith((" ", "\t")) and blocks and blocks[-1][0] is not None:
+            blocks[-1][1].append(line)  # Ligne de code ou marqueurs ^^^ de la frame
+        else:
+            blocks.append([None, [line]])
+
+    kept, omitted = [], 0
+    if causes:
+        kept.append("Exception(s) d'origine : " + " | ".join(causes))
+    for i, (is_library, block) in enumerate(blocks):
+        last_frame = i + 1 == len(blocks) or blocks[i + 1][0] is None
+        if is_library and not last_frame:
+            omitted += 1
+            continue
+        if omitted:
+            kept.append(f"  [... {omitted} frame(s) de bibliothèques omise(s)]")
+            omitted = 0
+        kept.extend(block)
+    return "\n".join(kept) + "\n"
+
+def interpreteur_context(INTERPRETER_CONTEXT, initial_prompt, lecteur_output, budget=None):
+    head = f"""{INTERPRETER_CONTEXT}
+Voici la demande utilisateur :
+{initial_prompt}
+
+Voici le JSON récapitulant le contenu du fichier contenant les données à afficher :
+"""
+    return head + describe_data(lecteur_output, initial_prompt, section_budget(budget, head)) + "\n"
+
+def codeur_context(CODEUR_CONTEXT, interpreteur_output, lecteur_output, budget=None):
+    head = f"""{CODEUR_CONTEXT}
+Voici le JSON structuré de la demande utilisateur :
+{interpreteur_output}
+
+Voici les metadonnees du dataframe contenant les données :
+"""
+    return head + describe_data(lecteur_output, interpreteur_output, section_budget(budget, head)) + "\n"
+
+def verificateur_context(VERIFICATEUR_CONTEXT, initial_prompt, interpreteur_output, codeur_output, budget=None):
+    # Avec un budget, chaque section est tronquée à ce qui reste après les précédentes, par ordre
+    # de priorité : la demande, le code à vérifier, puis le JSON qui ne fait que les relier
+    head = f"""{VERIFICATEUR_CONTEXT}
+Voici la demande utilisateur :
+"""
+    prompt_part = "\nVoici le json structuré de la demande utilisateur :\n"
+    code_part = "\nVoici le code python :\n"
+    remaining = section_budget(budget, head, prompt_part, code_part)
+    if remaining is not None:
+        initial_prompt = _truncate(initial_prompt, remaining, "demande tronquée")
+        codeur_output = _truncate(codeur_output, section_budget(remaining, initial_prompt), "code tronqué")
+        interpreteur_output = _truncate(interpreteur_output, section_budget(remaining, initial_prompt, codeur_output),
+                                        "JSON tronqué")
+    return f"""{head}{initial_prompt}
+{prompt_part}{interpreteur_output}
+{code_part}{codeur_output}
+"""
+
+def debugger_context(DEBUGGER_CONTEXT, codeur_output, log, budget=None):
+    head = f"""{DEBUGGER_CONTEXT}
+Voici la code python contenant une ou plusieurs erreurs :
+{codeur_output}
+
+Voici le log d'erreur après l'avoir lancé :
+"""
+    log = trim_traceback(log)
+    remaining = section_budget(budget, head)
+    if remaining is not None:
+        log = _truncate(log, remaining, "log tronqué")
+    return head + log + "\n"
@@ -1,8 +1,17 @@
 import streamlit as st
+import hashlib
 import os
+import shutil
 import tempfile
-from langchain_openai import ChatOpenAI
-from ICG_utils import read_data, run_script, verificateur_context, interpreteur_context, codeur_context, debugger_context
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from ICG_utils import read_data, list_sheets, cache_dataframe, store_upload
+from ICG_executor import execute_code
+from ICG_history import History
+from ICG_jobs import CancellableLLM, JobCancelled, JobQueue
+from ICG_render import EXPORT_FORMATS
+from ICG_pipeline import (Runtime, generate_chart, make_llm, make_metrics, make_render_cache, make_response_cache,
+                          make_worker_pool)
 
 # Configuration de matplotlib pour éviter les problèmes d'affichage
 import matplotlib
@@ -80,52 +89,224 @@ st.markdown("""
 #################################### Définition du LLM ####################################
 def initialize_llm():
     """Initialise le modèle LLM"""
-    API_KEY = st.secrets.get("OPENAI_API_KEY", "")
-    LLM_MODEL = st.secrets.get("LLM_MODEL", "gpt-4o-mini")
-    
-    if not API_KEY:
-        st.error("⚠ Veuillez configurer OPENAI_API_KEY dans .streamlit/secrets.toml")
+    try:
+        llm = make_llm(st.secrets)
+    except ValueError as e:
+        st.error(f"⚠ Configuration des modèles invalide dans .streamlit/secrets.toml : {e}")
+        st.stop()
+    if llm is None:
+        st.error("⚠ Veuillez configurer OPENAI_API_KEY (ou OPENAI_BASE_URL) dans .streamlit/secrets.toml")
         st.stop()
+    return llm
+
+#################################### Ressources partagées ####################################
+@st.cache_resource
+def get_runtime():
+    """
+    Ressources partagées par toutes les sessions du serveur : caches des réponses LLM et
+    des rendus, pool de workers d'exécution, export des mesures. La progression des pipelines
+    s'affiche avec st.spinner.
+    """
+    return Runtime(st.secrets, make_response_cache(st.secrets), make_worker_pool(st.secrets),
+                   progress=st.spinner, metrics=make_metrics(st.secrets), render_cache=make_render_cache(st.secrets))
+
+@st.cache_resource
+def get_job_queue():
+    """File des générations : PIPELINE_WORKERS pipelines à la fois pour tout le serveur, les autres attendent"""
+    return JobQueue(int(st.secrets.get("PIPELINE_WORKERS", 2)))
+
+@st.cache_resource
+def get_export_executor():
+    """Exports pleine qualité en arrière-plan, EXPORT_WORKERS à la fois pour tout le serveur"""
+    return ThreadPoolExecutor(max_workers=int(st.secrets.get("EXPORT_WORKERS", 1)), thread_name_prefix="gag_export")
+
+# Dossiers de travail des sessions : Streamlit ne signale pas la fin d'une session, un dossier
+# est donc supprimé quand il n'a pas servi depuis WORKSPACE_TTL_HOURS (sa date de modification
+# est rafraîchie à chaque interaction de la session)
+WORKSPACE_PREFIX = "gag_session_"
+
+def expire_workspaces(max_age):
+    """Supprime les dossiers de travail inutilisés depuis plus de max_age secondes"""
+    root, limit = tempfile.gettempdir(), time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if name.startswith(WORKSPACE_PREFIX) and os.path.isdir(path) and os.path.getmtime(path) < limit:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass  # Supprimé entre-temps par une autre session
+
+def session_data():
+    """DataFrame pré-converti, options de réduction et colonnes du fichier de la session (None sans fichier)"""
+    if not st.session_state.data_file:
+        return None, None, None
+    data = cache_dataframe(st.session_state.data_file, sheet=st.session_state.data_sheet)
+    data_info = read_data(st.session_state.data_file, sheet=st.session_state.data_sheet)
+    return data, get_runtime().decimation_options(data_info), data_info["columns"]
+
+#################################### Génération en arrière-plan ####################################
+def run_generation(job, runtime, llm, user_prompt, data_file, is_first_request, previous_code, use_cache, workdir, sheet,
+                   stream_code):
+    """Pipeline exécutée par la file : progression, code partiel et annulation passent par le job"""
+    on_code = job.update_code if stream_code else None
+    return generate_chart(runtime.for_job(job), CancellableLLM(llm, job.cancel_event), user_prompt, data_file,
+                          is_first_request, previous_code, use_cache, on_code, workdir, sheet)
+
+def finish_generation(success, chart, report):
+    """Applique le résultat d'une génération à la session (graphique, code, message)"""
+    st.session_state.last_metrics = report.get("metrics")
+    
+    if success:
+        st.session_state.current_chart = chart
+        st.session_state.chart_code = report.get("clean_code")
+        st.session_state.decimation = report.get("decimation")
+        # Sauvegarder le code généré
+        if "clean_code" in report:
+            st.session_state.generated_code = report["clean_code"]
+            # Afficher automatiquement l'éditeur de code après une génération réussie
+            st.session_state.show_code_editor = True
+        
+        # Marquer qu'on a fait au moins une requête
+        if st.session_state.is_first_request:
+            st.session_state.is_first_request = False
+        
+        # Message différent selon le type de pipeline
+        pipeline_type = report.get("pipeline", "initial")
+        if pipeline_type == "initial":
+            message = "✓ Graphique généré avec succès"
+        else:
+            message = "✓ Graphique modifié avec succès"
+        if report.get("local_edit"):
+            message += f" (retouche locale : {report['local_edit']})"
+        
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": message
+        })
+    elif report.get("error_category") == "cancelled":
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": "✗ Génération annulée"
+        })
+    else:
+        error_msg = "✗ Erreur lors de la génération du graphique"
+        if "error" in report:
+            error_msg += f"\n\nDétails: {report['error']}"
+        elif "log_debug" in report:
+            error_msg += f"\n\nErreur après débogage: {report['log_debug']}"
+        elif "log" in report:
+            error_msg += f"\n\nErreur: {report['log']}"
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": error_msg
+        })
+
+@st.fragment(run_every=1)
+def show_job():
+    """Suivi de la génération en cours, rafraîchi chaque seconde jusqu'à son résultat"""
+    job = st.session_state.job
+    if job.done():
+        st.session_state.job = None
+        try:
+            success, chart, report = job.result()
+        except (JobCancelled, CancelledError):
+            # Annulé avant d'avoir démarré
+            success, chart, report = False, None, {"error_category": "cancelled"}
+        except Exception as e:
+            success, chart, report = False, None, {"error": str(e)}
+        finish_generation(success, chart, report)
+        st.rerun()
+    
+    position = get_job_queue().position(job)
+    if job.cancelled:
+        st.info("⏹ Annulation en cours...")
+    elif position:
+        st.info(f"⏳ En attente : {position} génération(s) avant la vôtre")
+    else:
+        st.info(f"{job.stage or '⏳ Démarrage...'} ({job.elapsed():.0f} s)")
+    # Code reçu en streaming
+    if job.code:
+        st.code(job.code, language="python")
+    if st.button("✖ Annuler", disabled=job.cancelled, help="Interrompt les appels au modèle et l'exécution du script"):
+        job.cancel()
+        st.rerun()
+
+#################################### Exports ####################################
+def show_exports():
+    """
+    Téléchargement en pleine qualité : le graphique affiché n'est qu'un aperçu, l'export
+    au format choisi réexécute son code en arrière-plan, à la demande.
+    """
+    fmt = st.selectbox("Format d'export", list(EXPORT_FORMATS), format_func=lambda f: EXPORT_FORMATS[f][0])
+    code = st.session_state.chart_code
+    key = (hashlib.sha256(code.encode("utf-8")).hexdigest(), fmt)
+    # Les exports d'un graphique qui n'est plus affiché sont oubliés
+    st.session_state.exports = {k: v for k, v in st.session_state.exports.items() if k[0] == key[0]}
+    job = st.session_state.exports.get(key)
     
-    llm = ChatOpenAI(
-        api_key=API_KEY,
-        model=LLM_MODEL,
-        temperature=0.7
+    if job is None:
+        if st.button("⬇ Exporter", help="Produit le fichier en arrière-plan"):
+            data, decimation, _ = session_data()
+            st.session_state.exports[key] = get_export_executor().submit(get_runtime().export, code, data, decimation, fmt)
+            st.rerun()
+    elif not job.done():
+        st.button("⏳ Export en cours...", help="Cliquez pour actualiser")
+    else:
+        try:
+            result = job.result()
+        except Exception as e:
+            result = {"figure": None, "log": str(e)}
+        if result["figure"] is not None:
+            st.download_button(
+                label="⬇ Télécharger",
+                data=result["figure"],
+                file_name=f"graphique.{fmt}",
+                mime=EXPORT_FORMATS[fmt][1]
+            )
+        else:
+            st.error("✗ Export impossible")
+            with st.expander("Détails"):
+                st.code(result["log"] or "Aucun graphique enregistré")
+            if st.button("🔄 Réessayer l'export"):
+                del st.session_state.exports[key]
+                st.rerun()
+
+#################################### Mesures ####################################
+def show_metrics(metrics):
+    """Panneau de diagnostic : d'où vient la latence du dernier tour (modèle, contrôle, exécution)"""
+    summary = metrics.get("summary", {})
+    started = metrics["started"]
+    st.caption(
+        f"Total {summary.get('total_s', 0):.2f} s · modèle {summary.get('llm_s', 0):.2f} s "
+        f"({summary.get('llm_calls', 0)} appel(s), {summary.get('prompt_tokens', 0):.0f} + "
+        f"{summary.get('completion_tokens', 0):.0f} jetons) · exécution {summary.get('exec_s', 0):.2f} s "
+        f"(CPU {summary.get('exec_cpu_s', 0):.2f} s) · contrôle {summary.get('preflight_s', 0):.3f} s · "
+        f"débogage {summary.get('debug_attempts', 0)} tentative(s)"
     )
-    return llm
+    # Débuts relatifs au début du tour, pour lire les chevauchements (vérification // exécution)
+    relative = lambda records: [{**r, "start": round(r["start"] - started, 3)} for r in records]
+    st.markdown("**Étapes**")
+    st.dataframe([{k: v for k, v in r.items() if k != "end"} for r in relative(metrics["stages"])], hide_index=True)
+    if metrics["llm"]:
+        st.markdown("**Appels aux agents**")
+        st.dataframe(relative(metrics["llm"]), hide_index=True)
+    if metrics["executions"]:
+        st.markdown("**Exécutions**")
+        st.dataframe(relative(metrics["executions"]), hide_index=True)
 
 #################################### Gestion de l'historique ####################################
 def save_current_state():
     """Sauvegarde l'état actuel dans l'historique avant une modification"""
-    import shutil
-    
     # Ne sauvegarder que si on a au moins un graphique
-    if st.session_state.current_chart and os.path.exists(st.session_state.current_chart):
-        # Créer une copie du graphique avec un nom unique
-        history_chart_path = f"graphique_history_{len(st.session_state.history)}.png"
-        try:
-            shutil.copy(st.session_state.current_chart, history_chart_path)
-            
-            # Sauvegarder l'état complet
-            state = {
-                "code": st.session_state.generated_code,
-                "chart_path": history_chart_path,
-                "messages": st.session_state.messages.copy(),
-            }
-            
-            st.session_state.history.append(state)
-            
-            # Limiter l'historique à 10 états pour éviter de consommer trop de mémoire
-            if len(st.session_state.history) > 10:
-                # Supprimer le plus ancien état et son fichier
-                old_state = st.session_state.history.pop(0)
-                if os.path.exists(old_state["chart_path"]):
-                    try:
-                        os.remove(old_state["chart_path"])
-                    except:
-                        pass
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde de l'historique: {e}")
+    if st.session_state.current_chart:
+        # Le PNG est stocké une seule fois par contenu, les messages par leur nombre actuel
+        # (la conversation ne fait que s'allonger) ; HISTORY_MAX_MB borne la taille totale
+        st.session_state.history.push(
+            st.session_state.generated_code,
+            st.session_state.current_chart,
+            st.session_state.decimation,
+            len(st.session_state.messages),
+        )
 
 def restore_previous_state():
     """Restaure l'état précédent depuis l'historique"""
@@ -133,421 +314,17 @@ def restore_previous_state():
         # Récupérer le dernier état
         previous_state = st.session_state.history.pop()
         
-        # Restaurer l'état
+        # Restaurer l'état (la conversation est ramenée à sa longueur d'alors)
         st.session_state.generated_code = previous_state["code"]
-        st.session_state.messages = previous_state["messages"]
+        del st.session_state.messages[previous_state["messages"]:]
         
-        # Copier le graphique de l'historique vers le graphique actuel
-        if os.path.exists(previous_state["chart_path"]):
-            import shutil
-            shutil.copy(previous_state["chart_path"], "graphique.png")
-            st.session_state.current_chart = os.path.join(os.getcwd(), "graphique.png")
-            
-            # Supprimer le fichier de l'historique
-            try:
-                os.remove(previous_state["chart_path"])
-            except:
-                pass
+        st.session_state.current_chart = previous_state["chart"]
+        st.session_state.chart_code = previous_state["code"]
+        st.session_state.decimation = previous_state["decimation"]
         
         return True
     return False
 
-#################################### Contextes des agents ####################################
-INTERPRETER_CONTEXT = """
-Tu es un interpréteur scientifique spécialisé en physique.
-
-Ton rôle est d'analyser la demande utilisateur concernant l'affichage
-de graphique et de produire une structure JSON.
-
-Ne génère pas de code, ne fais aucune explication textuelle, écris seulement le JSON.
-"""
-
-CODEUR_CONTEXT = """
-Tu es un générateur de code scientifique Python.
-
-À partir d'une description structurée en JSON, tu dois produire
-un code clair, commenté et autonome utilisant numpy, matplotlib et seaborn.
-Le code doit produire un graphique physique cohérent.
-Attention à bien afficher toutes les grandeurs demandées et les légendes.
-
-Bibliothèques disponibles :
-- matplotlib.pyplot (plt) : pour les graphiques standards
-- seaborn (sns) : pour les graphiques statistiques élégants (distribution, heatmap, pairplot, etc.)
-- pandas (pd) : pour la manipulation des données
-- numpy (np) : pour les calculs numériques
-
-Ne fais aucune explication textuelle : écris seulement le code Python.
-Ta réponse doit pouvoir être directement exécutée donc ne renvoie que
-du code python pur !
-
-Pour charger les données, utilise pandas.
-
-Tu peux utiliser seaborn pour créer des graphiques plus esthétiques quand c'est approprié.
-N'oublie pas d'importer seaborn si tu l'utilises : import seaborn as sns
-
-Sauvegarde le graphique dans le dossier de travail sous le nom graphique.png
-
-IMPORTANT : N'utilise PAS plt.show() car le code s'exécute en mode non-interactif.
-Utilise seulement plt.savefig('graphique.png') puis plt.close()
-"""
-
-VERIFICATEUR_CONTEXT = """
-Tu es un vérificateur de code python.
-
-Tu compares la demande initiale, la structure JSON et le code généré.
-
-Tu évalues la cohérence physique, conceptuelle et graphique.
-
-Tu vérifies que le code affiche toutes les grandeurs demandées.
-
-Tu fais attention à ce que le code ne contienne pas de texte qui n'est pas du code.
-
-Tu rends un rapport JSON ayant la même structure que celui ci-dessous mais avec tes corrections
-
-Ne réécris pas le code, ne fais aucune explication textuelle,
-
-rend uniquement un JSON si le code n'est pas conforme sinon ne renvoie qu'un message disant 'CODE CONFORME'
-"""
-
-DEBUGGER_CONTEXT = """
-Tu es un agent spécialisé dans le débogage de code Python scientifique.
-
-Ton rôle intervient après l'exécution du code :
-- Si le code a échoué à l'exécution, tu reçois le code source et le message d'erreur.
-- Tu dois identifier précisément la cause de l'erreur et corriger le code en conséquence.
-
-Règles impératives :
-1. Ta sortie doit contenir uniquement le code Python corrigé (aucun texte explicatif).
-2. Ne modifie pas le contenu au-delà de ce qui est nécessaire pour corriger l'erreur.
-3. Si plusieurs corrections sont possibles, choisis la plus simple et robuste.
-4. Si une information est manquante pour corriger l'erreur, laisse "???" et ajoute un commentaire dans le code à cet endroit.
-5. Ne reformate pas entièrement le fichier : conserve le style existant.
-6. N'ajoute ni préambule, ni conclusion, ni phrase du type "Voici le code corrigé".
-
-Tu renvoies uniquement le code corrigé, sans aucun texte autour.
-"""
-
-MODIFICATEUR_CONTEXT = """
-Tu es un agent spécialisé dans la modification de code Python scientifique pour matplotlib et seaborn.
-
-Ton rôle est de MODIFIER le code existant selon la nouvelle demande de l'utilisateur.
-
-IMPORTANT : Tu travailles sur un code DÉJÀ FONCTIONNEL. Tu dois :
-1. Conserver toute la structure existante du code (imports, chargement des données, etc.)
-2. MODIFIER uniquement les parties nécessaires pour répondre à la nouvelle demande
-3. AJOUTER les éléments demandés sans supprimer ce qui fonctionne déjà
-4. Maintenir la cohérence du style de code
-5. Tu peux utiliser seaborn (sns) si cela améliore le graphique
-
-Exemples de modifications possibles avec matplotlib :
-- Changer les couleurs : modifier les paramètres color= dans plt.plot()
-- Ajouter des lignes : ajouter plt.axvline() ou plt.axhline()
-- Modifier les titres/labels : changer plt.title(), plt.xlabel(), plt.ylabel()
-- Ajouter des courbes : ajouter de nouveaux plt.plot()
-- Changer le style : modifier linestyle=, marker=, linewidth=
-- Modifier les échelles : ajouter plt.xlim(), plt.ylim()
-- Ajouter des annotations : ajouter plt.text(), plt.annotate()
-
-Exemples de modifications possibles avec seaborn :
-- Passer de matplotlib à seaborn : remplacer plt.plot() par sns.lineplot()
-- Ajouter un style seaborn : sns.set_style(), sns.set_palette()
-- Créer des graphiques statistiques : sns.boxplot(), sns.violinplot(), sns.heatmap()
-- Améliorer l'esthétique : utiliser seaborn pour des graphiques plus élégants
-
-Règles impératives :
-1. Ta sortie doit contenir UNIQUEMENT le code Python complet modifié
-2. NE génère AUCUN texte explicatif, AUCUN commentaire sur les modifications
-3. Le code doit être directement exécutable
-4. CONSERVE plt.savefig('graphique.png') et plt.close() à la fin
-5. N'utilise PAS plt.show()
-6. Si tu ajoutes seaborn, n'oublie pas d'ajouter l'import : import seaborn as sns
-7. Si la demande n'est pas claire, fais une modification raisonnable
-
-Tu renvoies UNIQUEMENT le code Python modifié complet, sans aucun texte autour.
-"""
-
-#################################### Fonctions des agents ####################################
-def interpreteur(llm, interpreteur_input):
-    response = llm.invoke(input=interpreteur_input)
-    return response.content
-
-def codeur(llm, codeur_input):
-    response = llm.invoke(input=codeur_input)
-    code = response.content
-    
-    # Nettoyer le code des balises markdown
-    if "```python" in code:
-        # Extraire le code entre ```python et ```
-        code = code.split("```python")[1].split("```")[0].strip()
-    elif "```" in code:
-        # Extraire le code entre ``` et ```
-        code = code.split("```")[1].split("```")[0].strip()
-    
-    return code
-
-def verificateur(llm, verificateur_input):
-    response = llm.invoke(input=verificateur_input)
-    return response.content
-
-def debugger(llm, debugger_input):
-    response = llm.invoke(input=debugger_input)
-    code = response.content
-    
-    # Nettoyer le code des balises markdown
-    if "```python" in code:
-        # Extraire le code entre ```python et ```
-        code = code.split("```python")[1].split("```")[0].strip()
-    elif "```" in code:
-        # Extraire le code entre ``` et ```
-        code = code.split("```")[1].split("```")[0].strip()
-    
-    return code
-
-def modificateur(llm, modificateur_input):
-    """Agent qui modifie le code existant selon une nouvelle demande"""
-    response = llm.invoke(input=modificateur_input)
-    code = response.content
-    
-    # Nettoyer le code des balises markdown
-    if "```python" in code:
-        code = code.split("```python")[1].split("```")[0].strip()
-    elif "```" in code:
-        code = code.split("```")[1].split("```")[0].strip()
-    
-    return code
-
-#################################### Pipeline de génération ####################################
-def generate_chart_initial(llm, user_prompt, data_file_path):
-    """
-    Pipeline COMPLÈTE pour la première génération de graphique
-    
-    Returns:
-        tuple: (success: bool, chart_path: str, report: dict)
-    """
-    report = {"pipeline": "initial"}
-    
-    try:
-        # Lecture du fichier de données
-        with st.spinner("📖 Lecture du fichier de données..."):
-            lecteur_output = read_data(data_file_path)
-            report["lecteur_output"] = lecteur_output
-        
-        # Interprétation
-        with st.spinner("🧠 Interprétation de votre demande..."):
-            interpreteur_input = interpreteur_context(INTERPRETER_CONTEXT, user_prompt, lecteur_output)
-            interpreteur_output = interpreteur(llm, interpreteur_input)
-            report["interpreteur_output"] = interpreteur_output
-        
-        # Codage
-        with st.spinner("💻 Génération du code Python..."):
-            codeur_input = codeur_context(CODEUR_CONTEXT, interpreteur_output, lecteur_output)
-            codeur_output = codeur(llm, codeur_input)
-            report["codeur_output"] = codeur_output
-            report["clean_code"] = codeur_output  # Code nettoyé sans les balises markdown
-        
-        # Vérification
-        with st.spinner("✅ Vérification du code..."):
-            verificateur_input = verificateur_context(VERIFICATEUR_CONTEXT, user_prompt, interpreteur_output, codeur_output)
-            verificateur_output = verificateur(llm, verificateur_input)
-            report["verificateur_output"] = verificateur_output
-        
-        # Exécution du code
-        with st.spinner("🚀 Exécution du code et génération du graphique..."):
-            # Créer un fichier temporaire pour le code
-            # Ajouter la configuration matplotlib au début du code
-            code_with_matplotlib = """import matplotlib
-matplotlib.use('Agg')
-""" + codeur_output
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, dir=os.getcwd()) as f:
-                f.write(code_with_matplotlib)
-                code_file = f.name
-            
-            log = run_script(code_file)
-            report["log"] = log
-            
-            # Si erreur, lancer le debugger
-            if log:
-                with st.spinner("🔧 Débogage en cours..."):
-                    debugger_input = debugger_context(DEBUGGER_CONTEXT, codeur_output, log)
-                    debugger_output = debugger(llm, debugger_input)
-                    report["debugger_output"] = debugger_output
-                    
-                    # Réexécuter le code débogué
-                    # Ajouter la configuration matplotlib au début du code
-                    debug_code_with_matplotlib = """import matplotlib
-matplotlib.use('Agg')
-""" + debugger_output
-                    
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, dir=os.getcwd()) as f:
-                        f.write(debug_code_with_matplotlib)
-                        debug_code_file = f.name
-                    
-                    log_debug = run_script(debug_code_file)
-                    report["log_debug"] = log_debug
-                    
-                    # Nettoyer les fichiers temporaires
-                    try:
-                        os.remove(debug_code_file)
-                    except:
-                        pass
-                    
-                    if log_debug:
-                        # Nettoyer le fichier de code
-                        try:
-                            os.remove(code_file)
-                        except:
-                            pass
-                        return False, None, report
-            
-            # Nettoyer le fichier de code
-            try:
-                os.remove(code_file)
-            except:
-                pass
-            
-            # Vérifier si le graphique a été créé
-            chart_path = os.path.join(os.getcwd(), "graphique.png")
-            if os.path.exists(chart_path):
-                return True, chart_path, report
-            else:
-                return False, None, report
-                
-    except Exception as e:
-        report["error"] = str(e)
-        return False, None, report
-
-def generate_chart_modification(llm, user_prompt, previous_code, data_file_path):
-    """
-    Pipeline SIMPLIFIÉE pour la modification d'un graphique existant
-    
-    Args:
-        llm: Le modèle de langage
-        user_prompt: La nouvelle demande de l'utilisateur
-        previous_code: Le code précédemment généré
-        data_file_path: Le chemin vers le fichier de données
-    
-    Returns:
-        tuple: (success: bool, chart_path: str, report: dict)
-    """
-    report = {"pipeline": "modification"}
-    
-    try:
-        # Lecture du fichier de données (pour avoir les métadonnées)
-        lecteur_output = read_data(data_file_path)
-        report["lecteur_output"] = lecteur_output
-        
-        # Construction du contexte pour le modificateur
-        with st.spinner("✏️ Modification du code existant..."):
-            modificateur_input = f"""{MODIFICATEUR_CONTEXT}
-
-Voici le CODE ACTUEL qui fonctionne :
-```python
-{previous_code}
-```
-
-Voici les MÉTADONNÉES du fichier de données :
-{lecteur_output}
-
-Voici la NOUVELLE DEMANDE de l'utilisateur :
-{user_prompt}
-
-Ta tâche : Modifie le code ci-dessus pour intégrer cette nouvelle demande.
-Renvoie le code Python complet modifié, sans aucun texte explicatif.
-"""
-            
-            modificateur_output = modificateur(llm, modificateur_input)
-            report["modificateur_output"] = modificateur_output
-            report["clean_code"] = modificateur_output
-        
-        # Exécution du code modifié
-        with st.spinner("🚀 Exécution du code modifié..."):
-            # Ajouter la configuration matplotlib
-            code_with_matplotlib = """import matplotlib
-matplotlib.use('Agg')
-""" + modificateur_output
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, dir=os.getcwd()) as f:
-                f.write(code_with_matplotlib)
-                code_file = f.name
-            
-            log = run_script(code_file)
-            report["log"] = log
-            
-            # Si erreur, lancer le debugger
-            if log:
-                with st.spinner("🔧 Débogage en cours..."):
-                    debugger_input = debugger_context(DEBUGGER_CONTEXT, modificateur_output, log)
-                    debugger_output = debugger(llm, debugger_input)
-                    report["debugger_output"] = debugger_output
-                    
-                    # Réexécuter le code débogué
-                    debug_code_with_matplotlib = """import matplotlib
-matplotlib.use('Agg')
-""" + debugger_output
-                    
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, dir=os.getcwd()) as f:
-                        f.write(debug_code_with_matplotlib)
-                        debug_code_file = f.name
-                    
-                    log_debug = run_script(debug_code_file)
-                    report["log_debug"] = log_debug
-                    
-                    # Nettoyer les fichiers temporaires
-                    try:
-                        os.remove(debug_code_file)
-                    except:
-                        pass
-                    
-                    if log_debug:
-                        # Nettoyer le fichier de code
-                        try:
-                            os.remove(code_file)
-                        except:
-                            pass
-                        return False, None, report
-                    
-                    # Si le debugger a réussi, utiliser son code
-                    report["clean_code"] = debugger_output
-            
-            # Nettoyer le fichier de code
-            try:
-                os.remove(code_file)
-            except:
-                pass
-            
-            # Vérifier si le graphique a été créé
-            chart_path = os.path.join(os.getcwd(), "graphique.png")
-            if os.path.exists(chart_path):
-                return True, chart_path, report
-            else:
-                return False, None, report
-                
-    except Exception as e:
-        report["error"] = str(e)
-        return False, None, report
-
-def generate_chart(llm, user_prompt, data_file_path, is_first_request, previous_code=None):
-    """
-    Point d'entrée principal pour la génération de graphiques
-    
-    Args:
-        llm: Le modèle de langage
-        user_prompt: La demande de l'utilisateur
-        data_file_path: Le chemin vers le fichier de données
-        is_first_request: True si c'est la première demande, False sinon
-        previous_code: Le code précédemment généré (None si première demande)
-    
-    Returns:
-        tuple: (success: bool, chart_path: str, report: dict)
-    """
-    if is_first_request or previous_code is None:
-        # Pipeline complète pour la première demande
-        return generate_chart_initial(llm, user_prompt, data_file_path)
-    else:
-        # Pipeline de modification pour les demandes suivantes
-        return generate_chart_modification(llm, user_prompt, previous_code, data_file_path)
-
 #################################### Interface Streamlit ####################################
 def main():
     # En-tête
@@ -559,9 +336,27 @@ def main():
     if "messages" not in st.session_state:
         st.session_state.messages = []
     if "current_chart" not in st.session_state:
-        st.session_state.current_chart = None
+        st.session_state.current_chart = None  # Image PNG du graphique actuel (bytes)
+    if "chart_code" not in st.session_state:
+        st.session_state.chart_code = None  # Code qui a produit le graphique actuel, pour les exports
+    if "exports" not in st.session_state:
+        st.session_state.exports = {}  # (empreinte du code, format) -> Future de Runtime.export
+    if "decimation" not in st.session_state:
+        st.session_state.decimation = None  # Bilan de la réduction des séries du graphique actuel
+    if "workspace" not in st.session_state:
+        # Dossier de travail propre à la session : les sessions ne partagent aucun fichier.
+        # Chaque nouvelle session fait le ménage des dossiers abandonnés.
+        expire_workspaces(float(st.secrets.get("WORKSPACE_TTL_HOURS", 24)) * 3600)
+        st.session_state.workspace = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX)
+    # Session active : son dossier n'expire pas (recréé s'il a expiré pendant une longue inactivité)
+    os.makedirs(st.session_state.workspace, exist_ok=True)
+    os.utime(st.session_state.workspace)
     if "data_file" not in st.session_state:
         st.session_state.data_file = None
+    if "upload_id" not in st.session_state:
+        st.session_state.upload_id = None  # Identifiant Streamlit du fichier téléversé déjà enregistré
+    if "data_sheet" not in st.session_state:
+        st.session_state.data_sheet = None  # Feuille choisie pour un fichier Excel
     if "llm" not in st.session_state:
         st.session_state.llm = initialize_llm()
     if "generated_code" not in st.session_state:
@@ -571,7 +366,16 @@ def main():
     if "is_first_request" not in st.session_state:
         st.session_state.is_first_request = True
     if "history" not in st.session_state:
-        st.session_state.history = []  # Historique des états (code, graphique, messages)
+        # Historique des états (code, graphique, messages) pour le retour arrière
+        st.session_state.history = History(int(float(st.secrets.get("HISTORY_MAX_MB", 50)) * 1024 * 1024))
+    if "use_cache" not in st.session_state:
+        st.session_state.use_cache = True
+    if "show_metrics" not in st.session_state:
+        st.session_state.show_metrics = False
+    if "job" not in st.session_state:
+        st.session_state.job = None  # Génération en cours dans la file (ICG_jobs.Job)
+    if "last_metrics" not in st.session_state:
+        st.session_state.last_metrics = None  # Mesures du dernier tour (étapes, appels, exécutions)
     
     # Sidebar pour l'upload et la configuration
     with st.sidebar:
@@ -585,19 +389,35 @@ def main():
         )
         
         if uploaded_file is not None:
-            # Sauvegarder temporairement le fichier
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
-            st.session_state.data_file = temp_path
+            # Enregistrement par empreinte du contenu, une seule fois par téléversement :
+            # les réexécutions suivantes du script réutilisent le chemin de la session
+            if (uploaded_file.file_id != st.session_state.upload_id
+                    or not os.path.exists(st.session_state.data_file or "")):
+                st.session_state.data_file = store_upload(uploaded_file.name, uploaded_file.getvalue())
+                st.session_state.upload_id = uploaded_file.file_id
+            data_path = st.session_state.data_file
+            
+            # Classeur Excel : liste des feuilles sans les charger, seule la feuille choisie est lue
+            sheet = None
+            if data_path.endswith(".xlsx"):
+                sheets = list_sheets(data_path)
+                if len(sheets) > 1:
+                    labels = {s["name"]: f"{s['name']} ({s['rows']} lignes × {s['columns']} colonnes)" for s in sheets}
+                    sheet = st.selectbox("📑 Feuille", list(labels), format_func=labels.get)
+                else:
+                    sheet = sheets[0]["name"]
+            st.session_state.data_sheet = sheet
+            
+            # Conversion unique en pickle (sans effet si ce contenu a déjà été converti)
+            with st.spinner("📦 Préparation des données..."):
+                cache_dataframe(data_path, sheet=sheet)
             
             # Afficher les informations du fichier
             st.success(f"✓ Fichier chargé : {uploaded_file.name}")
             
             # Afficher un aperçu des données
             with st.expander("👁 Aperçu des données"):
-                data_info = read_data(temp_path)
+                data_info = read_data(data_path, sheet=sheet)
                 st.write(f"**Dimensions:** {data_info['shape'][0]} lignes × {data_info['shape'][1]} colonnes")
                 st.write(f"**Colonnes:** {', '.join(data_info['columns'])}")
         
@@ -605,29 +425,54 @@ def main():
         
         # Bouton pour réinitialiser la conversation
         if st.button("🔄 Réinitialiser"):
+            # Une génération en cours n'a plus de conversation où s'afficher
+            if st.session_state.job is not None:
+                st.session_state.job.cancel()
+                st.session_state.job = None
             st.session_state.messages = []
             st.session_state.current_chart = None
+            st.session_state.chart_code = None
+            st.session_state.decimation = None
             st.session_state.generated_code = None
             st.session_state.is_first_request = True
             st.session_state.show_code_editor = False
             
-            # Nettoyer l'historique et supprimer les fichiers
-            for state in st.session_state.history:
-                if "chart_path" in state and os.path.exists(state["chart_path"]):
-                    try:
-                        os.remove(state["chart_path"])
-                    except:
-                        pass
-            st.session_state.history = []
+            # Nettoyer l'historique
+            st.session_state.history.clear()
             
-            # Supprimer le graphique actuel
-            if os.path.exists("graphique.png"):
+            # Supprimer le graphique actuel du dossier de la session
+            chart_file = os.path.join(st.session_state.workspace, "graphique.png")
+            if os.path.exists(chart_file):
                 try:
-                    os.remove("graphique.png")
+                    os.remove(chart_file)
                 except:
                     pass
             st.rerun()
         
+        # Cache des réponses LLM
+        response_cache = get_runtime().cache
+        if response_cache is not None:
+            st.session_state.use_cache = st.checkbox(
+                "♻ Réutiliser les réponses en cache",
+                value=st.session_state.use_cache,
+                help="Décochez pour forcer un nouvel appel au modèle"
+            )
+            cache_stats = response_cache.stats()
+            st.caption(f"Cache : {cache_stats['hits']} hit(s) / {cache_stats['misses']} miss, "
+                       f"{cache_stats['entries']} réponse(s), {cache_stats['bytes'] / 1024:.0f} Ko")
+        render_cache = get_runtime().render_cache
+        if render_cache is not None:
+            render_stats = render_cache.stats()
+            st.caption(f"Rendus : {render_stats['hits']} hit(s) / {render_stats['misses']} miss, "
+                       f"{render_stats['entries']} graphique(s), {render_stats['bytes'] / 1024:.0f} Ko")
+        
+        # Panneau de diagnostic des temps du dernier tour
+        st.session_state.show_metrics = st.checkbox(
+            "🔬 Afficher les mesures",
+            value=st.session_state.show_metrics,
+            help="Durée de chaque étape, jetons et temps d'exécution du dernier tour"
+        )
+        
         st.divider()
         st.markdown("### 📖 Guide")
         st.markdown("""
@@ -649,6 +494,12 @@ def main():
     # Zone principale - Chat et graphique
     col1, col2 = st.columns([1, 1])
     
+    with col2:
+        st.subheader("📈 Graphique")
+        # Génération en cours : étape, code reçu en streaming, annulation
+        if st.session_state.job is not None:
+            show_job()
+    
     with col1:
         st.subheader("💭 Conversation")
         
@@ -667,8 +518,9 @@ def main():
         chat_html += '</div>'
         st.markdown(chat_html, unsafe_allow_html=True)
         
-        # Zone de saisie
-        user_input = st.chat_input("Décrivez le graphique que vous souhaitez créer ou les modifications à apporter...")
+        # Zone de saisie (une seule génération à la fois par session)
+        user_input = st.chat_input("Décrivez le graphique que vous souhaitez créer ou les modifications à apporter...",
+                                   disabled=st.session_state.job is not None)
         
         if user_input:
             if st.session_state.data_file is None:
@@ -680,69 +532,49 @@ def main():
                 # Ajouter le message utilisateur
                 st.session_state.messages.append({"role": "user", "content": user_input})
                 
-                # Générer le graphique (pipeline différente selon si c'est la première demande)
-                success, chart_path, report = generate_chart(
+                # Génération en arrière-plan : l'interface reste utilisable et suit sa progression
+                st.session_state.job = get_job_queue().submit(
+                    run_generation,
+                    get_runtime(),
                     st.session_state.llm,
                     user_input,
                     st.session_state.data_file,
                     st.session_state.is_first_request,
-                    st.session_state.generated_code
+                    st.session_state.generated_code,
+                    st.session_state.use_cache,
+                    st.session_state.workspace,
+                    st.session_state.data_sheet,
+                    st.secrets.get("STREAM_CODE", True)
                 )
                 
-                if success:
-                    st.session_state.current_chart = chart_path
-                    # Sauvegarder le code généré
-                    if "clean_code" in report:
-                        st.session_state.generated_code = report["clean_code"]
-                        # Afficher automatiquement l'éditeur de code après une génération réussie
-                        st.session_state.show_code_editor = True
-                    
-                    # Marquer qu'on a fait au moins une requête
-                    if st.session_state.is_first_request:
-                        st.session_state.is_first_request = False
-                    
-                    # Message différent selon le type de pipeline
-                    pipeline_type = report.get("pipeline", "initial")
-                    if pipeline_type == "initial":
-                        message = "✓ Graphique généré avec succès"
-                    else:
-                        message = "✓ Graphique modifié avec succès"
-                    
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": message
-                    })
-                else:
-                    error_msg = "✗ Erreur lors de la génération du graphique"
-                    if "error" in report:
-                        error_msg += f"\n\nDétails: {report['error']}"
-                    elif "log_debug" in report:
-                        error_msg += f"\n\nErreur après débogage: {report['log_debug']}"
-                    elif "log" in report:
-                        error_msg += f"\n\nErreur: {report['log']}"
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": error_msg
-                    })
-                
                 st.rerun()
     
     with col2:
-        st.subheader("📈 Graphique")
+        if st.session_state.show_metrics and st.session_state.last_metrics:
+            with st.expander("🔬 Mesures du dernier tour"):
+                show_metrics(st.session_state.last_metrics)
         
-        if st.session_state.current_chart and os.path.exists(st.session_state.current_chart):
+        if st.session_state.current_chart:
             # Afficher le graphique
             st.image(st.session_state.current_chart, width="stretch")
             
+            # Prévenir l'utilisateur quand le graphique n'affiche pas tous les points
+            if st.session_state.decimation:
+                dec = st.session_state.decimation
+                st.caption(f"⚠ Affichage réduit ({dec['method'].upper()}) : {dec['points_out']:,} points tracés "
+                           f"sur {dec['points_in']:,} ({dec['ratio']:.2%})".replace(",", " "))
+            
             # Boutons d'actions
             col_btn1, col_btn2, col_btn3 = st.columns(3)
             
             with col_btn1:
-                # Bouton de téléchargement
-                with open(st.session_state.current_chart, "rb") as file:
+                # Export pleine qualité (l'image affichée est un aperçu)
+                if st.session_state.chart_code:
+                    show_exports()
+                else:
                     st.download_button(
                         label="⬇ Télécharger",
-                        data=file,
+                        data=st.session_state.current_chart,
                         file_name="graphique.png",
                         mime="image/png"
                     )
@@ -757,7 +589,7 @@ def main():
             
             with col_btn3:
                 # Bouton retour (actif seulement s'il y a un historique)
-                if len(st.session_state.history) > 0:
+                if len(st.session_state.history) > 0 and st.session_state.job is None:
                     if st.button("← Retour", help=f"Revenir à l'état précédent ({len(st.session_state.history)} version(s))"):
                         if restore_previous_state():
                             st.success("✓ État précédent restauré")
@@ -794,35 +626,25 @@ def main():
                 col_exec1, col_exec2 = st.columns(2)
                 
                 with col_exec1:
-                    if st.button("▶ Exécuter", type="primary"):
+                    # Désactivé pendant une génération : son résultat écraserait celui de l'exécution
+                    if st.button("▶ Exécuter", type="primary", disabled=st.session_state.job is not None):
                         if edited_code.strip():
                             with st.spinner("⚡ Exécution en cours..."):
-                                # Ajouter la configuration matplotlib
-                                code_to_run = """import matplotlib
-matplotlib.use('Agg')
-""" + edited_code
-                                
-                                # Créer un fichier temporaire
-                                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, dir=os.getcwd()) as f:
-                                    f.write(code_to_run)
-                                    temp_code_file = f.name
-                                
-                                # Exécuter
-                                log = run_script(temp_code_file)
-                                
-                                # Nettoyer
-                                try:
-                                    os.remove(temp_code_file)
-                                except:
-                                    pass
+                                data, decimation, columns = session_data()
+                                runtime = get_runtime()
+                                result = execute_code(edited_code, st.session_state.workspace, runtime.pool, runtime.limits, data, decimation, columns,
+                                                      cache=runtime.render_cache, render=runtime.preview_options())
+                                log, figure = result["log"], result["figure"]
                                 
                             # Vérifier le résultat
                             if log:
                                 st.error(f"✗ Erreur lors de l'exécution:\n```\n{log}\n```")
                             else:
                                 # Vérifier si le graphique a été généré
-                                if os.path.exists("graphique.png"):
-                                    st.session_state.current_chart = os.path.join(os.getcwd(), "graphique.png")
+                                if figure is not None:
+                                    st.session_state.current_chart = figure
+                                    st.session_state.chart_code = result["code"]
+                                    st.session_state.decimation = result["decimation"]
                                     st.success("✓ Code exécuté avec succès")
                                     st.rerun()
                                 else:
@@ -838,6 +660,7 @@ matplotlib.use('Agg')
                 # Informations utiles
                 st.info("Conseils :\n"
                        "- Modifiez le code directement dans la zone ci-dessus\n"
+                       "- Les données sont disponibles dans le DataFrame `df`\n"
                        "- Le graphique doit être sauvegardé avec `plt.savefig('graphique.png')`\n"
                        "- Cliquez sur 'Exécuter' pour regénérer le graphique")
         else:
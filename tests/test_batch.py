@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from ICG_batch import load_manifest, load_settings, summarize
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_jsonl_manifest(tmp_path):
+    manifest = write(tmp_path / "taches.jsonl", "\n".join([
+        json.dumps({"data": "mesures.csv", "prompt": "Courbe de v"}),
+        "",
+        json.dumps({"id": "classeur", "data": "donnees/essai.xlsx", "sheet": "Feuil2", "prompt": "Barres",
+                    "modifications": ["En rouge"]}),
+    ]) + "\n")
+    first, second = load_manifest(manifest)
+    # Chemins relatifs au dossier du manifeste, identifiant déduit du rang et du nom du fichier
+    assert first["data"] == os.path.join(str(tmp_path), "mesures.csv")
+    assert first["id"] == "0001_mesures"
+    assert first["sheet"] is None and first["modifications"] == []
+    assert second["id"] == "classeur" and second["sheet"] == "Feuil2"
+    assert second["data"] == os.path.join(str(tmp_path), "donnees/essai.xlsx")
+    assert second["modifications"] == ["En rouge"]
+
+
+def test_csv_manifest(tmp_path):
+    manifest = write(tmp_path / "taches.csv", "data,prompt,sheet\nmesures.csv,Courbe de v,\n")
+    [job] = load_manifest(manifest)
+    assert job["id"] == "0001_mesures" and job["prompt"] == "Courbe de v"
+    assert job["sheet"] is None
+
+
+def test_missing_prompt_is_rejected(tmp_path):
+    manifest = write(tmp_path / "taches.jsonl", json.dumps({"data": "mesures.csv"}) + "\n")
+    with pytest.raises(ValueError, match="Tâche 1"):
+        load_manifest(manifest)
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    manifest = write(tmp_path / "taches.jsonl", "\n".join(
+        json.dumps({"id": "a", "data": "mesures.csv", "prompt": p}) for p in ("x", "y")) + "\n")
+    with pytest.raises(ValueError, match="en double"):
+        load_manifest(manifest)
+
+
+def test_environment_overrides_settings(tmp_path, monkeypatch):
+    config = write(tmp_path / "secrets.toml", 'OPENAI_API_KEY = "fichier"\nLLM_MODEL = "m"\n')
+    monkeypatch.setenv("OPENAI_API_KEY", "env")
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    assert load_settings(config) == {"OPENAI_API_KEY": "env", "LLM_MODEL": "m"}
+
+
+def test_summary_counts_failures_by_category():
+    results = [
+        {"success": True, "category": None, "duration_s": 2.0, "llm_calls": 3},
+        {"success": False, "category": "timeout", "duration_s": 4.0, "llm_calls": 5},
+        {"success": False, "category": "timeout", "duration_s": 6.0, "llm_calls": 1},
+    ]
+    stats = summarize(results, 60.0)
+    assert (stats["jobs"], stats["succeeded"], stats["failed"]) == (3, 1, 2)
+    assert stats["failures"] == {"timeout": 2}
+    assert stats["charts_per_minute"] == 1.0
+    assert stats["latency_p50_s"] == 4.0 and stats["llm_calls"] == 9
@@ -0,0 +1,33 @@
+import ICG_cache
+from ICG_cache import render_key
+
+CODE = "import matplotlib.pyplot as plt\nplt.plot(df['t'], df['v'])\nplt.savefig('graphique.png')\nplt.close()\n"
+DATA = "/tmp/gag_data/abc123.pkl"
+
+
+def test_equivalent_code_shares_a_key():
+    reformatted = ("import matplotlib.pyplot as plt\n\n# Courbe\nplt.plot( df[\"t\"],  df[\"v\"] )\n"
+                   "plt.savefig('graphique.png')  # Enregistrement\nplt.close()\n")
+    assert render_key(reformatted, DATA, None) == render_key(CODE, DATA, None)
+
+
+def test_data_location_does_not_change_the_key():
+    # Le pickle est nommé par empreinte du fichier : seul son nom identifie les données
+    assert render_key(CODE, "/autre/dossier/abc123.pkl", None) == render_key(CODE, DATA, None)
+
+
+def test_dataset_digest_changes_the_key():
+    assert render_key(CODE, "/tmp/gag_data/def456.pkl", None) != render_key(CODE, DATA, None)
+
+
+def test_options_change_the_key():
+    key = render_key(CODE, DATA, None)
+    assert render_key(CODE, DATA, {"threshold": 200_000, "n_out": 4000, "method": "lttb"}) != key
+    assert render_key(CODE, DATA, None, {"max_dpi": 100, "max_kb": 300}) != key
+
+
+def test_library_versions_change_the_key(monkeypatch):
+    key = render_key(CODE, DATA, None)
+    versions = ICG_cache.library_versions()
+    monkeypatch.setattr(ICG_cache, "library_versions", lambda: {**versions, "matplotlib": "0.0.1"})
+    assert render_key(CODE, DATA, None) != key
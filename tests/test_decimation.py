@@ -0,0 +1,64 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from ICG_decimation import install, lttb_indices, minmax_indices
+
+OPTIONS = {"threshold": 1000, "n_out": 200, "method": "lttb"}
+
+
+@pytest.fixture
+def decimation():
+    stats, uninstall = install(OPTIONS)
+    yield stats
+    uninstall()
+    plt.close("all")
+
+
+def test_indices_keep_ends_and_peaks():
+    y = np.zeros(10_000)
+    y[1234] = 50.0
+    for indices in (lttb_indices(np.arange(len(y)), y, 100), minmax_indices(y, 100)):
+        assert indices[0] == 0 and indices[-1] == len(y) - 1
+        assert 1234 in indices
+        assert len(indices) <= 102
+
+
+def test_series_with_datetime_index_keeps_dates(decimation):
+    index = pd.date_range("2024-01-01", periods=20_000, freq="min")
+    series = pd.Series(np.sin(np.arange(20_000) / 500), index=index)
+    fig, ax = plt.subplots()
+    (line,) = ax.plot(series)
+    assert decimation["calls"] == 1
+    assert len(line.get_xdata()) <= OPTIONS["n_out"]
+    # Limites en dates (marges comprises), pas en positions entières
+    low, high = (pd.Timestamp(d).tz_localize(None) for d in matplotlib.dates.num2date(ax.get_xlim()))
+    assert index[0] - pd.Timedelta(days=2) < low < index[0]
+    assert index[-1] < high < index[-1] + pd.Timedelta(days=2)
+    assert pd.Timestamp(line.get_xdata()[-1]) == index[-1]
+
+
+def test_series_with_numeric_index(decimation):
+    series = pd.Series(np.arange(5000.0), index=np.arange(5000) * 10 + 100)
+    fig, ax = plt.subplots()
+    (line,) = ax.plot(series)
+    x = np.asarray(line.get_xdata())
+    assert x[0] == 100 and x[-1] == 50_090
+
+
+def test_plain_array_keeps_positions(decimation):
+    fig, ax = plt.subplots()
+    (line,) = ax.plot(np.random.default_rng(0).normal(size=5000))
+    x = np.asarray(line.get_xdata())
+    assert x[0] == 0 and x[-1] == 4999
+
+
+def test_short_series_untouched(decimation):
+    fig, ax = plt.subplots()
+    (line,) = ax.plot(pd.Series(np.arange(10.0)))
+    assert len(line.get_xdata()) == 10 and decimation["calls"] == 0
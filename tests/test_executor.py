@@ -0,0 +1,66 @@
+import pytest
+
+from ICG_executor import DEFAULT_LIMITS, ERROR_MESSAGES, WorkerPool, error_signature, execute_code
+
+FAILING = """import matplotlib.pyplot as plt
+plt.plot([1, 2])
+valeurs = {'a': 1}
+print(valeurs['b'])
+plt.savefig('graphique.png')
+plt.close()
+"""
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = WorkerPool(size=1)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("mode", ["pool", "cold"])
+def test_traceback_lines_match_the_script(tmp_path, pool, mode):
+    result = execute_code(FAILING, str(tmp_path), pool if mode == "pool" else None)
+    assert result["usage"]["mode"] == mode
+    assert result["error"] == "exception"
+    assert '<script>.py", line 4' in result["log"]
+    assert error_signature(result["log"]) == ("KeyError", 4)
+
+
+def test_success_produces_figure(tmp_path, pool):
+    code = "import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.savefig('graphique.png')\nplt.close()\n"
+    for runner in (pool, None):
+        result = execute_code(code, str(tmp_path), runner)
+        assert result["error"] is None
+        assert result["figure"].startswith(b"\x89PNG")
+
+
+LIMITS = {"timeout": 2, "cpu_seconds": 2}
+BUSY = "import matplotlib.pyplot as plt\nwhile True:\n    pass\nplt.savefig('graphique.png')\nplt.close()\n"
+SLEEPY = "import time\nimport matplotlib.pyplot as plt\ntime.sleep(30)\nplt.savefig('graphique.png')\nplt.close()\n"
+EXITING = "import sys\nimport matplotlib.pyplot as plt\nsys.exit(3)\nplt.savefig('graphique.png')\nplt.close()\n"
+
+
+@pytest.fixture(scope="module")
+def limited_pool():
+    pool = WorkerPool(size=1, limits=LIMITS)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("code, expected", [(BUSY, "cpu"), (SLEEPY, "timeout"), (EXITING, "exception")])
+@pytest.mark.parametrize("mode", ["cold", "pool"])
+def test_error_categories_match_between_modes(tmp_path, request, mode, code, expected):
+    # Exécutions à froid d'abord, pool démarré ensuite : les imports d'un worker (au démarrage
+    # ou au remplacement après un dépassement) prendraient du CPU au script à froid
+    pool = request.getfixturevalue("limited_pool") if mode == "pool" else None
+    result = execute_code(code, str(tmp_path), pool, LIMITS)
+    assert result["usage"]["mode"] == mode
+    assert result["error"] == expected
+    if expected == "exception":
+        assert "SystemExit: 3" in result["log"]
+        assert "LIMITE DÉPASSÉE" not in result["log"]
+    else:
+        # Un seul message de limite, celui de la catégorie retenue
+        assert result["log"].count("LIMITE DÉPASSÉE") == 1
+        assert result["log"].strip() == ERROR_MESSAGES[expected].format(**{**DEFAULT_LIMITS, **LIMITS})
@@ -0,0 +1,54 @@
+from ICG_history import History
+
+CHART_A = b"\x89PNG" + b"a" * 996
+CHART_B = b"\x89PNG" + b"b" * 996
+
+
+def test_identical_charts_are_stored_once():
+    history = History()
+    history.push("code 1", CHART_A, None, 2)
+    history.push("code 2", CHART_A, None, 4)
+    assert history.bytes == len(CHART_A) + len("code 1") + len("code 2")
+
+    state = history.pop()
+    assert state == {"code": "code 2", "chart": CHART_A, "decimation": None, "messages": 4}
+    # Le graphique reste utilisé par le premier état
+    assert history.bytes == len(CHART_A) + len("code 1")
+    assert history.pop()["chart"] == CHART_A
+    assert history.bytes == 0 and len(history) == 0
+
+
+def test_oldest_states_are_evicted_beyond_the_budget():
+    history = History(max_bytes=2500)
+    history.push("a", CHART_A, None, 1)
+    history.push("b", CHART_B, None, 2)
+    assert len(history) == 2
+    history.push("c", b"\x89PNG" + b"c" * 996, None, 3)
+    assert len(history) == 2 and history.bytes <= 2500
+    assert [history.pop()["code"], history.pop()["code"]] == ["c", "b"]
+
+
+def test_shared_chart_survives_eviction_of_an_older_state():
+    history = History(max_bytes=1080)
+    history.push("a" * 50, CHART_A, None, 1)
+    history.push("b" * 50, CHART_A, None, 2)
+    # Le premier état est oublié, son graphique reste gardé pour le second
+    assert len(history) == 1
+    assert history.bytes == len(CHART_A) + 50
+    assert history.pop()["chart"] == CHART_A
+
+
+def test_latest_state_is_kept_even_over_budget():
+    history = History(max_bytes=100)
+    history.push("a", CHART_A, None, 1)
+    history.push("b", CHART_B, None, 2)
+    assert len(history) == 1
+    assert history.pop()["code"] == "b"
+
+
+def test_clear_resets_the_size():
+    history = History()
+    history.push("a", CHART_A, None, 1)
+    history.push("b", None, None, 2)
+    history.clear()
+    assert len(history) == 0 and history.bytes == 0
@@ -0,0 +1,52 @@
+import json
+import time
+
+from ICG_metrics import MetricsExporter, record_execution, record_llm_call, stage, summarize_turn
+
+
+def make_turn(success=True):
+    report = {"pipeline": "initial", "debug_attempts": [] if success else [{}]}
+    with stage(report, "codeur"):
+        record_llm_call(report, "codeur", time.time(), "contexte" * 10, "code" * 5, usage=(120, 30), model="m")
+        record_llm_call(report, "verificateur", time.time(), "contexte", "ok", cached=True)
+    record_execution(report, time.time(), {"usage": {"mode": "pool", "wall_s": 0.5, "cpu_s": 0.25},
+                                           "error": None if success else "exception"})
+    if not success:
+        report["error_category"] = "exception"
+    return summarize_turn(report, success)
+
+
+def test_summary_ignores_cached_calls():
+    turn = make_turn()
+    assert turn["llm_calls"] == 1 and len(turn["llm"]) == 2
+    assert (turn["prompt_tokens"], turn["completion_tokens"]) == (120, 30)
+    assert turn["exec_s"] == 0.5 and turn["exec_cpu_s"] == 0.25
+    assert [s["stage"] for s in turn["stages"]] == ["codeur"]
+    assert turn["error_category"] is None
+
+
+def test_jsonl_gets_one_line_per_turn(tmp_path):
+    path = tmp_path / "mesures" / "tours.jsonl"
+    exporter = MetricsExporter(jsonl_path=str(path))
+    exporter.record(make_turn())
+    exporter.record(make_turn(success=False))
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [t["success"] for t in lines] == [True, False]
+    assert lines[1]["error_category"] == "exception" and lines[1]["debug_attempts"] == 1
+
+
+def test_prometheus_counters_accumulate(tmp_path):
+    path = tmp_path / "gag.prom"
+    exporter = MetricsExporter(prometheus_path=str(path))
+    exporter.record(make_turn())
+    exporter.record(make_turn(success=False))
+    text = path.read_text(encoding="utf-8")
+    assert "# TYPE gag_turns_total counter" in text
+    assert 'gag_turns_total{pipeline="initial",success="true"} 1' in text
+    assert 'gag_turns_total{pipeline="initial",success="false"} 1' in text
+    assert 'gag_llm_tokens_total{agent="codeur",kind="prompt"} 240' in text
+    assert 'gag_llm_calls_total{agent="verificateur",cached="true"} 2' in text
+    assert 'gag_exec_seconds_count{mode="pool"} 2' in text
+    assert "gag_debug_attempts_total 1" in text
+    # Écriture atomique : pas de fichier temporaire laissé à côté
+    assert [p.name for p in tmp_path.iterdir()] == ["gag.prom"]
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from ICG_cache import DiskCache
+from ICG_models import ModelTiers
+from ICG_pipeline import ainvoke_agent, invoke_agent, stream_agent
+
+
+class FakeModel:
+    """Modèle de test : le niveau "lent" dépasse toujours son budget"""
+
+    def __init__(self, config):
+        self.model_name = config["model"]
+        self.temperature = config["temperature"]
+        self.calls = 0
+
+    def _answer(self):
+        self.calls += 1
+        if self.model_name == "lent":
+            raise TimeoutError("délai du client dépassé")
+        return f"```python\nx = '{self.model_name}'\n```"
+
+    def invoke(self, input):
+        return AIMessage(content=self._answer())
+
+    async def ainvoke(self, input):
+        return AIMessage(content=self._answer())
+
+    def stream(self, input):
+        yield AIMessageChunk(content=self._answer())
+
+
+def make_tiers(primary="lent"):
+    return ModelTiers({"api_key": "k", "model": "defaut", "temperature": 0.7},
+                      {"codeur": {"model": primary, "budget_s": 1, "fallback": "rapide"}},
+                      {"rapide": {"model": "vite"}}, build=FakeModel)
+
+
+def test_tiers_follow_fallback_chain():
+    tiers = make_tiers()
+    assert [(m.model_name, b) for m, b in tiers.tiers("codeur")] == [("lent", 1.0), ("vite", None)]
+    assert [(m.model_name, b) for m, b in tiers.tiers("debugger")] == [("defaut", None)]
+
+
+@pytest.mark.parametrize("agents", [{"inconnu": {}}, {"codeur": {"modele": "x"}}, {"codeur": {"fallback": "absent"}}])
+def test_invalid_configuration(agents):
+    with pytest.raises(ValueError):
+        ModelTiers({}, agents)
+
+
+@pytest.mark.parametrize("call", ["invoke", "ainvoke", "stream"])
+def test_fallback_answer_is_not_cached(tmp_path, call):
+    cache = DiskCache(str(tmp_path))
+    tiers = make_tiers()
+    report = {}
+
+    def run():
+        if call == "invoke":
+            return invoke_agent(tiers, "codeur", "q", report, cache)
+        if call == "ainvoke":
+            return asyncio.run(ainvoke_agent(tiers, "codeur", "q", report, cache))
+        return stream_agent(tiers, "codeur", "q", report, cache, on_code=lambda code: None)
+
+    assert "vite" in run()
+    assert report["fallbacks"] == {"codeur": 1}
+    # Nouvel essai : le modèle principal est rappelé, pas la réponse de repli resservie
+    assert "vite" in run()
+    assert report["cache"]["codeur"] == "miss"
+    assert tiers.tiers("codeur")[0][0].calls == 2
+
+
+def test_primary_answer_is_cached(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    tiers = make_tiers(primary="principal")
+    report = {}
+    assert "principal" in invoke_agent(tiers, "codeur", "q", report, cache)
+    assert "principal" in invoke_agent(tiers, "codeur", "q", report, cache)
+    assert report["cache"]["codeur"] == "hit"
+    assert tiers.tiers("codeur")[0][0].calls == 1
@@ -0,0 +1,115 @@
+import pytest
+
+from ICG_bench import SCRIPT_CODE, ScriptedLLM, make_dataset
+from ICG_cache import DiskCache
+from ICG_patch import PatchError, apply_patch, parse_patch
+from ICG_pipeline import Runtime, generate_chart, modify_by_patch
+
+CODE = """import matplotlib.pyplot as plt
+fig, ax = plt.subplots()
+ax.plot(df['t'], df['x'])
+ax.set_title('Avant')
+plt.savefig('graphique.png')
+plt.close()
+"""
+
+
+def block(old, new):
+    return f"<<<<<<< AVANT\n{old}\n=======\n{new}\n>>>>>>> APRÈS\n"
+
+
+#################################### Lecture et application ####################################
+def test_exact_block():
+    patched = apply_patch(CODE, block("ax.set_title('Avant')", "ax.set_title('Après')"))
+    assert patched == CODE.replace("Avant", "Après")
+
+
+def test_several_blocks_in_order():
+    text = block("ax.plot(df['t'], df['x'])", "ax.plot(df['t'], df['x'], color='red')") + \
+        "Puis :\n" + block("ax.set_title('Avant')", "ax.set_title('Après')\nax.grid(True)")
+    patched = apply_patch(CODE, text)
+    assert "color='red'" in patched and "ax.set_title('Après')\nax.grid(True)\n" in patched
+
+
+def test_whitespace_tolerant_match():
+    # Espaces en fin de ligne et lignes vides en bordure de bloc, fréquents dans les réponses
+    code = CODE.replace("ax.set_title('Avant')", "ax.set_title('Avant')   ")
+    text = "<<<<<<< AVANT\n\nax.set_title('Avant')\n\n=======\nax.set_title('Après')\n\n>>>>>>> APRÈS\n"
+    assert "ax.set_title('Après')\n" in apply_patch(code, text)
+
+
+def test_unified_diff():
+    text = "```diff\n@@ -3,2 +3,2 @@\n ax.plot(df['t'], df['x'])\n-ax.set_title('Avant')\n+ax.set_title('Après')\n```\n"
+    assert apply_patch(CODE, text) == CODE.replace("Avant", "Après")
+
+
+@pytest.mark.parametrize("text, message", [
+    (block("ax.set_title('Autre')", "ax.set_title('Après')"), "introuvables"),
+    ("Voici le code modifié.", "aucune modification"),
+    (block("", "ax.grid(True)"), "aucune ligne"),
+    (block("ax.set_title('Avant')", "ax.set_title('Avant')"), "ne change pas"),
+    (block("ax.set_title('Avant')", "ax.set_title('Après'"), "invalide"),
+])
+def test_rejected_patches(text, message):
+    with pytest.raises(PatchError, match=message):
+        apply_patch(CODE, text)
+
+
+def test_ambiguous_block():
+    code = CODE + "plt.close()\n"
+    with pytest.raises(PatchError, match="présentes 2 fois"):
+        apply_patch(code, block("plt.close()", "plt.close('all')"))
+
+
+def test_parse_patch_trims_blank_lines():
+    assert parse_patch(block("\nax.grid()\n", "ax.grid(True)\n")) == [(["ax.grid()"], ["ax.grid(True)"])]
+
+
+#################################### Repli sur la régénération complète ####################################
+class FakeLLM:
+    model_name = "faux"
+    temperature = 0.0
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def invoke(self, input):
+        from langchain_core.messages import AIMessage
+        return AIMessage(content=self.answer)
+
+
+def test_failed_patch_is_not_cached(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    report = {}
+    bad = block("ax.set_title('Autre')", "ax.set_title('Après')")
+    assert modify_by_patch(FakeLLM(bad), "titre", CODE, "t, x", report, cache) is None
+    assert "introuvables" in report["patch_error"]
+    assert cache.get(report["cache_keys"][-1]) is None
+
+
+class MissingBlockLLM(ScriptedLLM):
+    """Le correctif cite une ligne absente du code : la pipeline doit régénérer le script complet"""
+
+    def _answer(self, agent_input):
+        answer = super()._answer(agent_input)
+        return answer.replace("ax.legend()", "ax.legend(frameon=True)") if "<<<<<<<" in answer else answer
+
+
+def test_full_regeneration_when_patch_does_not_apply(tmp_path):
+    runtime = Runtime({"LOCAL_EDITS": False, "STREAM_CODE": False})
+    data = make_dataset(str(tmp_path), 100)
+    prompt = "ajoute une moyenne mobile sur 10 points"
+    success, chart, report = generate_chart(runtime, MissingBlockLLM(), prompt, data, False, SCRIPT_CODE,
+                                            use_cache=False, workdir=str(tmp_path))
+    assert success and chart is not None
+    assert "patch_error" in report
+    assert report["modification_mode"] == "full"
+
+
+def test_patch_mode_applies_locally(tmp_path):
+    runtime = Runtime({"LOCAL_EDITS": False, "STREAM_CODE": False})
+    data = make_dataset(str(tmp_path), 100)
+    success, chart, report = generate_chart(runtime, ScriptedLLM(), "déplace la légende en haut à gauche", data,
+                                            False, SCRIPT_CODE, use_cache=False, workdir=str(tmp_path))
+    assert success and report["modification_mode"] == "patch"
+    assert "ax.legend(loc='upper left')" in report["clean_code"]
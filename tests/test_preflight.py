@@ -0,0 +1,102 @@
+from ICG_preflight import preflight
+
+COLUMNS = ["t", "v", "Température"]
+
+
+def test_plot_style_is_not_a_column():
+    code = "import matplotlib.pyplot as plt\ndf.plot(x='t', y='v', style='-o')\nplt.savefig('graphique.png')\nplt.close()\n"
+    result = preflight(code, COLUMNS)
+    assert result["log"] is None
+    assert result["code"] == code
+
+
+def test_plot_columns_are_checked():
+    code = "import matplotlib.pyplot as plt\ndf.plot(x='t', y='w')\nplt.savefig('graphique.png')\nplt.close()\n"
+    assert "KeyError: 'w'" in preflight(code, COLUMNS)["log"]
+
+
+def test_seaborn_keywords_are_checked_with_data_df():
+    code = ("import matplotlib.pyplot as plt\nimport seaborn as sns\n"
+            "sns.lineplot(data=df, x='t', y='v', style='groupe')\nplt.savefig('graphique.png')\nplt.close()\n")
+    assert "KeyError: 'groupe'" in preflight(code, COLUMNS)["log"]
+
+
+def test_secondary_saves_are_kept():
+    code = ("import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.savefig('brouillon.pdf')\n"
+            "plt.savefig('graphique.png')\nplt.close()\n")
+    result = preflight(code, COLUMNS)
+    assert result["code"] == code and result["fixes"] == []
+
+
+def test_last_save_is_redirected_without_expected_output():
+    code = ("import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.savefig('etape.png')\n"
+            "plt.title('Fin')\nplt.savefig('resultat.png')\nplt.close()\n")
+    fixed = preflight(code, COLUMNS)["code"]
+    assert "plt.savefig('etape.png')" in fixed
+    assert "plt.savefig('graphique.png')" in fixed and "resultat.png" not in fixed
+
+
+def test_save_through_variable_is_not_redirected():
+    code = ("import matplotlib.pyplot as plt\nsortie = 'graphique.png'\nplt.plot([1, 2])\n"
+            "plt.savefig('copie.png')\nplt.savefig(sortie)\nplt.close()\n")
+    assert preflight(code, COLUMNS)["code"] == code
+
+
+def test_column_case_and_spaces_are_fixed():
+    code = "import matplotlib.pyplot as plt\nplt.plot(df['T'], df['température '])\nplt.savefig('graphique.png')\nplt.close()\n"
+    result = preflight(code, COLUMNS)
+    assert "plt.plot(df['t'], df['Température'])" in result["code"]
+    assert len(result["fixes"]) == 2 and result["log"] is None
+
+
+def test_unknown_column_is_reported_with_line():
+    code = "import matplotlib.pyplot as plt\n\nplt.plot(df['vitesse'])\nplt.savefig('graphique.png')\nplt.close()\n"
+    log = preflight(code, COLUMNS)["log"]
+    assert 'line 3' in log and "KeyError: 'vitesse'" in log
+
+
+def test_created_and_renamed_columns_are_not_checked():
+    created = "df['ratio'] = df['v'] / 2\ndf['ratio'].plot()\n"
+    renamed = "df = df.rename(columns={'v': 'vitesse'})\ndf['vitesse'].plot()\n"
+    for body in (created, renamed):
+        code = "import matplotlib.pyplot as plt\n" + body + "plt.savefig('graphique.png')\nplt.close()\n"
+        assert preflight(code, COLUMNS)["log"] is None
+
+
+def test_syntax_error_short_circuits():
+    code = "import matplotlib.pyplot as plt\nplt.plot(df['T']\nplt.show()\n"
+    result = preflight(code, COLUMNS)
+    assert result["code"] == code and result["fixes"] == []
+    assert "SyntaxError" in result["log"]
+
+
+def test_show_removed_and_save_added():
+    code = "import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.show()\n"
+    result = preflight(code)
+    assert result["code"] == "import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.savefig('graphique.png')\nplt.close()\n"
+
+
+def test_show_alone_in_block_becomes_pass():
+    code = "import matplotlib.pyplot as plt\nplt.plot([1, 2])\nif True:\n    plt.show()\nplt.savefig('graphique.png')\nplt.close()\n"
+    fixed = preflight(code)["code"]
+    assert "if True:\n    pass\n" in fixed
+    compile(fixed, "<test>", "exec")
+
+
+def test_save_inserted_before_close():
+    code = "import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.close()\nprint('fin')\n"
+    fixed = preflight(code)["code"]
+    assert "plt.savefig('graphique.png')\nplt.close()\nprint('fin')\n" in fixed
+
+
+def test_close_inside_function_is_reported():
+    code = ("import matplotlib.pyplot as plt\n\ndef tracer():\n    plt.plot([1, 2])\n    plt.close()\n\n"
+            "tracer()\n")
+    result = preflight(code)
+    assert result["code"] == code and result["fixes"] == []
+    assert 'line 5\nErreur : la figure est fermée sans appel à plt.savefig' in result["log"]
+
+
+def test_script_without_pyplot_is_reported():
+    log = preflight("print(df.head())\n")["log"]
+    assert "aucun appel à plt.savefig('graphique.png')" in log
@@ -0,0 +1,94 @@
+import pytest
+
+from ICG_quickedit import quick_edit, recognize
+
+SCRIPT = """import matplotlib.pyplot as plt
+plt.plot(df['t'], df['v'])
+plt.title('Avant')
+plt.savefig('graphique.png')
+"""
+
+MAIN_SCRIPT = """import matplotlib.pyplot as plt
+
+def main():
+    plt.plot(df['t'], df['v'])
+    plt.savefig('graphique.png')
+
+main()
+"""
+
+
+#################################### Reconnaissance ####################################
+@pytest.mark.parametrize("prompt, expected", [
+    ("Mets la courbe en rouge", {"kind": "color", "color": "red"}),
+    ("change le titre en 'Ventes 2024' stp", {"kind": "title", "text": "Ventes 2024"}),
+    ("Change le titre : Ventes", {"kind": "title", "text": "Ventes"}),
+    ("modifie le libellé de l'axe x en \"Temps (s)\"", {"kind": "label", "axis": "x", "text": "Temps (s)"}),
+    ("limite l'axe y entre 0 et 2,5", {"kind": "limits", "axis": "y", "low": 0, "high": 2.5}),
+    ("ajoute une ligne verticale à 10", {"kind": "line", "axis": "x", "value": 10}),
+    ("passe l'axe y en échelle logarithmique", {"kind": "log", "axis": "y"}),
+    ("enlève la grille", {"kind": "grid", "visible": False}),
+])
+def test_recognize(prompt, expected):
+    assert recognize(prompt) == expected
+
+
+@pytest.mark.parametrize("prompt", [
+    "mets la courbe en turquoise",  # Couleur inconnue
+    "change le titre en Ventes",  # Texte sans guillemets ni ":"
+    "ajoute une régression linéaire",
+    "mets la courbe en rouge et ajoute une grille",
+])
+def test_recognize_rejects(prompt):
+    assert recognize(prompt) is None
+
+
+#################################### Réécriture ####################################
+def test_replaces_existing_setter():
+    result = quick_edit(SCRIPT, "change le titre en 'Après'")
+    assert "plt.title('Après')" in result["code"]
+    assert "Avant" not in result["code"]
+
+
+def test_recolors_single_plot():
+    result = quick_edit(SCRIPT, "mets la courbe en rouge")
+    assert "plt.plot(df['t'], df['v'], color='red')" in result["code"]
+
+
+def test_inserts_before_top_level_savefig():
+    code = quick_edit(SCRIPT, "ajoute une ligne horizontale à 3")["code"]
+    lines = code.splitlines()
+    assert lines.index("plt.axhline(3, color='gray', linestyle='--')") == lines.index("plt.savefig('graphique.png')") - 1
+
+
+def test_inserts_inside_function_making_the_figure():
+    code = quick_edit(MAIN_SCRIPT, "ajoute une grille")["code"]
+    assert "    plt.grid(True)\n    plt.savefig('graphique.png')" in code
+    compile(code, "<test>", "exec")
+
+
+@pytest.mark.parametrize("code", [
+    # Ajout au niveau du module : il s'exécuterait avant la création de la figure
+    "import matplotlib.pyplot as plt\n"
+    "if __name__ == '__main__':\n    plt.plot([1, 2])\n    plt.savefig('graphique.png')\n",
+    "import matplotlib.pyplot as plt\n"
+    "for i in range(2):\n    plt.plot([1, i])\n    plt.savefig(f'g{i}.png')\n",
+    "import matplotlib.pyplot as plt\n"
+    "def main(): plt.plot([1, 2]); plt.savefig('graphique.png')\n",
+])
+def test_no_insertion_outside_reachable_statement(code):
+    assert quick_edit(code, "ajoute une ligne verticale à 1") is None
+    assert quick_edit(code, "change le titre en 'T'") is None
+
+
+def test_refuses_ambiguous_code():
+    two_plots = SCRIPT.replace("plt.title('Avant')", "plt.plot(df['t'], df['w'])")
+    assert quick_edit(two_plots, "mets la courbe en rouge") is None
+    subplots = SCRIPT.replace("plt.plot(", "fig, axes = plt.subplots(2)\naxes[0].plot(")
+    assert quick_edit(subplots, "ajoute une grille") is None
+    dates = SCRIPT.replace("df['t']", "pd.to_datetime(df['t'])")
+    assert quick_edit(dates, "ajoute une ligne verticale à 3") is None
+
+
+def test_unrecognized_prompt_goes_to_model():
+    assert quick_edit(SCRIPT, "fais un camembert") is None